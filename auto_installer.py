@@ -2,20 +2,76 @@
 """
 Automatic dependency installer for ComfyUI PSD Tools
 This module handles automatic installation of required dependencies following ComfyUI best practices
+
+Dependencies are verified without importing them: importlib.util.find_spec
+locates each package and importlib.metadata reads its installed version.
+The result is cached against a fingerprint of the Python executable, the
+modification times of the site-packages directories and the requirement
+specs, so it is reused until a package is installed, removed or upgraded
+or the requirements change. A warm check only stats a few directories and
+reads one small JSON file.
 """
 
-import subprocess
-import sys
-import os
-import importlib
+import hashlib
+import importlib.util
 import json
-import time
-from typing import List, Tuple, Optional
+import os
+import re
+import site
+import sys
+from typing import List, Optional, Tuple
+
+# (version) comparison operators understood in requirement specs
+_SPEC_PATTERN = re.compile(r"^\s*([A-Za-z0-9_.\-]+)\s*(?:(==|!=|>=|<=|>|<)\s*([0-9][^\s,;]*))?\s*$")
+
+_OPERATORS = {
+    "==": lambda a, b: a == b,
+    "!=": lambda a, b: a != b,
+    ">=": lambda a, b: a >= b,
+    "<=": lambda a, b: a <= b,
+    ">": lambda a, b: a > b,
+    "<": lambda a, b: a < b,
+}
+
+
+def parse_version(version: str) -> Tuple[int, ...]:
+    """Returns the leading numeric release of a version string ("2.1.0+cu118" -> (2, 1, 0))."""
+    release = []
+    for part in version.split("."):
+        digits = re.match(r"\d+", part)
+        if digits is None:
+            break
+        release.append(int(digits.group()))
+        if digits.end() != len(part):
+            break
+    # Compare 1.9 and 1.9.0 as equal
+    while len(release) > 1 and release[-1] == 0:
+        release.pop()
+    return tuple(release)
+
+
+def requirement_satisfied(package_spec: str, installed_version: Optional[str]) -> bool:
+    """Checks an installed version against a spec such as "psd-tools>=1.9.0"."""
+    if installed_version is None:
+        return False
+    match = _SPEC_PATTERN.match(package_spec)
+    if match is None or match.group(2) is None:
+        return True
+    operator, required = match.group(2), match.group(3)
+    return _OPERATORS[operator](parse_version(installed_version), parse_version(required))
+
+
+def _site_directories() -> List[str]:
+    directories = list(site.getsitepackages()) if hasattr(site, "getsitepackages") else []
+    if site.ENABLE_USER_SITE:
+        directories.append(site.getusersitepackages())
+    return sorted(set(directory for directory in directories if os.path.isdir(directory)))
+
 
 class DependencyInstaller:
     """Handles automatic installation of dependencies following ComfyUI best practices"""
-    
-    def __init__(self):
+
+    def __init__(self, cache_file: Optional[str] = None):
         self.required_packages = [
             ("psd_tools", "psd-tools>=1.9.0", "--user"),
             ("PIL", "Pillow>=8.0.0", "--user"),
@@ -24,76 +80,102 @@ class DependencyInstaller:
         ]
         # Cache file should be in the same directory as this script
         script_dir = os.path.dirname(os.path.abspath(__file__))
-        self.cache_file = os.path.join(script_dir, ".deps_cache.json")
-    
+        self.cache_file = cache_file or os.path.join(script_dir, ".deps_cache.json")
+
+    def environment_fingerprint(self) -> str:
+        """Fingerprint of the interpreter, its site-packages directories and the requirements"""
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(f"{sys.executable}\0{sys.version}\0".encode())
+        for directory in _site_directories():
+            digest.update(f"{directory}\0{os.stat(directory).st_mtime_ns}\0".encode())
+        for package_name, package_spec, _ in self.required_packages:
+            digest.update(f"{package_name}\0{package_spec}\0".encode())
+        return digest.hexdigest()
+
     def load_cache(self) -> dict:
-        """Load installation cache"""
+        """Load the cached check result"""
         try:
-            if os.path.exists(self.cache_file):
-                with open(self.cache_file, 'r') as f:
-                    return json.load(f)
-        except Exception:
-            pass
-        return {}
-    
+            with open(self.cache_file, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
     def save_cache(self, cache_data: dict):
-        """Save installation cache"""
+        """Save the check result"""
         try:
             with open(self.cache_file, 'w') as f:
                 json.dump(cache_data, f, indent=2)
-        except Exception:
+        except OSError:
             pass
-    
-    def is_package_installed(self, package_name: str) -> bool:
-        """Check if a package is already installed"""
+
+    def installed_version(self, package_name: str, package_spec: str) -> Optional[str]:
+        """Version of an installed package, or None if it is missing; the package is never imported"""
+        if importlib.util.find_spec(package_name) is None:
+            return None
+        from importlib import metadata
+        match = _SPEC_PATTERN.match(package_spec)
+        distribution = match.group(1) if match else package_name
         try:
-            importlib.import_module(package_name)
-            return True
-        except ImportError:
+            return metadata.version(distribution)
+        except metadata.PackageNotFoundError:
+            # Importable without distribution metadata (e.g. a source checkout); assume it fits
+            return ""
+
+    def is_package_installed(self, package_name: str, package_spec: Optional[str] = None) -> bool:
+        """Check if a package is installed (and satisfies its spec, if given) without importing it"""
+        version = self.installed_version(package_name, package_spec or package_name)
+        if version is None:
             return False
-        except Exception:
-            # If there are other errors (like numpy compatibility warnings), 
-            # consider the package available since it imported
-            return True
-    
-    def is_package_cached(self, package_name: str) -> bool:
-        """Check if package installation is cached"""
-        cache = self.load_cache()
-        if package_name in cache:
-            # Check if cache is recent (within 24 hours)
-            cache_time = cache[package_name].get('timestamp', 0)
-            current_time = time.time()
-            if current_time - cache_time < 86400:  # 24 hours
-                return cache[package_name].get('installed', False)
-        return False
-    
-    def cache_package_status(self, package_name: str, installed: bool):
-        """Cache package installation status"""
-        cache = self.load_cache()
-        cache[package_name] = {
-            'installed': installed,
-            'timestamp': time.time()
-        }
-        self.save_cache(cache)
-    
-    def install_package(self, package_name: str, package_spec: str, flags: Optional[str] = None) -> bool:
+        return version == "" or package_spec is None or requirement_satisfied(package_spec, version)
+
+    def check_dependencies(self, use_cache: bool = True) -> List[Tuple[str, str, Optional[str]]]:
+        """
+        Returns the required packages that are missing or too old.
+
+        The result is reused while the environment fingerprint is unchanged.
+        """
+        fingerprint = self.environment_fingerprint()
+        if use_cache:
+            cache = self.load_cache()
+            if cache.get("fingerprint") == fingerprint and isinstance(cache.get("missing"), list):
+                return [package for package in self.required_packages if package[1] in cache["missing"]]
+
+        importlib.invalidate_caches()
+        missing = [package for package in self.required_packages
+                   if not self.is_package_installed(package[0], package[1])]
+        self.save_cache({"fingerprint": fingerprint, "missing": [package[1] for package in missing]})
+        return missing
+
+    def pip_command(self, package_spec: str, flags: Optional[str] = None,
+                    force_reinstall: bool = False) -> List[str]:
+        """The pip command installing one package"""
+        cmd = [sys.executable, "-m", "pip", "install"]
+        if flags:
+            cmd.extend(flags.split())
+        if force_reinstall:
+            cmd.append("--force-reinstall")
+        cmd.append(package_spec)
+        return cmd
+
+    def install_package(self, package_name: str, package_spec: str, flags: Optional[str] = None,
+                        force_reinstall: bool = False) -> bool:
         """Install a single package using ComfyUI best practices"""
+        import subprocess
         try:
-            cmd = [sys.executable, "-m", "pip", "install"]
-            if flags:
-                cmd.extend(flags.split())
-            cmd.append(package_spec)
-            
-            print(f"[INFO] Installing {package_spec}...")
+            cmd = self.pip_command(package_spec, flags, force_reinstall)
+            print(f"[INFO] {'Reinstalling' if force_reinstall else 'Installing'} {package_spec}...")
             result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
-            
+
             if result.returncode == 0:
-                # Verify installation by trying to import
+                # Verify the installation (new user site directories must be picked up first)
+                importlib.invalidate_caches()
+                if site.ENABLE_USER_SITE and os.path.isdir(site.getusersitepackages()):
+                    site.addsitedir(site.getusersitepackages())
                 if self.is_package_installed(package_name):
                     print(f"[SUCCESS] Successfully installed {package_spec}")
                     return True
                 else:
-                    print(f"[ERROR] {package_spec} installed but cannot be imported")
+                    print(f"[ERROR] {package_spec} installed but cannot be found")
                     return False
             else:
                 print(f"[ERROR] Failed to install {package_spec}")
@@ -105,75 +187,68 @@ class DependencyInstaller:
         except Exception as e:
             print(f"[ERROR] Exception installing {package_spec}: {e}")
             return False
-    
-    def install_dependencies(self, silent: bool = False) -> bool:
+
+    def install_dependencies(self, silent: bool = False, use_cache: bool = True) -> bool:
         """Install all required dependencies following ComfyUI best practices"""
+        missing = self.check_dependencies(use_cache=use_cache)
+        if not missing:
+            if not silent:
+                print("[INFO] ✅ All dependencies are already installed")
+            return True
+
         if not silent:
             print("[INFO] Checking and installing dependencies automatically...")
             print("[INFO] Installing to user directory (--user flag) to avoid conflicts")
-        
-        success_count = 0
-        needs_install = False
-        
-        for package_name, package_spec, flags in self.required_packages:
-            # First check cache for quick skip
-            if self.is_package_cached(package_name):
-                if not silent:
-                    print(f"[INFO] {package_name} is cached as installed")
-                success_count += 1
-                continue
-            
-            # Then check actual installation
-            if self.is_package_installed(package_name):
-                if not silent:
-                    print(f"[INFO] {package_name} is already installed")
-                self.cache_package_status(package_name, True)
-                success_count += 1
-            else:
-                needs_install = True
-                if not silent:
-                    print(f"[INFO] {package_name} needs installation")
-                if self.install_package(package_name, package_spec, flags):
-                    self.cache_package_status(package_name, True)
-                    success_count += 1
-                else:
-                    self.cache_package_status(package_name, False)
-        
-        all_installed = success_count == len(self.required_packages)
+
+        for package_name, package_spec, flags in missing:
+            if not silent:
+                print(f"[INFO] {package_name} needs installation")
+            self.install_package(package_name, package_spec, flags)
+
+        # Installing changed the environment; record the new state
+        still_missing = self.check_dependencies(use_cache=False)
         if not silent:
-            if all_installed:
-                if needs_install:
-                    print("[SUCCESS] 🎉 All dependencies are ready!")
-                else:
-                    print("[INFO] ✅ All dependencies are already installed")
+            if not still_missing:
+                print("[SUCCESS] 🎉 All dependencies are ready!")
             else:
-                print(f"[WARNING] {success_count}/{len(self.required_packages)} dependencies installed")
+                installed = len(self.required_packages) - len(still_missing)
+                print(f"[WARNING] {installed}/{len(self.required_packages)} dependencies installed")
                 print("[INFO] Some dependencies failed to install. Check error messages above.")
-        
-        return all_installed
-    
+
+        return not still_missing
+
     def ensure_dependencies(self) -> bool:
         """Ensure all dependencies are available"""
         return self.install_dependencies(silent=True)
-    
+
     def force_reinstall_dependencies(self, silent: bool = False) -> bool:
-        """Force reinstall all dependencies (clears cache first)"""
+        """Reinstall every required package with pip --force-reinstall, to repair a broken install"""
         if not silent:
             print("[INFO] Force reinstalling all dependencies...")
-        
-        # Clear cache
-        try:
-            if os.path.exists(self.cache_file):
-                os.remove(self.cache_file)
-        except Exception:
-            pass
-        
-        return self.install_dependencies(silent=silent)
+
+        reinstalled = [self.install_package(package_name, package_spec, flags, force_reinstall=True)
+                       for package_name, package_spec, flags in self.required_packages]
+
+        # Reinstalling changed the environment; record the new state
+        still_missing = self.check_dependencies(use_cache=False)
+        if not silent:
+            if all(reinstalled) and not still_missing:
+                print("[SUCCESS] 🎉 All dependencies were reinstalled!")
+            else:
+                print(f"[WARNING] {sum(reinstalled)}/{len(self.required_packages)} dependencies reinstalled")
+                print("[INFO] Some dependencies failed to reinstall. Check error messages above.")
+
+        return all(reinstalled) and not still_missing
 
 def get_installer() -> DependencyInstaller:
     """Get a new instance of the dependency installer"""
     return DependencyInstaller()
 
+def check_dependencies() -> List[Tuple[str, str, Optional[str]]]:
+    """Return the required packages that are missing, without importing or installing anything"""
+    installer = get_installer()
+    return installer.check_dependencies()
+
 def auto_install_dependencies(silent: bool = False) -> bool:
     """Auto-install dependencies following ComfyUI best practices"""
     installer = get_installer()
@@ -0,0 +1,423 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for ComfyUI PSD Tools
+
+Generates synthetic IMAGE and MASK tensors over a grid of layer counts,
+canvas sizes, channel compressions and mask densities, writes them as PSD
+files and reads them back, timing each stage:
+
+    convert    IMAGE/MASK tensors to placed RGBA layers and compact masks
+    composite  the layers into the document's merged image
+    encode     the layer channels into a psd-tools document
+    save       the document to disk
+    load       open the file and list its layers (once per read backend)
+    decode     every layer's pixels and mask (once per read backend)
+
+The bottom layer covers the whole canvas; the others are a quarter of its
+side, placed at seeded random positions. Every layer has a mask: "sparse"
+masks reveal a small rectangle, "dense" masks vary over the whole layer.
+
+Each case runs in its own process, so its peak RSS is its own and the same
+seed always gives it the same inputs. Everything runs on the CPU from
+generated data; nothing is downloaded. Cases whose estimated memory use
+exceeds the available memory are recorded as skipped. Results are written
+as JSON after every case.
+
+Usage:
+    python benchmark.py                      # full grid
+    python benchmark.py --quick              # 1K canvas, 1 and 10 layers
+    python benchmark.py --layers 10 --canvas 4k --compression rle zip --masks sparse
+    python benchmark.py --output results.json --repeat 5
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+LAYER_COUNTS = (1, 10, 50)
+CANVAS_SIZES = {"1k": 1024, "4k": 4096, "8k": 8192, "16k": 16384}
+COMPRESSIONS = ("raw", "rle", "zip")
+MASK_DENSITIES = ("sparse", "dense")
+
+QUICK_LAYER_COUNTS = (1, 10)
+QUICK_CANVAS_SIZES = ("1k",)
+
+DEFAULT_OUTPUT = "benchmark_results.json"
+SCHEMA_VERSION = 1
+
+# Rough bytes per layer pixel and per canvas pixel at peak (float tensors,
+# uint8 layers, masks, encoded channels and decoded copies), plus the
+# interpreter with numpy, torch and psd-tools imported
+BYTES_PER_LAYER_PIXEL = 40
+BYTES_PER_CANVAS_PIXEL = 20
+BASELINE_BYTES = 600 * 2**20
+
+# Workers write channels from scratch and never touch a GPU
+WORKER_ENVIRONMENT = {"APZ_PSD_CHANNEL_CACHE_MB": "0", "APZ_PSD_CHANNEL_CACHE_DIR": "",
+                      "CUDA_VISIBLE_DEVICES": ""}
+
+
+def parse_canvas(value: str) -> Tuple[str, int]:
+    """Returns (label, side) of a canvas given as a grid label ("4k") or a side in pixels."""
+    label = value.lower()
+    if label in CANVAS_SIZES:
+        return label, CANVAS_SIZES[label]
+    try:
+        side = int(label)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"canvas must be one of {list(CANVAS_SIZES)} or a size in pixels")
+    if side < 16:
+        raise argparse.ArgumentTypeError("canvas must be at least 16 pixels")
+    return str(side), side
+
+
+def case_id(case: Dict) -> str:
+    return f"layers{case['layers']}-{case['canvas']}-{case['compression']}-{case['masks']}"
+
+
+def layer_geometry(layers: int, side: int, seed: int) -> List[Tuple[int, int, int, int]]:
+    """Returns (left, top, width, height) of every layer, bottom to top."""
+    import random
+    rng = random.Random(seed)
+    small = max(1, side // 4)
+    geometry = [(0, 0, side, side)]
+    for _ in range(layers - 1):
+        geometry.append((rng.randrange(side - small + 1), rng.randrange(side - small + 1), small, small))
+    return geometry
+
+
+def estimate_case_bytes(layers: int, side: int) -> int:
+    """Estimated peak memory of a case."""
+    layer_pixels = sum(width * height for _, _, width, height in layer_geometry(layers, side, 0))
+    return layer_pixels * BYTES_PER_LAYER_PIXEL + side * side * BYTES_PER_CANVAS_PIXEL + BASELINE_BYTES
+
+
+def available_memory_bytes() -> Optional[int]:
+    """MemAvailable from /proc/meminfo, or None where it is not available."""
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def build_grid(layer_counts, canvases, compressions, mask_densities, seed: int) -> List[Dict]:
+    """Returns the cases of the grid, each with its own seed."""
+    cases = []
+    for layers in layer_counts:
+        for label, side in canvases:
+            for compression in compressions:
+                for masks in mask_densities:
+                    case = {"layers": layers, "canvas": label, "side": side,
+                            "compression": compression, "masks": masks}
+                    case["id"] = case_id(case)
+                    case["seed"] = (seed + zlib.crc32(case["id"].encode())) % 2**31
+                    cases.append(case)
+    return cases
+
+
+def environment_info() -> Dict:
+    """Describes the machine and the package versions the results were measured with."""
+    from importlib import metadata
+    versions = {}
+    for distribution in ("numpy", "torch", "psd-tools", "Pillow", "pytoshop"):
+        try:
+            versions[distribution] = metadata.version(distribution)
+        except metadata.PackageNotFoundError:
+            versions[distribution] = None
+    commit = None
+    try:
+        result = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, timeout=10,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        if result.returncode == 0:
+            commit = result.stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        pass
+    return {
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "python": sys.version,
+        "packages": versions,
+        "commit": commit,
+        "memory_available_bytes": available_memory_bytes(),
+    }
+
+
+# ---------------------------------------------------------------------------
+# Worker: runs one case in its own process
+# ---------------------------------------------------------------------------
+
+def _resident_set_bytes() -> Optional[int]:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def _peak_rss_bytes() -> int:
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def synthetic_image(height: int, width: int, generator):
+    """IMAGE tensor [1, H, W, 3]: a gradient with a flat block and a band of noise."""
+    import torch
+    color = torch.rand(3, generator=generator)
+    x = torch.linspace(0, 1, width).view(1, 1, width, 1)
+    y = torch.linspace(0, 1, height).view(1, height, 1, 1)
+    image = (x * color + y * (1 - color)).expand(1, height, width, 3).contiguous()
+    block = torch.rand(3, generator=generator)
+    image[:, height // 3:height // 2, width // 4:width // 2] = block
+    band = max(1, height // 10)
+    image[:, :band] = torch.rand(1, band, width, 3, generator=generator)
+    return image
+
+
+def synthetic_mask(height: int, width: int, density: str, generator):
+    """MASK tensor [1, H, W]: a small revealed rectangle ("sparse") or values everywhere ("dense")."""
+    import torch
+    if density == "dense":
+        return torch.rand(1, height, width, generator=generator) * 0.9 + 0.05
+    mask = torch.zeros(1, height, width)
+    mask_height, mask_width = max(1, height // 5), max(1, width // 4)
+    top = int(torch.randint(0, height - mask_height + 1, (1,), generator=generator))
+    left = int(torch.randint(0, width - mask_width + 1, (1,), generator=generator))
+    mask[:, top:top + mask_height, left:left + mask_width] = 1.0
+    return mask
+
+
+def _run_pipeline(case: Dict, images, masks, geometry, path: str, backends: List[str],
+                  phases: Dict[str, Dict]) -> Dict:
+    from utils.apz_psd_backends import get_psd_backend
+    from utils.apz_psd_tools_utility import (_prepared_layer_sizes, assemble_psd_document, choose_psd_version,
+                                             prepare_psd_layers, render_psd_composite, save_psd_file)
+    from utils.apz_tensor_conversion import image_tensor_to_pil, mask_tensor_to_pil
+
+    @contextlib.contextmanager
+    def phase(name):
+        start = time.perf_counter()
+        yield
+        seconds = time.perf_counter() - start
+        record = phases.setdefault(name, {"seconds": []})
+        record["seconds"].append(seconds)
+        record["rss_bytes"] = _resident_set_bytes()
+        record["peak_rss_bytes"] = _peak_rss_bytes()
+
+    names = [f"Layer {index}" for index in reversed(range(len(geometry)))]
+    offsets = [(left, top) for left, top, _, _ in reversed(geometry)]
+    with phase("convert"):
+        pil_images = [image_tensor_to_pil(image)[0] for image in reversed(images)]
+        pil_masks = [mask_tensor_to_pil(mask)[0] for mask in reversed(masks)]
+        canvas_width, canvas_height, prepared = prepare_psd_layers(pil_images, names, pil_masks, offsets)
+        del pil_images, pil_masks
+
+    with phase("composite"):
+        merged = render_psd_composite(prepared, canvas_width, canvas_height)
+
+    version = choose_psd_version(canvas_width, canvas_height, _prepared_layer_sizes(prepared))
+    if version == 2:
+        path = os.path.splitext(path)[0] + ".psb"
+    with phase("encode"):
+        psd = assemble_psd_document(prepared, canvas_width, canvas_height, merged=merged,
+                                    compression=case["compression"])
+    with phase("save"):
+        if not save_psd_file(psd, path):
+            raise RuntimeError(f"Could not save {path}")
+    del psd, merged, prepared
+
+    for name in backends:
+        backend = get_psd_backend(name)
+        with phase(f"load.{name}"):
+            doc = backend.open(path)
+            layers = backend.list_layers(doc)
+        with phase(f"decode.{name}"):
+            for index in range(len(layers)):
+                backend.decode_layer(doc, index)
+        del doc
+
+    file_bytes = os.path.getsize(path)
+    os.remove(path)
+    return {"psd_version": version, "file_bytes": file_bytes}
+
+
+def run_case(case: Dict, repeat: int = 1, work_dir: Optional[str] = None) -> Dict:
+    """
+    Runs one case and returns its measurements.
+
+    Args:
+        case: Case from build_grid
+        repeat: Number of times the pipeline is timed
+        work_dir: Directory for the PSD file (a temporary directory by default)
+
+    Returns:
+        dict with the case, its file size, RSS and the timings of every phase
+    """
+    import torch
+    from utils.apz_psd_backends import available_backends
+
+    torch.set_grad_enabled(False)
+    baseline_rss = _resident_set_bytes()
+    generator = torch.Generator().manual_seed(case["seed"])
+    geometry = layer_geometry(case["layers"], case["side"], case["seed"])
+    phases: Dict[str, Dict] = {}
+
+    start = time.perf_counter()
+    images = [synthetic_image(height, width, generator) for _, _, width, height in geometry]
+    masks = [synthetic_mask(height, width, case["masks"], generator) for _, _, width, height in geometry]
+    phases["generate"] = {"seconds": [time.perf_counter() - start], "rss_bytes": _resident_set_bytes(),
+                          "peak_rss_bytes": _peak_rss_bytes()}
+
+    backends = available_backends()
+    with tempfile.TemporaryDirectory(dir=work_dir) as output_dir:
+        path = os.path.join(output_dir, f"{case['id']}.psd")
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            for _ in range(repeat):
+                output = _run_pipeline(case, images, masks, geometry, path, backends, phases)
+
+    for record in phases.values():
+        record["min"] = min(record["seconds"])
+        record["median"] = statistics.median(record["seconds"])
+    return dict(case, status="ok", repeat=repeat, backends=backends, torch_threads=torch.get_num_threads(),
+                baseline_rss_bytes=baseline_rss, peak_rss_bytes=_peak_rss_bytes(), phases=phases, **output)
+
+
+def _worker_main(case_json: str, result_path: str, repeat: int, threads: Optional[int]):
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    if threads:
+        import torch
+        torch.set_num_threads(threads)
+    result = run_case(json.loads(case_json), repeat)
+    with open(result_path, "w") as f:
+        json.dump(result, f)
+
+
+# ---------------------------------------------------------------------------
+# Runner
+# ---------------------------------------------------------------------------
+
+def run_case_in_subprocess(case: Dict, repeat: int, threads: Optional[int], timeout: Optional[float]) -> Dict:
+    """Runs a case in a fresh interpreter; a crash, kill or timeout is recorded as a failed case."""
+    with tempfile.TemporaryDirectory() as result_dir:
+        result_path = os.path.join(result_dir, "result.json")
+        command = [sys.executable, os.path.abspath(__file__), "--worker", json.dumps(case),
+                   "--result", result_path, "--repeat", str(repeat)]
+        if threads:
+            command += ["--threads", str(threads)]
+        try:
+            result = subprocess.run(command, capture_output=True, text=True, timeout=timeout,
+                                    env=dict(os.environ, **WORKER_ENVIRONMENT))
+        except subprocess.TimeoutExpired:
+            return dict(case, status="failed", reason=f"timed out after {timeout} s")
+        if result.returncode != 0 or not os.path.exists(result_path):
+            error = result.stderr.strip().splitlines()[-1] if result.stderr.strip() else ""
+            return dict(case, status="failed", reason=f"exit code {result.returncode}: {error}")
+        with open(result_path) as f:
+            return json.load(f)
+
+
+def summarize_case(result: Dict) -> str:
+    """One console line per case."""
+    if result["status"] == "skipped":
+        return f"⏭️ {result['id']}: skipped, {result['reason']}"
+    if result["status"] == "failed":
+        return f"❌ {result['id']}: {result['reason']}"
+    timings = ", ".join(f"{name} {record['min'] * 1000:.0f} ms" for name, record in result["phases"].items()
+                        if name != "generate")
+    return (f"✅ {result['id']}: {timings}; peak RSS {result['peak_rss_bytes'] / 2**20:.0f} MB, "
+            f"file {result['file_bytes'] / 2**20:.1f} MB")
+
+
+def write_results(path: str, environment: Dict, settings: Dict, cases: List[Dict]):
+    results = {"schema_version": SCHEMA_VERSION,
+               "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+               "environment": environment,
+               "settings": settings,
+               "cases": cases}
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump(results, f, indent=2)
+    os.replace(temp_path, path)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark PSD Tools on synthetic documents")
+    parser.add_argument("--layers", type=int, nargs="+", help=f"layer counts (default {list(LAYER_COUNTS)})")
+    parser.add_argument("--canvas", type=parse_canvas, nargs="+",
+                        help=f"canvas sizes, {list(CANVAS_SIZES)} or a side in pixels (default all)")
+    parser.add_argument("--compression", nargs="+", choices=COMPRESSIONS, default=list(COMPRESSIONS),
+                        help="channel compressions (default all)")
+    parser.add_argument("--masks", nargs="+", choices=MASK_DENSITIES, default=list(MASK_DENSITIES),
+                        help="mask densities (default all)")
+    parser.add_argument("--quick", action="store_true",
+                        help=f"only {list(QUICK_LAYER_COUNTS)} layers on a {QUICK_CANVAS_SIZES[0]} canvas")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per case (default 3)")
+    parser.add_argument("--seed", type=int, default=0, help="base seed of the synthetic inputs (default 0)")
+    parser.add_argument("--threads", type=int, help="torch threads per case (default torch's choice)")
+    parser.add_argument("--memory-limit", type=float,
+                        help="skip cases estimated to need more GB than this (default: available memory)")
+    parser.add_argument("--timeout", type=float, help="seconds before a case is stopped (default none)")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help=f"results file (default {DEFAULT_OUTPUT})")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.repeat < 1:
+        parser.error("--repeat must be at least 1")
+    return args
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    if args.worker:
+        _worker_main(args.worker, args.result, args.repeat, args.threads)
+        return 0
+
+    layer_counts = args.layers or (QUICK_LAYER_COUNTS if args.quick else LAYER_COUNTS)
+    canvases = args.canvas or [parse_canvas(label) for label in (QUICK_CANVAS_SIZES if args.quick else CANVAS_SIZES)]
+    cases = build_grid(layer_counts, canvases, args.compression, args.masks, args.seed)
+
+    memory_limit = int(args.memory_limit * 2**30) if args.memory_limit else available_memory_bytes()
+    environment = environment_info()
+    settings = {"repeat": args.repeat, "seed": args.seed, "threads": args.threads,
+                "memory_limit_bytes": memory_limit, "timeout": args.timeout,
+                "grid": {"layers": list(layer_counts), "canvas": [label for label, _ in canvases],
+                         "compression": list(args.compression), "masks": list(args.masks)}}
+
+    print(f"📊 Benchmarking {len(cases)} cases, {args.repeat} run(s) each, results in {args.output}")
+    results = []
+    for case in cases:
+        estimate = estimate_case_bytes(case["layers"], case["side"])
+        if memory_limit is not None and estimate > memory_limit:
+            result = dict(case, status="skipped", estimated_bytes=estimate,
+                          reason=f"needs ~{estimate / 2**30:.1f} GB, {memory_limit / 2**30:.1f} GB available")
+        else:
+            result = run_case_in_subprocess(case, args.repeat, args.threads, args.timeout)
+            result["estimated_bytes"] = estimate
+        results.append(result)
+        print(summarize_case(result))
+        write_results(args.output, environment, settings, results)
+
+    counts = {status: sum(1 for result in results if result["status"] == status)
+              for status in ("ok", "skipped", "failed")}
+    print(f"🎉 {counts['ok']} cases measured, {counts['skipped']} skipped, {counts['failed']} failed")
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,13 +5,11 @@ This node saves up to 10 images as layers in a PSD file, with optional masks for
 Uses PIL and psd-tools instead of pytoshop for better compatibility and performance.
 """
 
-import torch
 import os
 import logging
 from typing import List, Optional, Tuple
 # ComfyUI-compatible import pattern
 import sys
-import os
 
 # Set up logging
 logger = logging.getLogger(__name__)
@@ -21,32 +19,29 @@ extension_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if extension_root not in sys.path:
     sys.path.insert(0, extension_root)
 
-# Now import utilities using absolute paths from extension root
+# Utility functions are bound lazily: psd-tools, PIL and torch are imported
+# the first time the node runs, not when ComfyUI imports this module
 try:
-    from utils.apz_psd_tools_utility import (
-        process_layers_to_psd,
-        check_psd_tools_available
-    )
-    print("✅ Successfully imported PSD tools utility functions")
-except ImportError as e:
-    print(f"Warning: Could not import PSD utilities: {e}")
-    # Try alternative import method
-    try:
-        import importlib.util
-        utils_path = os.path.join(extension_root, "utils")
-        spec = importlib.util.spec_from_file_location("apz_psd_tools_utility", os.path.join(utils_path, "apz_psd_tools_utility.py"))
-        apz_psd_tools_utility = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(apz_psd_tools_utility)
-        process_layers_to_psd = apz_psd_tools_utility.process_layers_to_psd
-        check_psd_tools_available = apz_psd_tools_utility.check_psd_tools_available
-        print("✅ Successfully imported PSD tools utility functions (fallback method)")
-    except Exception as e2:
-        print(f"Warning: Fallback import also failed: {e2}")
-        # Create dummy functions to prevent errors
-        def process_layers_to_psd(*args, **kwargs):
-            raise ImportError("PSD utilities not available")
-        def check_psd_tools_available(*args, **kwargs):
-            raise ImportError("PSD utilities not available")
+    from utils.apz_lazy_import import lazy_function
+except ImportError:
+    # Another "utils" package was imported first (ComfyUI has one), load ours by file path, once
+    import importlib.util
+    apz_lazy_import = sys.modules.get("apz_lazy_import")
+    if apz_lazy_import is None:
+        spec = importlib.util.spec_from_file_location("apz_lazy_import", os.path.join(extension_root, "utils", "apz_lazy_import.py"))
+        apz_lazy_import = importlib.util.module_from_spec(spec)
+        sys.modules["apz_lazy_import"] = apz_lazy_import
+        spec.loader.exec_module(apz_lazy_import)
+    lazy_function = apz_lazy_import.lazy_function
+
+process_layers_to_psd = lazy_function("apz_psd_tools_utility", "process_layers_to_psd")
+process_batch_to_psds = lazy_function("apz_psd_tools_utility", "process_batch_to_psds")
+generate_unique_filename = lazy_function("apz_psd_tools_utility", "generate_unique_filename")
+resolve_layer_offsets = lazy_function("apz_psd_tools_utility", "resolve_layer_offsets")
+check_psd_tools_available = lazy_function("apz_psd_tools_utility", "check_psd_tools_available")
+process_layers_to_psd_in_strips = lazy_function("apz_psd_stream_writer", "process_layers_to_psd_in_strips")
+use_strip_writer = lazy_function("apz_psd_stream_writer", "use_strip_writer")
+select_psd_backend = lazy_function("apz_psd_backends", "select_psd_backend")
 
 
 class APZmediaPSDLayerSaverMultilayer:
@@ -69,56 +64,97 @@ class APZmediaPSDLayerSaverMultilayer:
                 "filename_prefix": ("STRING", {
                     "default": "output"
                 }),
-                "overwrite_mode": (["false", "true"], {"default": "false"}),
+                # "update" rewrites {filename_prefix}.psd in place, re-encoding
+                # only the layers that changed since the last save
+                "overwrite_mode": (["false", "true", "update"], {"default": "false"}),
+                # How batched IMAGE inputs are saved: every batch element as its
+                # own layer, or one PSD file per batch element
+                "batch_mode": (["layers", "files"], {"default": "layers"}),
+                # Store only the non-transparent bounding box of masked layers
+                "trim_layers": (["true", "false"], {"default": "true"}),
+                # Where layers go on the canvas: centered, all at the top-left
+                # corner, or at their offset_x/offset_y inputs
+                "placement": (["center", "top_left", "offset"], {"default": "center"}),
+                # Companion files written next to each PSD from the same pixels:
+                # one PNG per layer, and/or the flattened composite
+                "sidecar_layers": (["false", "true"], {"default": "false"}),
+                "sidecar_flat": (["none", "jpeg", "webp", "png"], {"default": "none"}),
+                # Rows converted, encoded and composited at a time; peak memory
+                # follows the strip size instead of the canvas area.
+                # 0 writes in strips automatically for canvases of 64 megapixels or more
+                "strip_rows": ("INT", {"default": 0, "min": 0, "max": 8192, "step": 16}),
+                # Resampling filter for masks whose size differs from their layer
+                "mask_resize_filter": (["antialias", "bicubic", "bilinear", "area", "nearest"],
+                                       {"default": "antialias"}),
                 # Layer 1
                 "layer1": ("IMAGE",),
                 "mask1": ("MASK",),
                 "layer_name1": ("STRING", {"default": "Layer 1"}),
+                "offset_x1": ("INT", {"default": 0, "min": -30000, "max": 30000, "step": 1}),
+                "offset_y1": ("INT", {"default": 0, "min": -30000, "max": 30000, "step": 1}),
                 
                 # Layer 2
                 "layer2": ("IMAGE",),
                 "mask2": ("MASK",),
                 "layer_name2": ("STRING", {"default": "Layer 2"}),
+                "offset_x2": ("INT", {"default": 0, "min": -30000, "max": 30000, "step": 1}),
+                "offset_y2": ("INT", {"default": 0, "min": -30000, "max": 30000, "step": 1}),
                 
                 # Layer 3
                 "layer3": ("IMAGE",),
                 "mask3": ("MASK",),
                 "layer_name3": ("STRING", {"default": "Layer 3"}),
+                "offset_x3": ("INT", {"default": 0, "min": -30000, "max": 30000, "step": 1}),
+                "offset_y3": ("INT", {"default": 0, "min": -30000, "max": 30000, "step": 1}),
                 
                 # Layer 4
                 "layer4": ("IMAGE",),
                 "mask4": ("MASK",),
                 "layer_name4": ("STRING", {"default": "Layer 4"}),
+                "offset_x4": ("INT", {"default": 0, "min": -30000, "max": 30000, "step": 1}),
+                "offset_y4": ("INT", {"default": 0, "min": -30000, "max": 30000, "step": 1}),
                 
                 # Layer 5
                 "layer5": ("IMAGE",),
                 "mask5": ("MASK",),
                 "layer_name5": ("STRING", {"default": "Layer 5"}),
+                "offset_x5": ("INT", {"default": 0, "min": -30000, "max": 30000, "step": 1}),
+                "offset_y5": ("INT", {"default": 0, "min": -30000, "max": 30000, "step": 1}),
                 
                 # Layer 6
                 "layer6": ("IMAGE",),
                 "mask6": ("MASK",),
                 "layer_name6": ("STRING", {"default": "Layer 6"}),
+                "offset_x6": ("INT", {"default": 0, "min": -30000, "max": 30000, "step": 1}),
+                "offset_y6": ("INT", {"default": 0, "min": -30000, "max": 30000, "step": 1}),
                 
                 # Layer 7
                 "layer7": ("IMAGE",),
                 "mask7": ("MASK",),
                 "layer_name7": ("STRING", {"default": "Layer 7"}),
+                "offset_x7": ("INT", {"default": 0, "min": -30000, "max": 30000, "step": 1}),
+                "offset_y7": ("INT", {"default": 0, "min": -30000, "max": 30000, "step": 1}),
                 
                 # Layer 8
                 "layer8": ("IMAGE",),
                 "mask8": ("MASK",),
                 "layer_name8": ("STRING", {"default": "Layer 8"}),
+                "offset_x8": ("INT", {"default": 0, "min": -30000, "max": 30000, "step": 1}),
+                "offset_y8": ("INT", {"default": 0, "min": -30000, "max": 30000, "step": 1}),
                 
                 # Layer 9
                 "layer9": ("IMAGE",),
                 "mask9": ("MASK",),
                 "layer_name9": ("STRING", {"default": "Layer 9"}),
+                "offset_x9": ("INT", {"default": 0, "min": -30000, "max": 30000, "step": 1}),
+                "offset_y9": ("INT", {"default": 0, "min": -30000, "max": 30000, "step": 1}),
                 
                 # Layer 10
                 "layer10": ("IMAGE",),
                 "mask10": ("MASK",),
                 "layer_name10": ("STRING", {"default": "Layer 10"}),
+                "offset_x10": ("INT", {"default": 0, "min": -30000, "max": 30000, "step": 1}),
+                "offset_y10": ("INT", {"default": 0, "min": -30000, "max": 30000, "step": 1}),
             }
         }
     
@@ -132,26 +168,45 @@ class APZmediaPSDLayerSaverMultilayer:
                        output_dir=None,
                        filename_prefix=None,
                        overwrite_mode="false",
+                       batch_mode="layers",
+                       trim_layers="true",
+                       placement="center",
+                       sidecar_layers="false",
+                       sidecar_flat="none",
+                       strip_rows=0,
+                       mask_resize_filter="antialias",
                        # Layer inputs
-                       layer1=None, mask1=None, layer_name1=None,
-                       layer2=None, mask2=None, layer_name2=None,
-                       layer3=None, mask3=None, layer_name3=None,
-                       layer4=None, mask4=None, layer_name4=None,
-                       layer5=None, mask5=None, layer_name5=None,
-                       layer6=None, mask6=None, layer_name6=None,
-                       layer7=None, mask7=None, layer_name7=None,
-                       layer8=None, mask8=None, layer_name8=None,
-                       layer9=None, mask9=None, layer_name9=None,
-                       layer10=None, mask10=None, layer_name10=None):
+                       layer1=None, mask1=None, layer_name1=None, offset_x1=0, offset_y1=0,
+                       layer2=None, mask2=None, layer_name2=None, offset_x2=0, offset_y2=0,
+                       layer3=None, mask3=None, layer_name3=None, offset_x3=0, offset_y3=0,
+                       layer4=None, mask4=None, layer_name4=None, offset_x4=0, offset_y4=0,
+                       layer5=None, mask5=None, layer_name5=None, offset_x5=0, offset_y5=0,
+                       layer6=None, mask6=None, layer_name6=None, offset_x6=0, offset_y6=0,
+                       layer7=None, mask7=None, layer_name7=None, offset_x7=0, offset_y7=0,
+                       layer8=None, mask8=None, layer_name8=None, offset_x8=0, offset_y8=0,
+                       layer9=None, mask9=None, layer_name9=None, offset_x9=0, offset_y9=0,
+                       layer10=None, mask10=None, layer_name10=None, offset_x10=0, offset_y10=0):
         """
         Saves up to 10 images as layers in a PSD file with optional masks.
         
         Args:
             output_dir: Directory to save the PSD file (default: "./output")
             filename_prefix: Prefix for the filename (default: "output")
+            overwrite_mode: Whether to overwrite existing files ("true" or "false"),
+                or "update" to update the existing file (one per batch element
+                in "files" mode) in place
+            batch_mode: "layers" saves each batch element as its own layer,
+                "files" writes one PSD file per batch element
+            trim_layers: Whether to crop masked layers to their mask's bounding box
+            placement: "center", "top_left" or "offset" (use offset_x/offset_y)
+            sidecar_layers: Whether to also write one PNG per layer
+            sidecar_flat: Format of the flattened composite sidecar ("none" to skip)
+            strip_rows: Rows per strip for the strip writer (0 = automatic)
+            mask_resize_filter: Filter for masks whose size differs from their layer
             layer1-10: Individual image tensors
             mask1-10: Optional individual masks
             layer_name1-10: Individual layer names
+            offset_x1-10, offset_y1-10: Layer positions when placement is "offset"
             
         Returns:
             None (OUTPUT_NODE)
@@ -171,6 +226,10 @@ class APZmediaPSDLayerSaverMultilayer:
             masks = [mask1, mask2, mask3, mask4, mask5, mask6, mask7, mask8, mask9, mask10]
             layer_names = [layer_name1, layer_name2, layer_name3, layer_name4, layer_name5,
                           layer_name6, layer_name7, layer_name8, layer_name9, layer_name10]
+            offsets = [(offset_x1, offset_y1), (offset_x2, offset_y2), (offset_x3, offset_y3),
+                       (offset_x4, offset_y4), (offset_x5, offset_y5), (offset_x6, offset_y6),
+                       (offset_x7, offset_y7), (offset_x8, offset_y8), (offset_x9, offset_y9),
+                       (offset_x10, offset_y10)]
             
             # Set default layer names for None values
             for i in range(len(layer_names)):
@@ -181,12 +240,14 @@ class APZmediaPSDLayerSaverMultilayer:
             valid_layers = []
             valid_masks = []
             valid_names = []
+            valid_offsets = []
             
-            for i, (layer, mask, name) in enumerate(zip(layers, masks, layer_names)):
+            for i, (layer, mask, name, offset) in enumerate(zip(layers, masks, layer_names, offsets)):
                 if layer is not None:
                     valid_layers.append(layer)
                     valid_masks.append(mask)  # Keep mask even if None for proper indexing
                     valid_names.append(name)
+                    valid_offsets.append(offset if placement == "offset" else None)
                     
                     # Debug output for mask processing
                     if mask is not None:
@@ -203,21 +264,76 @@ class APZmediaPSDLayerSaverMultilayer:
             print(f"Processing {len(valid_layers)} layers for PSD creation")
             print(f"Masks provided: {sum(1 for mask in valid_masks if mask is not None)}/{len(valid_masks)}")
             print(f"Overwrite mode: {overwrite_mode}")
+            print(f"Batch mode: {batch_mode}")
+            print(f"Placement: {placement}")
+            print(f"Sidecars: layers={sidecar_layers}, flat={sidecar_flat}")
+            
+            layer_offsets = resolve_layer_offsets(placement, valid_offsets, len(valid_layers))
+            
+            if batch_mode == "files":
+                # One PSD per batch element, encoded in parallel
+                results = process_batch_to_psds(
+                    image_tensors=valid_layers,
+                    layer_names=valid_names,
+                    mask_tensors=valid_masks,
+                    output_dir=output_dir,
+                    filename_prefix=filename_prefix,
+                    trim_layers=trim_layers == "true",
+                    layer_offsets=layer_offsets,
+                    overwrite=overwrite_mode == "true",
+                    update_existing=overwrite_mode == "update",
+                    sidecar_layers=sidecar_layers == "true",
+                    sidecar_flat=sidecar_flat,
+                    mask_resize_filter=mask_resize_filter,
+                    # Updates patch the existing files and never use a write backend
+                    backend=None if overwrite_mode == "update" else select_psd_backend("write")
+                )
+                saved = [path for path, ok in results if ok]
+                print(f"Successfully saved {len(saved)}/{len(results)} PSD files with {len(valid_layers)} layers each")
+                for path, ok in results:
+                    if not ok:
+                        print(f"Failed to save PSD file to: {path}")
+                return
             
-            # Handle overwrite mode
-            final_output_path = self._handle_overwrite_mode(output_dir, filename_prefix, overwrite_mode)
+            # Handle overwrite mode ("update" always writes "{filename_prefix}.psd")
+            final_output_path = None
+            if overwrite_mode != "update":
+                final_output_path = self._handle_overwrite_mode(output_dir, filename_prefix, overwrite_mode)
             
-            # Process layers to PSD
-            output_path, success = process_layers_to_psd(
-                image_tensors=valid_layers,
-                layer_names=valid_names,
-                mask_tensors=valid_masks,
-                output_dir=output_dir,
-                filename_prefix=filename_prefix
-            )
+            if overwrite_mode != "update" and use_strip_writer(valid_layers, layer_offsets, strip_rows):
+                output_path, success = process_layers_to_psd_in_strips(
+                    image_tensors=valid_layers,
+                    layer_names=valid_names,
+                    mask_tensors=valid_masks,
+                    output_dir=output_dir,
+                    filename_prefix=filename_prefix,
+                    layer_offsets=layer_offsets,
+                    trim_layers=trim_layers == "true",
+                    output_path=final_output_path,
+                    strip_rows=strip_rows,
+                    mask_resize_filter=mask_resize_filter,
+                    sidecar_layers=sidecar_layers == "true",
+                    sidecar_flat=sidecar_flat
+                )
+            else:
+                output_path, success = process_layers_to_psd(
+                    image_tensors=valid_layers,
+                    layer_names=valid_names,
+                    mask_tensors=valid_masks,
+                    output_dir=output_dir,
+                    filename_prefix=filename_prefix,
+                    layer_offsets=layer_offsets,
+                    trim_layers=trim_layers == "true",
+                    update_existing=overwrite_mode == "update",
+                    output_path=final_output_path,
+                    sidecar_layers=sidecar_layers == "true",
+                    sidecar_flat=sidecar_flat,
+                    mask_resize_filter=mask_resize_filter,
+                    backend=None if overwrite_mode == "update" else select_psd_backend("write")
+                )
             
             if success:
-                print(f"Successfully saved PSD file with {len(valid_layers)} layers to: {output_path}")
+                print(f"Successfully saved PSD file with {len(valid_layers)} inputs to: {output_path}")
             else:
                 print(f"Failed to save PSD file to: {output_path}")
                 
@@ -238,52 +354,14 @@ class APZmediaPSDLayerSaverMultilayer:
         Returns:
             Final output path for the file
         """
-        import os
-        from datetime import datetime
-        
-        # Create output directory if it doesn't exist
-        os.makedirs(output_dir, exist_ok=True)
-        
-        # Generate base filename
-        base_filename = f"{filename_prefix}.psd"
-        base_path = os.path.join(output_dir, base_filename)
-        
-        # If overwrite is enabled, use the base path
         if overwrite_mode == "true":
             print(f"📁 Overwrite mode enabled - will overwrite existing files")
-            return base_path
-        
-        # If file doesn't exist, use base path
-        if not os.path.exists(base_path):
-            print(f"📁 File doesn't exist - using base path: {base_path}")
-            return base_path
-        
-        # File exists and overwrite is disabled - generate unique filename
-        print(f"📁 File exists and overwrite disabled - generating unique filename")
-        
-        # Try with timestamp
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        timestamped_filename = f"{filename_prefix}_{timestamp}.psd"
-        timestamped_path = os.path.join(output_dir, timestamped_filename)
         
-        if not os.path.exists(timestamped_path):
-            print(f"📁 Using timestamped filename: {timestamped_path}")
-            return timestamped_path
-        
-        # If timestamped file also exists, try with counter
-        counter = 1
-        while True:
-            numbered_filename = f"{filename_prefix}_{counter:03d}.psd"
-            numbered_path = os.path.join(output_dir, numbered_filename)
-            
-            if not os.path.exists(numbered_path):
-                print(f"📁 Using numbered filename: {numbered_path}")
-                return numbered_path
-            
-            counter += 1
-            if counter > 999:  # Safety limit
-                print(f"⚠️ Could not generate unique filename after 999 attempts")
-                return base_path
+        # Claims a unique name unless overwriting
+        final_output_path = generate_unique_filename(f"{filename_prefix}.psd", output_dir,
+                                                     overwrite=overwrite_mode == "true")
+        print(f"📁 Output path: {final_output_path}")
+        return final_output_path
 
 
 # Node class mappings for ComfyUI
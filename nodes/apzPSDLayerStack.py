@@ -0,0 +1,239 @@
+"""
+APZmedia PSD Layer Stack Nodes for ComfyUI
+
+These nodes build a PSD_LAYER_STACK one layer at a time and save a stack of any
+length as a PSD file in a single encode pass, without the fixed number of layer
+inputs of the multilayer saver.
+"""
+
+import os
+# ComfyUI-compatible import pattern
+import sys
+
+# Add extension root to Python path (ComfyUI standard pattern)
+extension_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if extension_root not in sys.path:
+    sys.path.insert(0, extension_root)
+
+# Utility functions are bound lazily: psd-tools, PIL and torch are imported
+# the first time the node runs, not when ComfyUI imports this module
+try:
+    from utils.apz_lazy_import import lazy_function, load_utility
+except ImportError:
+    # Another "utils" package was imported first (ComfyUI has one), load ours by file path, once
+    import importlib.util
+    apz_lazy_import = sys.modules.get("apz_lazy_import")
+    if apz_lazy_import is None:
+        spec = importlib.util.spec_from_file_location("apz_lazy_import", os.path.join(extension_root, "utils", "apz_lazy_import.py"))
+        apz_lazy_import = importlib.util.module_from_spec(spec)
+        sys.modules["apz_lazy_import"] = apz_lazy_import
+        spec.loader.exec_module(apz_lazy_import)
+    lazy_function = apz_lazy_import.lazy_function
+    load_utility = apz_lazy_import.load_utility
+
+# The layer stack type only needs the standard library and is imported right away
+try:
+    from utils.apz_psd_layer_stack import (
+        PSDLayerEntry,
+        PSDLayerStack,
+        LAYER_STACK_TYPE,
+        BLEND_MODES
+    )
+except ImportError:
+    # Another "utils" package was imported first (ComfyUI has one), load ours
+    # through the same registered package as the utility modules
+    apz_psd_layer_stack = load_utility("apz_psd_layer_stack")
+    PSDLayerEntry = apz_psd_layer_stack.PSDLayerEntry
+    PSDLayerStack = apz_psd_layer_stack.PSDLayerStack
+    LAYER_STACK_TYPE = apz_psd_layer_stack.LAYER_STACK_TYPE
+    BLEND_MODES = apz_psd_layer_stack.BLEND_MODES
+
+process_layers_to_psd = lazy_function("apz_psd_tools_utility", "process_layers_to_psd")
+check_psd_tools_available = lazy_function("apz_psd_tools_utility", "check_psd_tools_available")
+select_psd_backend = lazy_function("apz_psd_backends", "select_psd_backend")
+
+
+class APZmediaPSDLayerStackAdd:
+    """
+    ComfyUI node that places one layer on top of a layer stack.
+    Chain several of these nodes to build a document with any number of layers.
+    """
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "image": ("IMAGE",),
+                "layer_name": ("STRING", {"default": "Layer"}),
+            },
+            "optional": {
+                "layer_stack": (LAYER_STACK_TYPE,),
+                "mask": ("MASK",),
+                # "center" centers the layer on the canvas, "offset" places its
+                # top-left corner at offset_x/offset_y
+                "placement": (["center", "offset"], {"default": "center"}),
+                "offset_x": ("INT", {"default": 0, "min": -30000, "max": 30000, "step": 1}),
+                "offset_y": ("INT", {"default": 0, "min": -30000, "max": 30000, "step": 1}),
+                "blend_mode": (BLEND_MODES, {"default": "normal"}),
+            }
+        }
+
+    RETURN_TYPES = (LAYER_STACK_TYPE,)
+    RETURN_NAMES = ("layer_stack",)
+    FUNCTION = "add_layer"
+    CATEGORY = "image/psd"
+
+    def add_layer(self, image, layer_name="Layer", layer_stack=None, mask=None,
+                  placement="center", offset_x=0, offset_y=0, blend_mode="normal"):
+        """
+        Returns a new layer stack with the image placed on top.
+
+        Args:
+            image: Image tensor; every batch element becomes a layer
+            layer_name: Name of the layer
+            layer_stack: Optional stack to add the layer to (default: empty stack)
+            mask: Optional mask tensor for the layer
+            placement: "center" or "offset"
+            offset_x: Left position of the layer when placement is "offset"
+            offset_y: Top position of the layer when placement is "offset"
+            blend_mode: Blend mode of the layer
+
+        Returns:
+            Tuple containing the new layer stack
+        """
+        if layer_stack is None:
+            layer_stack = PSDLayerStack()
+
+        offset = (offset_x, offset_y) if placement == "offset" else None
+        entry = PSDLayerEntry(image, mask=mask, name=layer_name, offset=offset, blend_mode=blend_mode)
+        return (layer_stack.add(entry),)
+
+
+class APZmediaPSDLayerStackMerge:
+    """
+    ComfyUI node that combines two layer stacks into one.
+    """
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "top_stack": (LAYER_STACK_TYPE,),
+                "bottom_stack": (LAYER_STACK_TYPE,),
+            }
+        }
+
+    RETURN_TYPES = (LAYER_STACK_TYPE,)
+    RETURN_NAMES = ("layer_stack",)
+    FUNCTION = "merge_stacks"
+    CATEGORY = "image/psd"
+
+    def merge_stacks(self, top_stack, bottom_stack):
+        """
+        Returns a new stack with all layers of top_stack above those of bottom_stack.
+        """
+        return (top_stack.extend(bottom_stack),)
+
+
+class APZmediaPSDLayerStackSaver:
+    """
+    ComfyUI node for saving a layer stack of any length as a PSD file.
+    """
+
+    def __init__(self, device="cpu"):
+        print("APZmediaPSDLayerStackSaver initialized")
+        self.device = device
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "layer_stack": (LAYER_STACK_TYPE,),
+            },
+            "optional": {
+                "output_dir": ("STRING", {
+                    "default": "./output"
+                }),
+                "filename_prefix": ("STRING", {
+                    "default": "output"
+                }),
+                # Store only the non-transparent bounding box of masked layers
+                "trim_layers": (["true", "false"], {"default": "true"}),
+                # Rewrite {filename_prefix}.psd in place, re-encoding only changed layers
+                "update_existing": (["false", "true"], {"default": "false"}),
+            }
+        }
+
+    RETURN_TYPES = ()  # OUTPUT_NODE - no return values
+    RETURN_NAMES = ()
+    FUNCTION = "save_layer_stack"
+    CATEGORY = "image/psd"
+    OUTPUT_NODE = True  # This is an output node that writes to disk
+
+    def save_layer_stack(self, layer_stack, output_dir=None, filename_prefix=None, trim_layers="true",
+                         update_existing="false"):
+        """
+        Saves every layer of the stack into one PSD file.
+
+        Args:
+            layer_stack: PSD_LAYER_STACK built with the layer stack nodes
+            output_dir: Directory to save the PSD file (default: "./output")
+            filename_prefix: Prefix for the filename (default: "output")
+            trim_layers: Whether to crop masked layers to their mask's bounding box
+            update_existing: Whether to update an existing file in place
+
+        Returns:
+            None (OUTPUT_NODE)
+        """
+        try:
+            check_psd_tools_available()
+
+            if output_dir is None:
+                output_dir = "./output"
+            if filename_prefix is None:
+                filename_prefix = "output"
+
+            if layer_stack is None or len(layer_stack) == 0:
+                print("❌ No layers provided for saving")
+                return
+
+            images, masks, names, offsets, blend_modes = layer_stack.as_lists()
+            print(f"Processing layer stack with {len(layer_stack)} entries for PSD creation")
+
+            output_path, success = process_layers_to_psd(
+                image_tensors=images,
+                layer_names=names,
+                mask_tensors=masks,
+                output_dir=output_dir,
+                filename_prefix=filename_prefix,
+                layer_offsets=offsets,
+                blend_modes=blend_modes,
+                trim_layers=trim_layers == "true",
+                update_existing=update_existing == "true",
+                # Updates patch the existing file and never use a write backend
+                backend=None if update_existing == "true" else select_psd_backend("write")
+            )
+
+            if success:
+                print(f"Successfully saved PSD file with {len(layer_stack)} stack entries to: {output_path}")
+            else:
+                print(f"Failed to save PSD file to: {output_path}")
+
+        except Exception as e:
+            print(f"Error in save_layer_stack: {e}")
+            import traceback
+            traceback.print_exc()
+
+
+# Node class mappings for ComfyUI
+NODE_CLASS_MAPPINGS = {
+    "APZmediaPSDLayerStackAdd": APZmediaPSDLayerStackAdd,
+    "APZmediaPSDLayerStackMerge": APZmediaPSDLayerStackMerge,
+    "APZmediaPSDLayerStackSaver": APZmediaPSDLayerStackSaver
+}
+
+NODE_DISPLAY_NAME_MAPPINGS = {
+    "APZmediaPSDLayerStackAdd": "APZmedia PSD Layer Stack Add",
+    "APZmediaPSDLayerStackMerge": "APZmedia PSD Layer Stack Merge",
+    "APZmediaPSDLayerStackSaver": "APZmedia PSD Layer Stack Saver"
+}
@@ -0,0 +1,86 @@
+"""
+APZmedia PSD Mask Stats Node for ComfyUI
+
+This node measures a MASK batch: coverage, bounding box, value range and
+whether the masks are empty or full, all in a single pass over the masks.
+"""
+
+import os
+# ComfyUI-compatible import pattern
+import sys
+
+# Add extension root to Python path (ComfyUI standard pattern)
+extension_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if extension_root not in sys.path:
+    sys.path.insert(0, extension_root)
+
+# Utility functions are bound lazily: psd-tools, PIL and torch are imported
+# the first time the node runs, not when ComfyUI imports this module
+try:
+    from utils.apz_lazy_import import lazy_function
+except ImportError:
+    # Another "utils" package was imported first (ComfyUI has one), load ours by file path, once
+    import importlib.util
+    apz_lazy_import = sys.modules.get("apz_lazy_import")
+    if apz_lazy_import is None:
+        spec = importlib.util.spec_from_file_location("apz_lazy_import", os.path.join(extension_root, "utils", "apz_lazy_import.py"))
+        apz_lazy_import = importlib.util.module_from_spec(spec)
+        sys.modules["apz_lazy_import"] = apz_lazy_import
+        spec.loader.exec_module(apz_lazy_import)
+    lazy_function = apz_lazy_import.lazy_function
+
+compute_mask_stats = lazy_function("apz_mask_stats", "compute_mask_stats")
+summarize_mask_stats = lazy_function("apz_mask_stats", "summarize_mask_stats")
+
+
+class APZmediaPSDMaskStats:
+    """
+    ComfyUI node reporting the coverage, bounding box and value range of a MASK batch.
+    For a batch, coverage is averaged and the bounding box covers every mask.
+    """
+
+    def __init__(self, device="cpu"):
+        print("APZmediaPSDMaskStats initialized")
+        self.device = device
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "mask": ("MASK",),
+            }
+        }
+
+    RETURN_TYPES = ("FLOAT", "INT", "INT", "INT", "INT", "FLOAT", "FLOAT", "BOOLEAN", "BOOLEAN", "STRING")
+    RETURN_NAMES = ("coverage", "bbox_x", "bbox_y", "bbox_width", "bbox_height",
+                    "min", "max", "is_empty", "is_full", "report")
+    FUNCTION = "measure_mask"
+    CATEGORY = "image/psd"
+
+    def measure_mask(self, mask):
+        """
+        Measures every mask of the batch.
+
+        Args:
+            mask: MASK tensor with shape [B, H, W]
+
+        Returns:
+            Tuple of (coverage percentage, bbox x, y, width, height, minimum,
+            maximum, is_empty, is_full, per-mask report)
+        """
+        stats = compute_mask_stats(mask)
+        summary = summarize_mask_stats(stats)
+
+        left, top, right, bottom = summary.bbox or (0, 0, 0, 0)
+        lines = []
+        for index, mask_stats in enumerate(stats):
+            box = mask_stats.bbox or (0, 0, 0, 0)
+            lines.append(f"mask {index + 1}: coverage {mask_stats.coverage:.2f}%, "
+                         f"bbox x={box[0]} y={box[1]} w={box[2] - box[0]} h={box[3] - box[1]}, "
+                         f"range {mask_stats.minimum:.3f}-{mask_stats.maximum:.3f}"
+                         f"{', empty' if mask_stats.is_empty else ''}{', full' if mask_stats.is_full else ''}")
+        report = "\n".join(lines)
+        print(f"📊 Mask stats:\n{report}")
+
+        return (summary.coverage, left, top, right - left, bottom - top,
+                summary.minimum, summary.maximum, summary.is_empty, summary.is_full, report)
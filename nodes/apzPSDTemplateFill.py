@@ -0,0 +1,152 @@
+"""
+APZmedia PSD Template Fill Node for ComfyUI
+
+This node fills named layers of a PSD template with images from a layer stack
+and saves the result. Only the targeted layers are re-encoded; every other
+layer of the template is written back unchanged.
+"""
+
+import os
+# ComfyUI-compatible import pattern
+import sys
+
+# Add extension root to Python path (ComfyUI standard pattern)
+extension_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if extension_root not in sys.path:
+    sys.path.insert(0, extension_root)
+
+# The layer stack type only needs the standard library and is imported right away
+try:
+    from utils.apz_psd_layer_stack import LAYER_STACK_TYPE
+except ImportError:
+    LAYER_STACK_TYPE = "PSD_LAYER_STACK"
+
+# Utility functions are bound lazily: psd-tools, PIL and torch are imported
+# the first time the node runs, not when ComfyUI imports this module
+try:
+    from utils.apz_lazy_import import lazy_function
+except ImportError:
+    # Another "utils" package was imported first (ComfyUI has one), load ours by file path, once
+    import importlib.util
+    apz_lazy_import = sys.modules.get("apz_lazy_import")
+    if apz_lazy_import is None:
+        spec = importlib.util.spec_from_file_location("apz_lazy_import", os.path.join(extension_root, "utils", "apz_lazy_import.py"))
+        apz_lazy_import = importlib.util.module_from_spec(spec)
+        sys.modules["apz_lazy_import"] = apz_lazy_import
+        spec.loader.exec_module(apz_lazy_import)
+    lazy_function = apz_lazy_import.lazy_function
+
+process_template_fill = lazy_function("apz_psd_template_utility", "process_template_fill")
+check_psd_tools_available = lazy_function("apz_psd_tools_utility", "check_psd_tools_available")
+
+
+class APZmediaPSDTemplateFill:
+    """
+    ComfyUI node that replaces named layers of a PSD template.
+    Each entry of the layer stack fills the template layer with the entry's name.
+    """
+
+    def __init__(self, device="cpu"):
+        print("APZmediaPSDTemplateFill initialized")
+        self.device = device
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                # Relative paths are looked up in the working directory, then in the extension folder
+                "template_path": ("STRING", {
+                    "default": "templates/PSD-Product-Template.psd"
+                }),
+                # Entry names are template layer names or "Group/Layer" paths
+                "layer_stack": (LAYER_STACK_TYPE,),
+            },
+            "optional": {
+                "output_dir": ("STRING", {
+                    "default": "./output"
+                }),
+                "filename_prefix": ("STRING", {
+                    "default": "output"
+                }),
+                # "center" keeps the image size centered on the template layer,
+                # "stretch" resizes the image to the template layer's bounds
+                "fit": (["center", "stretch"], {"default": "center"}),
+                # Re-render the merged image, or keep the template's
+                "update_composite": (["true", "false"], {"default": "true"}),
+            }
+        }
+
+    RETURN_TYPES = ()  # OUTPUT_NODE - no return values
+    RETURN_NAMES = ()
+    FUNCTION = "fill_template"
+    CATEGORY = "image/psd"
+    OUTPUT_NODE = True  # This is an output node that writes to disk
+
+    def fill_template(self, template_path, layer_stack, output_dir=None, filename_prefix=None,
+                      fit="center", update_composite="true"):
+        """
+        Fills the template layers named in the layer stack and saves the PSD file.
+
+        Args:
+            template_path: Path to the PSD template
+            layer_stack: PSD_LAYER_STACK whose entry names select the template layers
+            output_dir: Directory to save the PSD file (default: "./output")
+            filename_prefix: Prefix for the filename (default: "output")
+            fit: "center" or "stretch"
+            update_composite: Whether to re-render the merged image
+
+        Returns:
+            None (OUTPUT_NODE)
+        """
+        try:
+            check_psd_tools_available()
+
+            if output_dir is None:
+                output_dir = "./output"
+            if filename_prefix is None:
+                filename_prefix = "output"
+
+            if layer_stack is None or len(layer_stack) == 0:
+                print("❌ No layers provided for the template")
+                return
+
+            if not os.path.isabs(template_path) and not os.path.exists(template_path):
+                template_path = os.path.join(extension_root, template_path)
+            if not os.path.exists(template_path):
+                print(f"❌ Template not found: {template_path}")
+                return
+
+            images, masks, names, offsets, _ = layer_stack.as_lists()
+            print(f"Filling {len(names)} layers of template {template_path}")
+
+            output_path, success = process_template_fill(
+                template_path=template_path,
+                layer_keys=names,
+                image_tensors=images,
+                mask_tensors=masks,
+                layer_offsets=offsets,
+                output_dir=output_dir,
+                filename_prefix=filename_prefix,
+                fit=fit,
+                update_composite=update_composite == "true"
+            )
+
+            if success:
+                print(f"Successfully saved filled template to: {output_path}")
+            else:
+                print(f"Failed to save filled template to: {output_path}")
+
+        except Exception as e:
+            print(f"Error in fill_template: {e}")
+            import traceback
+            traceback.print_exc()
+
+
+# Node class mappings for ComfyUI
+NODE_CLASS_MAPPINGS = {
+    "APZmediaPSDTemplateFill": APZmediaPSDTemplateFill
+}
+
+NODE_DISPLAY_NAME_MAPPINGS = {
+    "APZmediaPSDTemplateFill": "APZmedia PSD Template Fill"
+}
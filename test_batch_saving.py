@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the multilayer saver writes whole IMAGE batches, as layers or as one PSD per element
+"""
+
+import os
+import sys
+import tempfile
+
+import numpy as np
+import torch
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "nodes"))
+
+from psd_tools import PSDImage
+from utils.apz_psd_tools_utility import process_batch_to_psds
+from utils.apz_tensor_conversion import image_tensor_to_uint8, mask_tensor_to_uint8
+from apzPSDLayerSaverMultilayer import APZmediaPSDLayerSaverMultilayer
+
+
+def make_inputs():
+    torch.manual_seed(0)
+    items = torch.rand(3, 24, 32, 3)
+    mask = torch.zeros(1, 24, 32)
+    mask[:, 4:20, 8:24] = 1
+    base = torch.rand(1, 24, 32, 3)
+    return items, mask, base
+
+
+def layer_rgb(layer):
+    return np.asarray(layer.topil().convert('RGB'))
+
+
+def test_batch_as_layers():
+    """Every batch element becomes its own numbered layer; a mask batch of 1 is shared by all of them"""
+    print("🧪 Testing batch saved as layers...")
+
+    items, mask, base = make_inputs()
+    with tempfile.TemporaryDirectory() as output_dir:
+        APZmediaPSDLayerSaverMultilayer().save_psd_layers(
+            output_dir=output_dir, filename_prefix="layers", batch_mode="layers", trim_layers="false",
+            layer1=items, mask1=mask, layer_name1="Item", layer2=base, layer_name2="Base")
+        assert os.listdir(output_dir) == ["layers.psd"]
+        psd = PSDImage.open(os.path.join(output_dir, "layers.psd"))
+
+        assert [layer.name for layer in psd] == ["Base", "Item 3", "Item 2", "Item 1"]
+        expected = image_tensor_to_uint8(items)
+        for b in range(3):
+            layer = psd[3 - b]
+            assert np.array_equal(layer_rgb(layer), expected[b])
+            assert layer.mask is not None and layer.mask.bbox == (8, 4, 24, 20)
+        assert np.array_equal(layer_rgb(psd[0]), image_tensor_to_uint8(base)[0])
+        assert psd[0].mask is None
+    print("✅ Batch elements saved as layers")
+
+
+def test_batch_as_files():
+    """Element b of every input goes into file b; inputs with a batch of 1 are shared by every file"""
+    print("🧪 Testing batch saved as files...")
+
+    items, mask, base = make_inputs()
+    masks = mask.repeat(3, 1, 1)
+    masks[1] = 1 - masks[1]
+    with tempfile.TemporaryDirectory() as output_dir:
+        APZmediaPSDLayerSaverMultilayer().save_psd_layers(
+            output_dir=output_dir, filename_prefix="shot", batch_mode="files", trim_layers="false",
+            layer1=items, mask1=masks, layer_name1="Item", layer2=base, layer_name2="Base")
+        assert sorted(os.listdir(output_dir)) == ["shot_001.psd", "shot_002.psd", "shot_003.psd"]
+
+        expected, expected_masks = image_tensor_to_uint8(items), mask_tensor_to_uint8(masks)
+        for b in range(3):
+            psd = PSDImage.open(os.path.join(output_dir, f"shot_{b + 1:03d}.psd"))
+            assert [layer.name for layer in psd] == ["Base", "Item"]
+            assert np.array_equal(layer_rgb(psd[1]), expected[b])
+            mask_canvas = np.full((24, 32), psd[1].mask.background_color, dtype=np.uint8)
+            left, top, right, bottom = psd[1].mask.bbox
+            mask_canvas[top:bottom, left:right] = np.asarray(psd[1].mask.topil())
+            assert np.array_equal(mask_canvas, expected_masks[b])
+            assert np.array_equal(layer_rgb(psd[0]), image_tensor_to_uint8(base)[0])
+    print("✅ Batch elements saved as files")
+
+
+def test_repeated_batch_saves_continue_numbering():
+    """Saving a batch again continues the numbered names instead of stacking suffixes"""
+    print("🧪 Testing repeated batch saves...")
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        for _ in range(2):
+            results = process_batch_to_psds([torch.rand(2, 8, 8, 3)], ["Layer"], output_dir=output_dir,
+                                            filename_prefix="out")
+            assert all(ok for _, ok in results)
+        assert sorted(os.listdir(output_dir)) == ["out_001.psd", "out_002.psd", "out_003.psd", "out_004.psd"]
+
+        # Overwriting reuses the first names
+        results = process_batch_to_psds([torch.rand(2, 8, 8, 3)], ["Layer"], output_dir=output_dir,
+                                        filename_prefix="out", overwrite=True)
+        assert [os.path.basename(path) for path, _ in results] == ["out_001.psd", "out_002.psd"]
+        assert len(os.listdir(output_dir)) == 4
+    print("✅ Repeated batch saves continue numbering")
+
+
+def test_mismatched_batches_are_rejected():
+    """Layer inputs with different batch sizes (other than 1) write nothing"""
+    print("🧪 Testing mismatched batch sizes...")
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        results = process_batch_to_psds([torch.rand(3, 8, 8, 3), torch.rand(2, 8, 8, 3)], ["A", "B"],
+                                        output_dir=output_dir, filename_prefix="bad")
+        assert results == []
+        assert os.listdir(output_dir) == []
+    print("✅ Mismatched batch sizes rejected")
+
+
+def test_failed_setup_releases_placeholders():
+    """Filenames claimed before the writers fail to start leave no empty files behind"""
+    print("🧪 Testing placeholder release...")
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        # The encoder pool refuses to start with zero workers, after the names were claimed
+        results = process_batch_to_psds([torch.rand(3, 8, 8, 3)], ["Layer"], output_dir=output_dir,
+                                        filename_prefix="claimed", max_workers=0)
+        assert results == []
+        assert os.listdir(output_dir) == []
+    print("✅ Claimed placeholders released")
+
+
+if __name__ == "__main__":
+    test_batch_as_layers()
+    test_batch_as_files()
+    test_repeated_batch_saves_continue_numbering()
+    test_mismatched_batches_are_rejected()
+    test_failed_setup_releases_placeholders()
+    print("\n🎉 Batch saving tests passed!")
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the benchmark suite runs a case and writes its results file
+"""
+
+import json
+import os
+import sys
+import tempfile
+
+import torch
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from benchmark import build_grid, main, parse_canvas, run_case, synthetic_image, synthetic_mask
+
+
+def test_run_case():
+    """A small case times every stage and reads its document back with every backend"""
+    print("🧪 Testing benchmark case...")
+
+    for compression in ("raw", "rle", "zip"):
+        case = build_grid([3], [parse_canvas("64")], [compression], ["sparse"], seed=0)[0]
+        result = run_case(case, repeat=2)
+        assert result["status"] == "ok"
+        assert result["psd_version"] == 1 and result["file_bytes"] > 0
+        expected = ["generate", "convert", "composite", "encode", "save"]
+        for backend in result["backends"]:
+            expected += [f"load.{backend}", f"decode.{backend}"]
+        assert list(result["phases"]) == expected
+        assert all(len(record["seconds"]) == 2 for name, record in result["phases"].items() if name != "generate")
+        assert result["peak_rss_bytes"] > 0
+        print(f"✅ {case['id']}: {result['file_bytes']} bytes")
+
+
+def test_inputs_are_reproducible():
+    """The same seed generates the same tensors"""
+    print("🧪 Testing synthetic inputs...")
+
+    tensors = []
+    for _ in range(2):
+        generator = torch.Generator().manual_seed(7)
+        tensors.append((synthetic_image(40, 50, generator), synthetic_mask(40, 50, "sparse", generator),
+                        synthetic_mask(40, 50, "dense", generator)))
+    for first, second in zip(*tensors):
+        assert torch.equal(first, second)
+    assert tensors[0][1].mean() < 0.1 and tensors[0][2].min() > 0
+    print("✅ Synthetic inputs are reproducible")
+
+
+def test_results_file():
+    """Cases over the memory limit are skipped and every case is written to the results file"""
+    print("🧪 Testing benchmark results file...")
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        output = os.path.join(output_dir, "results.json")
+        assert main(["--layers", "1", "50", "--canvas", "1k", "16k", "--compression", "rle",
+                     "--memory-limit", "0.001", "--output", output]) == 0
+        with open(output) as f:
+            results = json.load(f)
+
+    assert results["schema_version"] == 1
+    assert results["settings"]["grid"]["canvas"] == ["1k", "16k"]
+    assert [case["id"] for case in results["cases"]] == [
+        "layers1-1k-rle-sparse", "layers1-1k-rle-dense", "layers1-16k-rle-sparse", "layers1-16k-rle-dense",
+        "layers50-1k-rle-sparse", "layers50-1k-rle-dense", "layers50-16k-rle-sparse", "layers50-16k-rle-dense"]
+    assert all(case["status"] == "skipped" for case in results["cases"])
+    print("✅ Results file written")
+
+
+if __name__ == "__main__":
+    test_run_case()
+    test_inputs_are_reproducible()
+    test_results_file()
+    print("\n🎉 Benchmark tests passed!")
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the encoded channel cache: hits, eviction and on-disk entries
+"""
+
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from utils.apz_channel_cache import DISK_ENTRY_HEADER, ChannelCache
+
+PLANE_BYTES = 128 * 128
+
+
+def make_plane(value):
+    return np.full((128, 128), value, dtype=np.uint8)
+
+
+class CountingEncoder:
+    """Encodes a plane to its raw bytes and counts the calls"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, plane):
+        def encode():
+            self.calls += 1
+            return plane.tobytes()
+        return encode
+
+
+def test_memory_hits_and_eviction():
+    """A repeated plane is encoded once; the in-memory cache drops its least recently used entry"""
+    print("🧪 Testing in-memory channel cache...")
+
+    cache = ChannelCache(max_bytes=2 * PLANE_BYTES)
+    encoder = CountingEncoder()
+    planes = [make_plane(value) for value in (1, 2, 3)]
+
+    for _ in range(3):
+        assert cache.get_or_encode(planes[0], 1, encoder(planes[0])) == planes[0].tobytes()
+    assert (encoder.calls, cache.hits, cache.misses) == (1, 2, 1)
+
+    cache.get_or_encode(planes[1], 1, encoder(planes[1]))
+    cache.get_or_encode(planes[0], 1, encoder(planes[0]))  # planes[1] is now the least recently used
+    cache.get_or_encode(planes[2], 1, encoder(planes[2]))
+    assert cache.get(cache.make_key(planes[0], 1)) is not None
+    assert cache.get(cache.make_key(planes[1], 1)) is None
+    assert cache.get(cache.make_key(planes[0], 0)) is None, "compression is part of the key"
+    print("✅ In-memory cache hits and evicts")
+
+
+def test_disk_round_trip():
+    """Entries written by one cache are read by another; MB=0 disables only the memory tier"""
+    print("🧪 Testing on-disk channel cache...")
+
+    plane = make_plane(7)
+    with tempfile.TemporaryDirectory() as cache_dir:
+        encoder = CountingEncoder()
+        writer = ChannelCache(max_bytes=0, cache_dir=cache_dir)
+        writer.get_or_encode(plane, 1, encoder(plane))
+        assert writer.misses == 1 and encoder.calls == 1
+
+        reader = ChannelCache(max_bytes=0, cache_dir=cache_dir)
+        assert reader.get_or_encode(plane, 1, encoder(plane)) == plane.tobytes()
+        assert reader.hits == 1 and encoder.calls == 1
+
+        path = reader._disk_path(reader.make_key(plane, 1))
+        assert os.path.getsize(path) == DISK_ENTRY_HEADER.size + PLANE_BYTES
+    print("✅ On-disk entries round-trip")
+
+
+def test_corrupt_disk_entry_is_dropped():
+    """A truncated or altered entry is a miss, is deleted and is written again"""
+    print("🧪 Testing corrupt channel cache entries...")
+
+    plane = make_plane(9)
+    with tempfile.TemporaryDirectory() as cache_dir:
+        encoder = CountingEncoder()
+        writer = ChannelCache(max_bytes=0, cache_dir=cache_dir)
+        writer.get_or_encode(plane, 1, encoder(plane))
+        path = writer._disk_path(writer.make_key(plane, 1))
+
+        for damage in ("truncate", "flip"):
+            with open(path, "r+b") as f:
+                if damage == "truncate":
+                    f.truncate(DISK_ENTRY_HEADER.size + PLANE_BYTES // 2)
+                else:
+                    f.seek(DISK_ENTRY_HEADER.size + 10)
+                    f.write(b"\xff")
+
+            cache = ChannelCache(max_bytes=0, cache_dir=cache_dir)
+            assert cache.get(cache.make_key(plane, 1)) is None, damage
+            assert not os.path.exists(path)
+            calls = encoder.calls
+            assert cache.get_or_encode(plane, 1, encoder(plane)) == plane.tobytes()
+            assert encoder.calls == calls + 1 and os.path.exists(path)
+    print("✅ Corrupt entries dropped")
+
+
+def test_disk_eviction():
+    """The on-disk cache stays under its size limit by deleting the least recently used entries"""
+    print("🧪 Testing on-disk channel cache eviction...")
+
+    entry_bytes = DISK_ENTRY_HEADER.size + PLANE_BYTES
+    planes = [make_plane(value) for value in range(6)]
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = ChannelCache(max_bytes=0, cache_dir=cache_dir, max_disk_bytes=4 * entry_bytes)
+        encoder = CountingEncoder()
+        paths = []
+        for age, plane in enumerate(planes[:4]):
+            cache.get_or_encode(plane, 1, encoder(plane))
+            paths.append(cache._disk_path(cache.make_key(plane, 1)))
+            os.utime(paths[-1], (1000 + age, 1000 + age))
+        # Using the oldest entry makes it the most recently used
+        assert cache.get(cache.make_key(planes[0], 1)) is not None
+
+        for plane in planes[4:]:
+            cache.get_or_encode(plane, 1, encoder(plane))
+
+        total = sum(size for _, size, _ in cache._disk_entries())
+        assert total <= 4 * entry_bytes
+        assert os.path.exists(paths[0])
+        assert not os.path.exists(paths[1]) and not os.path.exists(paths[2])
+    print("✅ On-disk cache evicts down to its limit")
+
+
+if __name__ == "__main__":
+    test_memory_hits_and_eviction()
+    test_disk_round_trip()
+    test_corrupt_disk_entry_is_dropped()
+    test_disk_eviction()
+    print("\n🎉 Channel cache tests passed!")
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Test script to verify compact masks
+"""
+
+import os
+import sys
+
+import numpy as np
+import torch
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from utils.apz_compact_mask import CompactMask, compact_masks, expand_compact_masks
+from utils.apz_mask_engine import masks_from_uint8
+from utils.apz_psd_tools_utility import encode_layer_record
+
+
+def test_round_trip_and_channel():
+    """Compact masks convert back exactly and encode the same mask channel as the full mask"""
+    print("🧪 Testing compact masks...")
+
+    rng = np.random.RandomState(0)
+    sparse = np.zeros((60, 80), np.uint8)
+    sparse[10:30, 5:45] = rng.randint(0, 256, (20, 40))
+    solid = np.full((60, 80), 255, np.uint8)
+    solid[50:55, 70:78] = 0
+    masks = masks_from_uint8(np.stack([sparse, solid, np.zeros((60, 80), np.uint8)]))
+
+    for encoding in ("raw", "rle"):
+        compact = compact_masks(masks, encoding)
+        assert [mask.bbox for mask in compact] == [(5, 10, 45, 30), (70, 50, 78, 55), (0, 0, 0, 0)]
+        assert [mask.default_color for mask in compact] == [0, 255, 0]
+        assert compact[1].nbytes < 100
+        assert torch.equal(expand_compact_masks(compact), masks)
+
+        rgba = np.zeros((60, 80, 4), np.uint8)
+        for mask, full in zip(compact, (sparse, solid)):
+            for version in (1, 2):
+                expected_record, expected = encode_layer_record(rgba, "L", mask=full, version=version)
+                record, channels = encode_layer_record(rgba, "L", mask=mask, version=version)
+                assert channels[4].data == expected[4].data
+                assert record.mask_data.background_color == expected_record.mask_data.background_color
+
+    assert np.array_equal(np.asarray(CompactMask.from_tensor(masks[:1])), sparse)
+    print("✅ Compact masks are exact and write the same channels")
+
+
+if __name__ == "__main__":
+    test_round_trip_and_channel()
+    print("\n🎉 Compact mask test passed!")
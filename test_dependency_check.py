@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the dependency check is cached, cheap and never imports the dependencies
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from auto_installer import DependencyInstaller, requirement_satisfied
+
+# A check against an unchanged environment must stay under this many seconds
+WARM_CHECK_BUDGET_SECONDS = 0.001
+
+_CHECK_SCRIPT = """
+import json, sys
+sys.path.insert(0, sys.argv[1])
+from auto_installer import DependencyInstaller
+missing = DependencyInstaller(sys.argv[2]).check_dependencies(use_cache=False)
+print(json.dumps({"missing": [package[0] for package in missing],
+                  "loaded": [name for name in ("torch", "PIL", "psd_tools", "numpy") if name in sys.modules]}))
+"""
+
+
+def test_check_does_not_import_dependencies():
+    """A cold check finds the installed packages without importing any of them"""
+    print("🧪 Testing dependency check imports...")
+
+    root = os.path.dirname(os.path.abspath(__file__))
+    with tempfile.TemporaryDirectory() as cache_dir:
+        result = subprocess.run([sys.executable, "-c", _CHECK_SCRIPT, root, os.path.join(cache_dir, "deps.json")],
+                                capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    assert report["missing"] == []
+    assert report["loaded"] == [], f"Dependency check imported {report['loaded']}"
+    print("✅ Dependencies found without importing them")
+
+
+def test_warm_check_is_cached():
+    """A second check reuses the fingerprinted result and stays well under a millisecond"""
+    print("🧪 Testing cached dependency check...")
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        installer = DependencyInstaller(os.path.join(cache_dir, "deps.json"))
+        installer.check_dependencies()
+        with open(installer.cache_file) as f:
+            assert json.load(f)["fingerprint"] == installer.environment_fingerprint()
+
+        timings = []
+        for _ in range(20):
+            start = time.perf_counter()
+            assert installer.check_dependencies() == []
+            timings.append(time.perf_counter() - start)
+    assert min(timings) < WARM_CHECK_BUDGET_SECONDS, f"Warm check took {min(timings) * 1000:.3f} ms"
+    print(f"✅ Warm check took {min(timings) * 1000:.3f} ms")
+
+
+def test_missing_and_outdated_packages():
+    """Missing packages and unsatisfied version specs are reported; a changed spec invalidates the cache"""
+    print("🧪 Testing missing dependency detection...")
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        installer = DependencyInstaller(os.path.join(cache_dir, "deps.json"))
+        fingerprint = installer.environment_fingerprint()
+        installer.required_packages = installer.required_packages + [
+            ("apz_not_a_real_package", "apz-not-a-real-package>=1.0", "--user"),
+            ("numpy", "numpy>=999", "--user"),
+        ]
+        assert installer.environment_fingerprint() != fingerprint
+        missing = installer.check_dependencies()
+        assert [package[1] for package in missing] == ["apz-not-a-real-package>=1.0", "numpy>=999"]
+        assert installer.check_dependencies() == missing
+
+    assert requirement_satisfied("torch>=1.7.0", "2.1.0+cu118")
+    assert requirement_satisfied("psd-tools==1.9", "1.9.0")
+    assert not requirement_satisfied("Pillow>=8.0.0", "7.2.0")
+    assert not requirement_satisfied("numpy>=1.19.0", None)
+    print("✅ Missing and outdated packages detected")
+
+
+class _RecordingInstaller(DependencyInstaller):
+    """Records the packages it is asked to install instead of running pip"""
+
+    def __init__(self, cache_file):
+        super().__init__(cache_file)
+        self.installed = []
+
+    def install_package(self, package_name, package_spec, flags=None, force_reinstall=False):
+        self.installed.append((package_spec, force_reinstall))
+        return True
+
+
+def test_force_reinstall_covers_every_package():
+    """A forced reinstall runs pip --force-reinstall over every required package, installed or not"""
+    print("🧪 Testing forced reinstall...")
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        installer = _RecordingInstaller(os.path.join(cache_dir, "deps.json"))
+        assert installer.check_dependencies() == []
+        assert installer.force_reinstall_dependencies(silent=True)
+        assert installer.installed == [(package[1], True) for package in installer.required_packages]
+
+        installer.installed = []
+        assert installer.install_dependencies(silent=True)
+        assert installer.installed == []
+
+    command = installer.pip_command("psd-tools>=1.9.0", "--user", force_reinstall=True)
+    assert command[1:] == ["-m", "pip", "install", "--user", "--force-reinstall", "psd-tools>=1.9.0"]
+    assert "--force-reinstall" not in installer.pip_command("psd-tools>=1.9.0", "--user")
+    print("✅ Every package reinstalled")
+
+
+if __name__ == "__main__":
+    test_check_does_not_import_dependencies()
+    test_warm_check_is_cached()
+    test_missing_and_outdated_packages()
+    test_force_reinstall_covers_every_package()
+    print("\n🎉 Dependency check tests passed!")
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Test script to verify layers are created directly in the final document, without canvas-sized buffers
+"""
+
+import os
+import sys
+import tempfile
+import tracemalloc
+
+import numpy as np
+from PIL import Image
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from psd_tools import PSDImage
+from utils.apz_psd_tools_utility import build_psd_document, create_psd_document, create_simple_psd_layer
+
+
+def random_image(width, height, mode="RGB", seed=0):
+    channels = len(mode)
+    pixels = np.random.default_rng(seed).integers(0, 256, (height, width, channels), dtype=np.uint8)
+    return Image.fromarray(pixels, mode)
+
+
+def test_layer_creation_does_not_allocate_canvas():
+    """Adding a small layer to a large document allocates about the layer's size, not the canvas's"""
+    print("🧪 Testing layer creation memory...")
+
+    psd = create_psd_document(4000, 4000)
+    image = random_image(32, 32, "RGBA")
+    mask = Image.fromarray(np.tile(np.arange(32, dtype=np.uint8) * 8, (32, 1)), "L")
+
+    tracemalloc.start()
+    try:
+        layer = create_simple_psd_layer(image, "Small", mask, top=100, left=200, parent=psd)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    # A single canvas-sized RGBA plane set would be 64 MB
+    assert peak < 1024 * 1024, f"peak allocation {peak} bytes"
+    assert layer.parent is psd and list(psd) == [layer]
+    assert layer.bbox == (200, 100, 232, 132)
+    assert np.array_equal(np.asarray(layer.topil()), np.asarray(image))
+    print("✅ Layers created without canvas buffers")
+
+
+def test_document_layers_are_built_in_place():
+    """Every layer belongs to the document from the start, bottom to top, and survives a save"""
+    print("🧪 Testing in-place document build...")
+
+    images = [random_image(20, 10, "RGBA", seed=1), random_image(30, 30, seed=2), random_image(60, 40, seed=3)]
+    names = ["Top", "Middle", "Bottom"]
+    offsets = [(5, 5), (25, 8), (0, 0)]
+    psd = build_psd_document(images, names, layer_offsets=offsets)
+
+    assert psd.size == (60, 40)
+    assert [layer.name for layer in psd] == ["Bottom", "Middle", "Top"]
+    assert all(layer.parent is psd for layer in psd)
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        path = os.path.join(output_dir, "built.psd")
+        psd.save(path)
+        reopened = PSDImage.open(path)
+        for layer, image, (left, top) in zip(reopened, reversed(images), reversed(offsets)):
+            assert layer.bbox == (left, top, left + image.width, top + image.height)
+            assert np.array_equal(np.asarray(layer.topil().convert(image.mode)), np.asarray(image))
+    print("✅ Document built in place")
+
+
+def test_standalone_layer():
+    """Without a parent a layer is created against a 1x1 document"""
+    print("🧪 Testing standalone layer...")
+
+    image = random_image(8, 6, seed=4)
+    layer = create_simple_psd_layer(image, "Alone")
+    assert layer.parent.size == (1, 1)
+    assert layer.size == (8, 6) and not layer.has_mask()
+    assert np.array_equal(np.asarray(layer.topil().convert("RGB")), np.asarray(image))
+    print("✅ Standalone layer created")
+
+
+if __name__ == "__main__":
+    test_layer_creation_does_not_allocate_canvas()
+    test_document_layers_are_built_in_place()
+    test_standalone_layer()
+    print("\n🎉 Document build tests passed!")
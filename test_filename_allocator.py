@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Test script to verify output filenames are claimed uniquely
+"""
+
+import os
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from utils.apz_filename_allocator import allocate_filename, allocate_filenames, reset_filename_counters
+
+
+def test_concurrent_allocations_are_unique():
+    """Concurrent savers never get the same name, and files made elsewhere are skipped"""
+    print("🧪 Testing filename allocation...")
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        open(os.path.join(output_dir, "output.psd"), "wb").close()
+        open(os.path.join(output_dir, "output_007.psd"), "wb").close()
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            paths = list(executor.map(lambda _: allocate_filename("output.psd", output_dir), range(20)))
+        names = sorted(os.path.basename(path) for path in paths)
+        assert names == [f"output_{i:03d}.psd" for i in range(8, 28)]
+
+        # Another process claims the next name behind our cached counter
+        open(os.path.join(output_dir, "output_028.psd"), "wb").close()
+        assert os.path.basename(allocate_filename("output.psd", output_dir)) == "output_029.psd"
+
+        reset_filename_counters()
+        assert os.path.basename(allocate_filename("output.psd", output_dir)) == "output_030.psd"
+        assert allocate_filename("output.psd", output_dir, overwrite=True) == os.path.join(output_dir, "output.psd")
+        print("✅ Filenames are unique")
+
+
+def test_numbered_runs_continue_the_sequence():
+    """Batch names are all numbered and pick up where the plain sequence left off"""
+    print("🧪 Testing numbered filename runs...")
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        names = [os.path.basename(path) for path in allocate_filenames("batch.psd", 2, output_dir)]
+        assert names == ["batch_001.psd", "batch_002.psd"]
+        assert os.path.basename(allocate_filename("batch.psd", output_dir)) == "batch_003.psd"
+
+        reset_filename_counters()
+        names = [os.path.basename(path) for path in allocate_filenames("batch.psd", 2, output_dir)]
+        assert names == ["batch_004.psd", "batch_005.psd"]
+        assert allocate_filenames("batch.psd", 2, output_dir, overwrite=True) == \
+            [os.path.join(output_dir, "batch_001.psd"), os.path.join(output_dir, "batch_002.psd")]
+        assert len(os.listdir(output_dir)) == 5
+    print("✅ Numbered runs continue the sequence")
+
+
+if __name__ == "__main__":
+    test_concurrent_allocations_are_unique()
+    test_numbered_runs_continue_the_sequence()
+    print("\n🎉 Filename allocation tests passed!")
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Test script to verify importing the extension is fast and side-effect free
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from utils.apz_startup_profile import BUDGET_ENV, PROFILE_ENV, startup_budget_seconds
+
+# Importing the package (as ComfyUI does) must stay within this many seconds (APZ_PSD_STARTUP_BUDGET)
+IMPORT_BUDGET_SECONDS = startup_budget_seconds()
+
+HEAVY_MODULES = ("torch", "PIL", "psd_tools", "numpy")
+
+# Loads the extension the way ComfyUI loads custom nodes, in a fresh interpreter
+_IMPORT_SCRIPT = """
+import importlib.util, json, os, sys, time
+root = sys.argv[1]
+start = time.perf_counter()
+spec = importlib.util.spec_from_file_location("apz_psd_tools_extension", os.path.join(root, "__init__.py"),
+                                              submodule_search_locations=[root])
+module = importlib.util.module_from_spec(spec)
+sys.modules[spec.name] = module
+spec.loader.exec_module(module)
+seconds = time.perf_counter() - start
+for node_class in module.NODE_CLASS_MAPPINGS.values():
+    node_class.INPUT_TYPES()
+print(json.dumps({
+    "seconds": seconds,
+    "nodes": sorted(module.NODE_CLASS_MAPPINGS),
+    "loaded": [name for name in %r if name in sys.modules],
+}))
+""" % (HEAVY_MODULES,)
+
+# Loads the extension after another "utils" package, as in ComfyUI, and
+# checks every utility module is loaded once
+_SHADOWED_SCRIPT = """
+import importlib.util, json, os, sys, types
+root = sys.argv[1]
+sys.modules["utils"] = types.ModuleType("utils")
+sys.modules["utils"].__path__ = []
+spec = importlib.util.spec_from_file_location("apz_psd_tools_extension", os.path.join(root, "__init__.py"),
+                                              submodule_search_locations=[root])
+module = importlib.util.module_from_spec(spec)
+sys.modules[spec.name] = module
+spec.loader.exec_module(module)
+lazy_import = sys.modules["apz_lazy_import"]
+psd_tools_utility = lazy_import.load_utility("apz_psd_tools_utility")
+backends = lazy_import.load_utility("apz_psd_backends")
+compact_mask = lazy_import.load_utility("apz_compact_mask")
+channel_cache = lazy_import.load_utility("apz_channel_cache")
+stack_node = sys.modules["apz_psd_tools_extension.nodes.apzPSDLayerStack"]
+print(json.dumps({
+    "compact_mask": backends.CompactMask is psd_tools_utility.CompactMask is compact_mask.CompactMask,
+    "channel_cache": psd_tools_utility.get_channel_cache() is channel_cache.get_channel_cache(),
+    "layer_stack": stack_node.PSDLayerStack is lazy_import.load_utility("apz_psd_layer_stack").PSDLayerStack,
+    "copies": sorted(name for name in sys.modules if name.split(".")[-1] == "apz_compact_mask"),
+}))
+"""
+
+
+def test_package_import_is_lazy():
+    """Registering the nodes imports neither psd-tools, PIL nor torch, and stays within the budget"""
+    print("🧪 Testing package import...")
+
+    root = os.path.dirname(os.path.abspath(__file__))
+    result = subprocess.run([sys.executable, "-c", _IMPORT_SCRIPT, root],
+                            capture_output=True, text=True, timeout=60, cwd=root)
+    assert result.returncode == 0, result.stderr
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+
+    assert len(report["nodes"]) == 7, report["nodes"]
+    assert report["loaded"] == [], f"Heavy modules imported at startup: {report['loaded']}"
+    assert report["seconds"] < IMPORT_BUDGET_SECONDS, f"Import took {report['seconds']:.3f} s"
+    print(f"✅ Package imported in {report['seconds'] * 1000:.1f} ms")
+
+
+def test_shadowed_utils_load_once():
+    """With another "utils" package imported first, each utility module is loaded once"""
+    print("🧪 Testing utility imports under a shadowed utils package...")
+
+    root = os.path.dirname(os.path.abspath(__file__))
+    result = subprocess.run([sys.executable, "-c", _SHADOWED_SCRIPT, root],
+                            capture_output=True, text=True, timeout=120, cwd=root)
+    assert result.returncode == 0, result.stderr
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+
+    assert report["compact_mask"] and report["channel_cache"] and report["layer_stack"], report
+    assert report["copies"] == ["apz_psd_tools_utils.apz_compact_mask"], report["copies"]
+    print("✅ Utility modules loaded once")
+
+
+def test_startup_profile_report():
+    """The profiling mode reports every startup phase, and startup stays within the configured budget"""
+    print("🧪 Testing startup profile report...")
+
+    root = os.path.dirname(os.path.abspath(__file__))
+    with tempfile.TemporaryDirectory() as output_dir:
+        report_path = os.path.join(output_dir, "startup.json")
+        env = dict(os.environ, **{PROFILE_ENV: report_path, BUDGET_ENV: str(IMPORT_BUDGET_SECONDS)})
+        result = subprocess.run([sys.executable, "-c", _IMPORT_SCRIPT, root],
+                                capture_output=True, text=True, timeout=300, cwd=root, env=env)
+        assert result.returncode == 0, result.stderr
+        with open(report_path) as f:
+            report = json.load(f)
+
+    kinds = {}
+    for phase in report["phases"]:
+        assert phase["error"] is None, phase
+        kinds.setdefault(phase["kind"], []).append(phase["name"])
+    assert kinds["dependency_check"] == ["auto_installer.check_dependencies"]
+    assert len(kinds["node_import"]) == 5, kinds["node_import"]
+    assert "apz_psd_tools_utility" in kinds["utility_import"]
+    assert report["registered_nodes"] == 7
+    assert f"report: {report_path}" in result.stdout
+
+    assert report["within_budget"], (f"Startup took {report['startup_seconds'] * 1000:.1f} ms, "
+                                     f"budget {report['budget_seconds'] * 1000:.1f} ms")
+    print(f"✅ Startup profiled at {report['startup_seconds'] * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    test_package_import_is_lazy()
+    test_shadowed_utils_load_once()
+    test_startup_profile_report()
+    print("\n🎉 Import time tests passed!")
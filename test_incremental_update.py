@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Test script to verify in-place PSD updates re-encode only changed layers
+"""
+
+import os
+import sys
+import tempfile
+
+import numpy as np
+import torch
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "nodes"))
+
+from psd_tools import PSDImage
+from utils.apz_psd_tools_utility import process_layers_to_psd
+from utils.apz_tensor_conversion import image_tensor_to_uint8
+from apzPSDLayerSaverMultilayer import APZmediaPSDLayerSaverMultilayer
+from apzPSDLayerStack import APZmediaPSDLayerStackAdd, APZmediaPSDLayerStackSaver
+
+
+def _layer_pixels(psd):
+    return [(layer.name, layer.bbox, np.asarray(layer.topil())) for layer in psd]
+
+
+def test_update_matches_full_write():
+    """An updated file has the same layers and composite as a file written from scratch"""
+    print("🧪 Testing in-place PSD update...")
+
+    torch.manual_seed(0)
+    images = [torch.rand(1, 40, 60, 3) for _ in range(4)]
+    masks = [torch.rand(1, 40, 60), None, None, None]
+    names = ["Top", "Upper", "Lower", "Bottom"]
+    offsets = [(0, 0), (60, 0), (0, 40), (60, 40)]
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        path, ok = process_layers_to_psd(images, names, masks, output_dir, "doc",
+                                         layer_offsets=offsets, update_existing=True)
+        assert ok
+
+        images[1] = torch.rand(1, 40, 60, 3)
+        updated_path, ok = process_layers_to_psd(images, names, masks, output_dir, "doc",
+                                                 layer_offsets=offsets, update_existing=True)
+        assert ok and updated_path == path
+
+        reference_path, ok = process_layers_to_psd(images, names, masks, output_dir, "reference",
+                                                   layer_offsets=offsets)
+        assert ok
+
+        updated, reference = PSDImage.open(updated_path), PSDImage.open(reference_path)
+        for (name, bbox, pixels), (ref_name, ref_bbox, ref_pixels) in zip(_layer_pixels(updated),
+                                                                         _layer_pixels(reference)):
+            assert (name, bbox) == (ref_name, ref_bbox)
+            assert np.array_equal(pixels, ref_pixels)
+        assert np.array_equal(np.asarray(updated.topil()), np.asarray(reference.topil()))
+        assert np.array_equal(np.asarray(updated[-1].mask.topil()), np.asarray(reference[-1].mask.topil()))
+        print("✅ Updated file matches a full write")
+
+
+def test_reordered_layers_recomposite():
+    """Swapping two layers updates the merged image, though no layer content changed"""
+    print("🧪 Testing in-place update of reordered layers...")
+
+    red = torch.zeros(1, 20, 30, 3)
+    red[..., 0] = 1.0
+    blue = torch.zeros(1, 20, 30, 3)
+    blue[..., 2] = 1.0
+    background = torch.ones(1, 40, 60, 3) * 0.5
+    names = ["Red", "Blue", "Background"]
+    offsets = [(10, 10), (10, 10), (0, 0)]
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        path, ok = process_layers_to_psd([red, blue, background], names, None, output_dir, "doc",
+                                         layer_offsets=offsets, update_existing=True)
+        assert ok
+        assert tuple(np.asarray(PSDImage.open(path).topil())[15, 15, :3]) == (255, 0, 0)
+
+        swapped = [names[1], names[0], names[2]]
+        updated_path, ok = process_layers_to_psd([blue, red, background], swapped, None, output_dir, "doc",
+                                                 layer_offsets=offsets, update_existing=True)
+        assert ok and updated_path == path
+        reference_path, ok = process_layers_to_psd([blue, red, background], swapped, None, output_dir,
+                                                   "reference", layer_offsets=offsets)
+        assert ok
+
+        updated, reference = PSDImage.open(updated_path), PSDImage.open(reference_path)
+        assert [layer.name for layer in updated] == [layer.name for layer in reference]
+        assert np.array_equal(np.asarray(updated.topil()), np.asarray(reference.topil()))
+        assert tuple(np.asarray(updated.topil())[15, 15, :3]) == (0, 0, 255)
+        print("✅ Reordered layers are recomposited")
+
+
+def test_batch_files_update_in_place():
+    """In "files" mode every batch element updates its own fixed file; unchanged layers keep their bytes"""
+    print("🧪 Testing in-place update of batch files...")
+
+    torch.manual_seed(2)
+    items, base = torch.rand(2, 20, 30, 3), torch.rand(1, 20, 30, 3)
+
+    def save(output_dir):
+        APZmediaPSDLayerSaverMultilayer().save_psd_layers(
+            output_dir=output_dir, filename_prefix="shot", overwrite_mode="update", batch_mode="files",
+            layer1=items, layer_name1="Item", layer2=base, layer_name2="Base")
+        return [PSDImage.open(os.path.join(output_dir, f"shot_{b:03d}.psd")) for b in (1, 2)]
+
+    def channel_bytes(layer):
+        return [data.data for data in layer._channels]
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        before = save(output_dir)
+        items = items.clone()
+        items[1] = torch.rand(20, 30, 3)
+        after = save(output_dir)
+        assert sorted(os.listdir(output_dir)) == ["shot_001.psd", "shot_002.psd"]
+
+        assert [channel_bytes(layer) for layer in after[0]] == [channel_bytes(layer) for layer in before[0]]
+        assert channel_bytes(after[1][0]) == channel_bytes(before[1][0])
+        assert np.array_equal(np.asarray(after[1][1].topil().convert('RGB')), image_tensor_to_uint8(items)[1])
+    print("✅ Batch files updated in place")
+
+
+def test_update_does_not_resolve_write_backend():
+    """Updates never pick a write backend, so one that cannot be resolved does not stop them"""
+    print("🧪 Testing updates without a write backend...")
+
+    image = torch.rand(2, 16, 16, 3)
+    stack, = APZmediaPSDLayerStackAdd().add_layer(image[:1], layer_name="Layer")
+    os.environ["APZ_PSD_BACKEND_WRITE"] = "unknown"
+    try:
+        with tempfile.TemporaryDirectory() as output_dir:
+            node = APZmediaPSDLayerSaverMultilayer()
+            node.save_psd_layers(output_dir=output_dir, filename_prefix="single", overwrite_mode="update",
+                                 layer1=image[:1], layer_name1="Layer")
+            node.save_psd_layers(output_dir=output_dir, filename_prefix="batch", overwrite_mode="update",
+                                 batch_mode="files", layer1=image, layer_name1="Layer")
+            APZmediaPSDLayerStackSaver().save_layer_stack(stack, output_dir=output_dir, filename_prefix="stack",
+                                                          update_existing="true")
+            assert sorted(os.listdir(output_dir)) == ["batch_001.psd", "batch_002.psd", "single.psd", "stack.psd"]
+    finally:
+        del os.environ["APZ_PSD_BACKEND_WRITE"]
+    print("✅ Updates skip the write backend")
+
+
+if __name__ == "__main__":
+    test_update_matches_full_write()
+    test_reordered_layers_recomposite()
+    test_batch_files_update_in_place()
+    test_update_does_not_resolve_write_backend()
+    print("\n🎉 Incremental update tests passed!")
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Test script to verify layers are stored at their native size, at the position the placement mode gives them
+"""
+
+import os
+import sys
+import tempfile
+
+import numpy as np
+import torch
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "nodes"))
+
+from psd_tools import PSDImage
+from utils.apz_psd_tools_utility import process_layers_to_psd, resolve_layer_offsets
+from utils.apz_tensor_conversion import image_tensor_to_uint8
+from apzPSDLayerSaverMultilayer import APZmediaPSDLayerSaverMultilayer
+
+
+def make_layers():
+    torch.manual_seed(0)
+    return torch.rand(1, 10, 20, 3), torch.rand(1, 30, 40, 3)
+
+
+def save_with_placement(output_dir, placement, **offsets):
+    small, large = make_layers()
+    APZmediaPSDLayerSaverMultilayer().save_psd_layers(
+        output_dir=output_dir, filename_prefix=placement, placement=placement,
+        layer1=small, layer_name1="Small", layer2=large, layer_name2="Large", **offsets)
+    return PSDImage.open(os.path.join(output_dir, f"{placement}.psd"))
+
+
+def test_layers_keep_native_size():
+    """A small layer is not padded to the canvas: its record holds only its own pixels"""
+    print("🧪 Testing native layer size...")
+
+    small, large = make_layers()
+    with tempfile.TemporaryDirectory() as output_dir:
+        psd = save_with_placement(output_dir, "center")
+        assert psd.size == (40, 30)
+        assert psd[1].name == "Small"
+        assert psd[1].size == (20, 10) and psd[1].bbox == (10, 10, 30, 20)
+        assert psd[0].bbox == (0, 0, 40, 30)
+        assert np.array_equal(np.asarray(psd[1].topil().convert('RGB')), image_tensor_to_uint8(small)[0])
+        assert np.array_equal(np.asarray(psd[0].topil().convert('RGB')), image_tensor_to_uint8(large)[0])
+    print("✅ Layers stored at native size")
+
+
+def test_placement_modes():
+    """top_left puts every layer at 0, 0; offset uses the per-layer inputs and grows the canvas to fit"""
+    print("🧪 Testing placement modes...")
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        psd = save_with_placement(output_dir, "top_left", offset_x1=25, offset_y1=25)
+        assert psd.size == (40, 30)
+        assert psd[1].bbox == (0, 0, 20, 10) and psd[0].bbox == (0, 0, 40, 30)
+
+        psd = save_with_placement(output_dir, "offset", offset_x1=35, offset_y1=28, offset_x2=5, offset_y2=2)
+        assert psd.size == (55, 38)
+        assert psd[1].bbox == (35, 28, 55, 38) and psd[0].bbox == (5, 2, 45, 32)
+        # Offsets only count in "offset" mode
+        psd = save_with_placement(output_dir, "center", offset_x1=35, offset_y1=28)
+        assert psd[1].bbox == (10, 10, 30, 20)
+    print("✅ Placement modes applied")
+
+
+def test_mixed_offsets_and_resolution():
+    """Layers without an offset are centered on the canvas the placed layers span"""
+    print("🧪 Testing mixed placement...")
+
+    assert resolve_layer_offsets("center", [(3, 4)], 3) == [(3, 4), None, None]
+    assert resolve_layer_offsets("offset", [None, (3, 4)], 3) == [(0, 0), (3, 4), (0, 0)]
+    assert resolve_layer_offsets("top_left", [(3, 4)], 2) == [(0, 0), (0, 0)]
+    try:
+        resolve_layer_offsets("middle", None, 1)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("unknown placement accepted")
+
+    small, large = make_layers()
+    with tempfile.TemporaryDirectory() as output_dir:
+        path, ok = process_layers_to_psd([small, large], ["Small", "Large"], None, output_dir, "mixed",
+                                         layer_offsets=[None, (20, 10)])
+        assert ok
+        psd = PSDImage.open(path)
+        assert psd.size == (60, 40)
+        assert psd[0].bbox == (20, 10, 60, 40) and psd[1].bbox == (20, 15, 40, 25)
+    print("✅ Unplaced layers centered")
+
+
+if __name__ == "__main__":
+    test_layers_keep_native_size()
+    test_placement_modes()
+    test_mixed_offsets_and_resolution()
+    print("\n🎉 Layer placement tests passed!")
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the layer stack nodes build and save documents with any number of layers
+"""
+
+import os
+import sys
+import tempfile
+
+import numpy as np
+import torch
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "nodes"))
+
+from psd_tools import PSDImage
+from utils.apz_psd_layer_stack import PSDLayerEntry, PSDLayerStack
+from utils.apz_tensor_conversion import image_tensor_to_uint8
+from apzPSDLayerStack import APZmediaPSDLayerStackAdd, APZmediaPSDLayerStackMerge, APZmediaPSDLayerStackSaver
+
+
+def solid_image(height, width, value):
+    return torch.full((1, height, width, 3), value / 255)
+
+
+def test_stack_longer_than_saver_inputs():
+    """Fifteen chained layers (more than the multilayer saver's ten inputs) are saved in stack order"""
+    print("🧪 Testing long layer stack...")
+
+    add = APZmediaPSDLayerStackAdd()
+    stack = None
+    for index in range(15):
+        stack, = add.add_layer(solid_image(8, 8, 10 * index), layer_name=f"L{index:02d}", layer_stack=stack,
+                               placement="offset", offset_x=index, offset_y=2 * index,
+                               blend_mode="multiply" if index % 2 else "normal")
+    background, = add.add_layer(solid_image(40, 40, 200), layer_name="Background")
+    stack, = APZmediaPSDLayerStackMerge().merge_stacks(stack, background)
+    assert len(stack) == 16
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        APZmediaPSDLayerStackSaver().save_layer_stack(stack, output_dir=output_dir, filename_prefix="stack")
+        psd = PSDImage.open(os.path.join(output_dir, "stack.psd"))
+
+        # The last added layer is on top; psd-tools lists layers bottom first
+        assert psd.size == (40, 40)
+        assert [layer.name for layer in psd] == ["Background"] + [f"L{index:02d}" for index in range(15)]
+        for index, layer in enumerate(list(psd)[1:]):
+            assert layer.bbox == (index, 2 * index, index + 8, 2 * index + 8)
+            assert layer.blend_mode.name.lower() == ("multiply" if index % 2 else "normal")
+            assert np.array_equal(np.asarray(layer.topil().convert('RGB')),
+                                  image_tensor_to_uint8(solid_image(8, 8, 10 * index))[0])
+    print("✅ Long layer stack saved in order")
+
+
+def test_stacks_are_not_modified():
+    """Adding to or merging a stack returns a new stack and leaves the input as it was"""
+    print("🧪 Testing layer stack immutability...")
+
+    add = APZmediaPSDLayerStackAdd()
+    base, = add.add_layer(solid_image(4, 4, 0), layer_name="Base")
+    top, = add.add_layer(solid_image(4, 4, 255), layer_name="Top", layer_stack=base)
+    assert [entry.name for entry in base] == ["Base"]
+    assert [entry.name for entry in top] == ["Top", "Base"]
+    assert top[1] is base[0]
+    assert top[0].offset is None
+
+    merged, = APZmediaPSDLayerStackMerge().merge_stacks(base, top)
+    assert [entry.name for entry in merged] == ["Base", "Top", "Base"]
+    assert len(base) == 1 and len(top) == 2
+
+    images, masks, names, offsets, blend_modes = merged.as_lists()
+    assert names == ["Base", "Top", "Base"] and masks == [None] * 3 and offsets == [None] * 3
+    assert blend_modes == ["normal"] * 3 and images[1] is top[0].image
+
+    for bad in (dict(image=None), dict(image=solid_image(4, 4, 0), blend_mode="glow")):
+        try:
+            PSDLayerEntry(**bad)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError(f"invalid entry accepted: {bad}")
+    assert len(PSDLayerStack()) == 0
+    print("✅ Layer stacks are immutable")
+
+
+def test_empty_stack_writes_nothing():
+    """Saving an empty stack logs an error and creates no file"""
+    print("🧪 Testing empty layer stack...")
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        APZmediaPSDLayerStackSaver().save_layer_stack(PSDLayerStack(), output_dir=output_dir, filename_prefix="empty")
+        assert os.listdir(output_dir) == []
+    print("✅ Empty layer stack skipped")
+
+
+if __name__ == "__main__":
+    test_stack_longer_than_saver_inputs()
+    test_stacks_are_not_modified()
+    test_empty_stack_writes_nothing()
+    print("\n🎉 Layer stack tests passed!")
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Test script to verify layers are trimmed to their visible bounding box on save
+"""
+
+import inspect
+import os
+import sys
+import tempfile
+
+import numpy as np
+import torch
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "nodes"))
+
+from psd_tools import PSDImage
+from utils.apz_psd_tools_utility import process_layers_to_psd
+from apzPSDLayerSaverMultilayer import APZmediaPSDLayerSaverMultilayer
+from apzPSDLayerStack import APZmediaPSDLayerStackSaver
+
+
+def solid_image(height, width, color):
+    image = torch.zeros(1, height, width, 3)
+    image[..., :] = torch.tensor(color, dtype=torch.float32) / 255
+    return image
+
+
+def test_trimmed_layers_match_full_layers():
+    """Masked layers are cropped to their mask's box and the composite is unchanged"""
+    print("🧪 Testing trimmed layers...")
+
+    box_mask = torch.zeros(1, 64, 64)
+    box_mask[:, 8:24, 16:48] = 1
+    image_tensors = [solid_image(64, 64, (255, 0, 0)), solid_image(64, 64, (0, 0, 255))]
+    mask_tensors = [box_mask, None]
+    layer_names = ["Box", "Base"]
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        trimmed_path, success = process_layers_to_psd(image_tensors, layer_names, mask_tensors, output_dir,
+                                                      "trimmed", trim_layers=True)
+        assert success
+        full_path, success = process_layers_to_psd(image_tensors, layer_names, mask_tensors, output_dir, "full")
+        assert success
+
+        trimmed, full = PSDImage.open(trimmed_path), PSDImage.open(full_path)
+        assert [layer.name for layer in trimmed] == [layer.name for layer in full] == ["Base", "Box"]
+        assert [layer.bbox for layer in trimmed] == [(0, 0, 64, 64), (16, 8, 48, 24)]
+        assert [layer.bbox for layer in full] == [(0, 0, 64, 64)] * 2
+        assert np.array_equal(np.asarray(trimmed.topil()), np.asarray(full.topil()))
+    print("✅ Trimmed layers match full layers")
+
+
+def test_sparse_rgba_layer_is_trimmed_by_default():
+    """A small opaque region of a large RGBA layer is stored alone, at its offset, without any setting"""
+    print("🧪 Testing default trimming...")
+
+    logo = torch.zeros(1, 300, 400, 4)
+    logo[:, 100:130, 250:280] = 1
+    with tempfile.TemporaryDirectory() as output_dir:
+        APZmediaPSDLayerSaverMultilayer().save_psd_layers(output_dir=output_dir, filename_prefix="logo",
+                                                          layer1=logo, layer_name1="Logo")
+        layer = PSDImage.open(os.path.join(output_dir, "logo.psd"))[0]
+        assert layer.bbox == (250, 100, 280, 130)
+        assert np.asarray(layer.topil())[..., 3].min() == 255
+
+    for node, method in ((APZmediaPSDLayerSaverMultilayer, "save_psd_layers"),
+                         (APZmediaPSDLayerStackSaver, "save_layer_stack")):
+        assert node.INPUT_TYPES()["optional"]["trim_layers"][1]["default"] == "true"
+        assert inspect.signature(getattr(node, method)).parameters["trim_layers"].default == "true"
+    print("✅ Layers trimmed by default")
+
+
+def test_fully_transparent_layer_is_skipped_when_trimming():
+    """A layer whose mask hides everything has nothing to store and is left out"""
+    print("🧪 Testing fully transparent layers...")
+
+    image_tensors = [solid_image(32, 32, (0, 255, 0)), solid_image(32, 32, (0, 0, 255))]
+    with tempfile.TemporaryDirectory() as output_dir:
+        path, success = process_layers_to_psd(image_tensors, ["Hidden", "Base"], [torch.zeros(1, 32, 32), None],
+                                              output_dir, "hidden", trim_layers=True)
+        assert success
+        assert [layer.name for layer in PSDImage.open(path)] == ["Base"]
+    print("✅ Fully transparent layers skipped")
+
+
+if __name__ == "__main__":
+    test_trimmed_layers_match_full_layers()
+    test_sparse_rgba_layer_is_trimmed_by_default()
+    test_fully_transparent_layer_is_skipped_when_trimming()
+    print("\n🎉 Layer trimming tests passed!")
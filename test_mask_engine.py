@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the batched mask engine
+"""
+
+import os
+import sys
+
+import numpy as np
+import torch
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from utils.apz_mask_engine import (
+    MASK_RESIZE_FILTERS, combine_masks, invert_masks, normalize_masks, resize_mask_arrays,
+    resize_masks, subtract_masks, threshold_masks
+)
+
+
+def test_operations_match_reference():
+    """In-place batch operations give the element-wise reference results"""
+    print("🧪 Testing mask engine operations...")
+
+    torch.manual_seed(0)
+    masks = torch.rand(3, 17, 23)
+    other = torch.rand(1, 17, 23)
+
+    result = masks.clone()
+    assert invert_masks(result).data_ptr() == result.data_ptr()
+    assert torch.allclose(result, 1 - masks)
+
+    assert torch.allclose(subtract_masks(masks.clone(), other), (masks - other).clamp(min=0))
+    assert torch.equal(threshold_masks(masks.clone(), 0.5), (masks >= 0.5).float())
+
+    assert torch.equal(combine_masks(masks, "union"), masks.amax(dim=0, keepdim=True))
+    assert torch.equal(combine_masks(list(masks), "intersection"), masks.amin(dim=0, keepdim=True))
+    assert torch.allclose(combine_masks(masks, "subtract"),
+                          (masks[:1] - masks[1:].amax(dim=0, keepdim=True)).clamp(min=0))
+    print("✅ Operations match the reference")
+
+
+def test_normalize_per_mask():
+    """Each mask of a batch is normalized from its own range, copying only when needed"""
+    print("🧪 Testing mask normalization...")
+
+    unit = torch.rand(2, 8, 8)
+    assert normalize_masks(unit, inplace=False) is unit
+
+    masks = torch.stack([torch.full((8, 8), 0.25), torch.full((8, 8), 51.0), torch.linspace(-2, 2, 64).view(8, 8)])
+    result = normalize_masks(masks, inplace=False)
+    assert result is not masks and masks[1, 0, 0] == 51.0
+    assert torch.allclose(result[0], torch.full((8, 8), 0.25))
+    assert torch.allclose(result[1], torch.full((8, 8), 0.2))
+    assert result[2].min() == 0 and torch.isclose(result[2].max(), torch.tensor(1.0))
+    print("✅ Masks normalized from their own ranges")
+
+
+def test_resize_mask_arrays_batches_by_size():
+    """Masks resized as groups match resizing each one alone, for every filter"""
+    print("🧪 Testing batched mask resizing...")
+
+    rng = np.random.RandomState(0)
+    masks = [(rng.rand(40, 30) * 255).astype(np.uint8) for _ in range(3)] + [np.zeros((12, 12), np.uint8)]
+    sizes = [(20, 15), (20, 15), (40, 30), (25, 25)]
+
+    for resize_filter in MASK_RESIZE_FILTERS:
+        resized = resize_mask_arrays(masks, sizes, resize_filter)
+        assert [mask.shape for mask in resized] == sizes
+        assert resized[2] is masks[2]
+        alone = resize_masks(torch.from_numpy(masks[1]).float().div(255)[None], 20, 15, resize_filter)
+        assert np.abs(resized[1].astype(int) - np.rint(alone[0].numpy() * 255).astype(int)).max() <= 1
+    print("✅ Batched resizing matches per-mask resizing")
+
+
+if __name__ == "__main__":
+    test_operations_match_reference()
+    test_normalize_per_mask()
+    test_resize_mask_arrays_batches_by_size()
+    print("\n🎉 Mask engine tests passed!")
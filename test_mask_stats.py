@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Test script to verify single-pass mask statistics
+"""
+
+import os
+import sys
+import tempfile
+
+import numpy as np
+import torch
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from psd_tools import PSDImage
+from utils import apz_mask_stats
+from utils.apz_mask_stats import compute_mask_stats
+from utils.apz_psd_stream_writer import process_layers_to_psd_in_strips
+from utils.apz_psd_tools_utility import process_layers_to_psd
+
+
+def test_stats_match_reference():
+    """Coverage, bbox, extrema and flags match a per-mask numpy reference, across chunks"""
+    print("🧪 Testing mask statistics...")
+
+    torch.manual_seed(0)
+    masks = torch.zeros(4, 45, 70)
+    masks[0, 7:31, 12:50] = torch.rand(24, 38)
+    masks[1, 44, 0] = 0.25
+    masks[3] = 1
+
+    original_chunk = apz_mask_stats.CHUNK_ELEMENTS
+    apz_mask_stats.CHUNK_ELEMENTS = 4 * 70 * 3  # Three rows per chunk
+    try:
+        stats = compute_mask_stats(masks)
+    finally:
+        apz_mask_stats.CHUNK_ELEMENTS = original_chunk
+
+    for mask, mask_stats in zip(masks.numpy(), stats):
+        rows, cols = np.flatnonzero(mask.any(axis=1)), np.flatnonzero(mask.any(axis=0))
+        bbox = (cols[0], rows[0], cols[-1] + 1, rows[-1] + 1) if rows.size else None
+        assert mask_stats.bbox == bbox
+        assert np.isclose(mask_stats.coverage, 100 * np.count_nonzero(mask) / mask.size)
+        assert (mask_stats.minimum, mask_stats.maximum) == (mask.min(), mask.max())
+        assert mask_stats.is_empty == (not mask.any()) and mask_stats.is_full == bool((mask == 1).all())
+
+    assert compute_mask_stats(np.full((3, 3), 255, np.uint8))[0].is_full
+    print("✅ Statistics match the reference")
+
+
+def test_saver_skips_invisible_layers():
+    """Layers showing nothing are left out with trimming off; an all-white mask is dropped"""
+    print("🧪 Testing invisible layers...")
+
+    torch.manual_seed(0)
+    transparent = torch.rand(1, 16, 16, 4)
+    transparent[..., 3] = 0
+    # Alpha and mask are each partly visible, but never in the same place
+    disjoint = torch.rand(1, 16, 16, 4)
+    disjoint[:, :, :8, 3] = 0
+    disjoint_mask = torch.zeros(1, 16, 16)
+    disjoint_mask[:, :, :8] = 1
+    images = [torch.rand(1, 16, 16, 3), transparent, disjoint, torch.rand(1, 16, 16, 3), torch.rand(1, 16, 16, 3)]
+    masks = [torch.zeros(1, 16, 16), None, disjoint_mask, torch.ones(1, 16, 16), None]
+    names = ["Black mask", "Transparent", "Disjoint", "White mask", "Base"]
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        for write in (process_layers_to_psd, process_layers_to_psd_in_strips):
+            path, ok = write(images, names, masks, output_dir, write.__name__, trim_layers=False)
+            assert ok
+            psd = PSDImage.open(path)
+            assert [layer.name for layer in psd] == ["Base", "White mask"], write.__name__
+            assert not psd[1].has_mask() and psd[1].bbox == (0, 0, 16, 16)
+    print("✅ Invisible layers skipped")
+
+
+if __name__ == "__main__":
+    test_stats_match_reference()
+    test_saver_skips_invisible_layers()
+    print("\n🎉 Mask stats tests passed!")
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the saved merged image is the real layer composite, with a matching thumbnail
+"""
+
+import io
+import os
+import sys
+import tempfile
+
+import numpy as np
+import torch
+from PIL import Image
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from psd_tools import PSDImage
+from psd_tools.constants import Resource
+from utils.apz_psd_tools_utility import THUMBNAIL_SIZE, process_layers_to_psd
+from utils.apz_tensor_conversion import image_tensor_to_uint8, mask_tensor_to_uint8
+
+
+def make_document(output_dir):
+    """A masked RGBA layer, a multiply layer and a screen layer over an opaque background"""
+    torch.manual_seed(0)
+    images = [torch.rand(1, 20, 30, 4), torch.rand(1, 16, 16, 3), torch.rand(1, 24, 24, 3), torch.rand(1, 40, 50, 3)]
+    mask = torch.zeros(1, 20, 30)
+    mask[:, 4:16, 6:24] = torch.rand(12, 18)
+    masks = [mask, None, None, None]
+    offsets = [(10, 12), (2, 2), (26, 14), (0, 0)]
+    blend_modes = ["normal", "multiply", "screen", "normal"]
+    path, ok = process_layers_to_psd(images, ["Masked", "Multiply", "Screen", "Background"], masks, output_dir,
+                                     "merged", layer_offsets=offsets, blend_modes=blend_modes)
+    assert ok
+    return path, images, masks, offsets, blend_modes
+
+
+def reference_composite(images, masks, offsets, blend_modes):
+    """Composites the layers bottom to top with plain float math"""
+    canvas = np.ones((40, 50, 3))
+    for image, mask, (left, top), blend_mode in reversed(list(zip(images, masks, offsets, blend_modes))):
+        pixels = image_tensor_to_uint8(image, channels=image.shape[-1])[0] / 255
+        height, width = pixels.shape[:2]
+        region = canvas[top:top + height, left:left + width]
+        color = pixels[..., :3]
+        alpha = pixels[..., 3:] if pixels.shape[-1] == 4 else np.ones((height, width, 1))
+        if mask is not None:
+            alpha = alpha * mask_tensor_to_uint8(mask)[0][..., None] / 255
+        if blend_mode == "multiply":
+            color = region * color
+        elif blend_mode == "screen":
+            color = region + color - region * color
+        region += (color - region) * alpha
+    return np.rint(canvas * 255).astype(np.uint8)
+
+
+def test_merged_image_is_layer_composite():
+    """The stored merged image equals the layers blended over white, masks and blend modes applied"""
+    print("🧪 Testing merged image...")
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        path, images, masks, offsets, blend_modes = make_document(output_dir)
+        psd = PSDImage.open(path)
+        merged = np.asarray(psd.topil().convert('RGB'), dtype=np.int16)
+        expected = reference_composite(images, masks, offsets, blend_modes).astype(np.int16)
+        assert merged.shape == (40, 50, 3)
+        assert np.abs(merged - expected).max() <= 1
+        # The composite is not a copy of any single layer: the multiply layer darkened the background
+        assert not np.array_equal(merged[2:18, 2:18], image_tensor_to_uint8(images[3])[0][2:18, 2:18])
+    print("✅ Merged image is the layer composite")
+
+
+def test_thumbnail_resource():
+    """A JPEG thumbnail of the composite, at most THUMBNAIL_SIZE on its longest side, is embedded"""
+    print("🧪 Testing thumbnail resource...")
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        path, *_ = make_document(output_dir)
+        psd = PSDImage.open(path)
+        thumbnail = psd.image_resources.get_data(Resource.THUMBNAIL_RESOURCE)
+        assert thumbnail is not None and thumbnail.fmt == 1
+        assert max(thumbnail.width, thumbnail.height) <= THUMBNAIL_SIZE
+        assert (thumbnail.width, thumbnail.height) == (50, 40)
+
+        with Image.open(io.BytesIO(thumbnail.data)) as image:
+            assert image.format == "JPEG" and image.size == (50, 40)
+            pixels = np.asarray(image.convert('RGB'), dtype=np.int16)
+        merged = np.asarray(psd.topil().convert('RGB'), dtype=np.int16)
+        # JPEG keeps the average color of the noisy test layers
+        assert np.abs(pixels.mean(axis=(0, 1)) - merged.mean(axis=(0, 1))).max() < 4
+
+        large = [torch.rand(1, 400, 800, 3)]
+        path, ok = process_layers_to_psd(large, ["Large"], None, output_dir, "large")
+        assert ok
+        thumbnail = PSDImage.open(path).image_resources.get_data(Resource.THUMBNAIL_RESOURCE)
+        assert (thumbnail.width, thumbnail.height) == (THUMBNAIL_SIZE, THUMBNAIL_SIZE // 2)
+    print("✅ Thumbnail resource embedded")
+
+
+if __name__ == "__main__":
+    test_merged_image_is_layer_composite()
+    test_thumbnail_resource()
+    print("\n🎉 Merged image tests passed!")
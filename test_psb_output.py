@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Test script to verify oversized documents are written as PSB
+"""
+
+import os
+import sys
+import tempfile
+
+import numpy as np
+import torch
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from psd_tools import PSDImage
+from utils.apz_psd_tools_utility import process_layers_to_psd
+
+
+def test_wide_canvas_is_saved_as_psb():
+    """A canvas wider than 30,000 pixels is saved as a readable PSB file"""
+    print("🧪 Testing PSB output...")
+
+    image = torch.zeros(1, 8, 30001, 3)
+    image[..., 0] = 0.5
+    mask = torch.ones(1, 8, 30001)
+    mask[:, :, :100] = 0
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        path, ok = process_layers_to_psd([image], ["Wide"], [mask], output_dir, "wide")
+        assert ok and path.endswith("wide.psb")
+
+        psd = PSDImage.open(path)
+        assert psd.version == 2 and psd.size == (30001, 8)
+
+        # psd-tools refuses to render images this wide, so decode the channels directly
+        layer_info = psd._record.layer_and_mask_information.layer_info
+        record, channels = layer_info.layer_records[0], layer_info.channel_image_data[0]
+        for info, data in zip(record.channel_info, channels):
+            if info.id == -2:
+                box = record.mask_data
+                expected = 0
+            else:
+                box = record
+                expected = {-1: 255, 0: 128, 1: 0, 2: 0}[info.id]
+            width, height = box.right - box.left, box.bottom - box.top
+            plane = np.frombuffer(data.get_data(width, height, 8, 2), dtype=np.uint8)
+            assert plane.size == width * height and np.all(plane == expected)
+        print("✅ PSB file decodes correctly")
+
+
+if __name__ == "__main__":
+    test_wide_canvas_is_saved_as_psb()
+    print("\n🎉 PSB output test passed!")
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the PSD backends write and read the same documents
+"""
+
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pytest
+import torch
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from psd_tools import PSDImage
+from PIL import Image
+from utils.apz_psd_backends import (AUTO_BACKENDS, PytoshopBackend, available_backends, calibrate_backends,
+                                    get_psd_backend, load_psd_layer_arrays, select_psd_backend)
+from utils.apz_psd_tools_utility import prepare_psd_layers, tensor_to_pil_images, tensor_to_pil_masks
+
+
+def test_backends_round_trip():
+    """Every backend reads back what every backend wrote: pixels, masks, names and blend modes"""
+    print("🧪 Testing PSD backends...")
+
+    torch.manual_seed(0)
+    images = [torch.rand(1, 30, 40, 4), torch.rand(1, 50, 25, 3)]
+    mask = torch.zeros(1, 30, 40)
+    mask[:, 4:20, 6:30] = torch.rand(16, 24)
+    canvas_width, canvas_height, prepared = prepare_psd_layers(
+        [tensor_to_pil_images(image, keep_alpha=True)[0] for image in images], ["Top é", "Bottom"],
+        [tensor_to_pil_masks(mask)[0], None], [(0, 3), (5, 0)], ["normal", "multiply"])
+
+    names = available_backends()
+    assert "numpy" in names
+    with tempfile.TemporaryDirectory() as output_dir:
+        for writer in names:
+            path = os.path.join(output_dir, f"{writer}.psd")
+            assert get_psd_backend(writer).write_document(prepared, canvas_width, canvas_height, path)
+            for reader in names:
+                backend = get_psd_backend(reader)
+                doc = backend.open(path)
+                layers = backend.list_layers(doc)
+                assert [layer.name for layer in layers] == ["Bottom", "Top é"]
+                assert [layer.blend_mode for layer in layers] == ["multiply", "normal"]
+                for index, layer in enumerate(reversed(prepared)):
+                    rgba, layer_mask = backend.decode_layer(doc, index)
+                    expected = np.asarray(layer.image)
+                    visible = expected[:, :, 3] > 0
+                    assert np.array_equal(rgba[:, :, 3], expected[:, :, 3])
+                    assert np.array_equal(rgba[visible, :3], expected[visible, :3])
+                    if layer.mask is None:
+                        assert layer_mask is None
+                    else:
+                        assert np.array_equal(layer_mask, layer.mask.to_array())
+            print(f"✅ {writer} document reads back with {', '.join(names)}")
+
+
+def test_backends_list_grouped_layers_alike():
+    """Every backend indexes a grouped document like psd[i]: top-level layers and groups, bottom to top"""
+    print("🧪 Testing PSD backends on grouped layers...")
+
+    psd = PSDImage.new('RGB', (60, 40))
+    colors = [(255, 0, 0), (0, 255, 0), (0, 0, 255), (255, 255, 0), (0, 255, 255)]
+    for index, color in enumerate(colors):
+        psd.create_pixel_layer(Image.new('RGBA', (10 + index * 5, 10), color + (255,)),
+                               name=f"Layer {index}", top=index * 3, left=index * 4)
+    inner = psd.create_group([psd[2], psd[3]], name="Inner")
+    psd.create_group([psd[1], inner], name="Outer")
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        path = os.path.join(output_dir, "grouped.psd")
+        psd.save(path)
+        expected = [(layer.name, layer.bbox, layer.is_group()) for layer in PSDImage.open(path)]
+        assert expected == [("Layer 0", (0, 0, 10, 10), False), ("Layer 4", (16, 12, 46, 22), False),
+                            ("Outer", (4, 3, 37, 19), True)]
+
+        listings = {}
+        for name in available_backends():
+            backend = get_psd_backend(name)
+            doc = backend.open(path)
+            layers = backend.list_layers(doc)
+            listings[name] = layers
+            assert [(layer.name, (layer.left, layer.top, layer.right, layer.bottom), layer.is_group)
+                    for layer in layers] == expected, name
+            for index, layer in enumerate(layers):
+                if not layer.is_group:
+                    rgba, _ = backend.decode_layer(doc, index)
+                    reference, _ = get_psd_backend("psd_tools").decode_layer(PSDImage.open(path), index)
+                    assert np.array_equal(rgba, reference), (name, index)
+        assert len(set(map(tuple, listings.values()))) == 1, listings
+
+        # Whichever backend is selected, an index loads the same layer; groups decode to their composite
+        for name in listings:
+            os.environ["APZ_PSD_BACKEND"] = name
+            try:
+                rgba, _, layers = load_psd_layer_arrays(path, 1)
+                assert layers[1].name == "Layer 4" and tuple(rgba[0, 0]) == (0, 255, 255, 255)
+                rgba, mask, layers = load_psd_layer_arrays(path, 2)
+                assert layers[2].name == "Outer" and rgba.shape[:2] == (16, 33) and mask is None
+            finally:
+                del os.environ["APZ_PSD_BACKEND"]
+        print(f"✅ {', '.join(listings)} list and decode grouped layers alike")
+
+
+def test_pytoshop_round_trip():
+    """Documents written by pytoshop open in psd-tools, and pytoshop reads psd-tools' documents"""
+    pytest.importorskip("pytoshop")
+    if not PytoshopBackend.available():
+        pytest.skip("pytoshop's compiled RLE codec is not installed")
+    print("🧪 Testing pytoshop backend...")
+
+    torch.manual_seed(1)
+    mask = torch.zeros(1, 20, 30)
+    mask[:, 5:15, 10:25] = 1
+    canvas_width, canvas_height, prepared = prepare_psd_layers(
+        [tensor_to_pil_images(torch.rand(1, 20, 30, 4), keep_alpha=True)[0],
+         tensor_to_pil_images(torch.rand(1, 30, 40, 3))[0]],
+        ["Été", "Fond"], [tensor_to_pil_masks(mask)[0], None], [(4, 2), (0, 0)], ["screen", "normal"])
+
+    backend = get_psd_backend("pytoshop")
+    with tempfile.TemporaryDirectory() as output_dir:
+        path = os.path.join(output_dir, "pytoshop.psd")
+        assert backend.write_document(prepared, canvas_width, canvas_height, path)
+        psd = PSDImage.open(path)
+        assert psd.size == (40, 30)
+        assert [layer.name for layer in psd] == ["Fond", "Été"]
+        assert psd[1].blend_mode.name == "SCREEN" and psd[1].bbox == (4, 2, 34, 22)
+        for layer, expected in zip(psd, reversed(prepared)):
+            assert np.array_equal(np.asarray(layer.topil().convert("RGBA")), np.asarray(expected.image))
+        assert psd[1].mask.bbox == (14, 7, 29, 17)
+
+        path = os.path.join(output_dir, "psd_tools.psd")
+        assert get_psd_backend("psd_tools").write_document(prepared, canvas_width, canvas_height, path)
+        doc = backend.open(path)
+        assert [layer.name for layer in backend.list_layers(doc)] == ["Fond", "Été"]
+        rgba, layer_mask = backend.decode_layer(doc, 1)
+        assert np.array_equal(rgba, np.asarray(prepared[0].image))
+        assert np.array_equal(layer_mask, prepared[0].mask.to_array())
+    print("✅ pytoshop documents round-trip")
+
+
+def test_auto_selection_skips_pytoshop():
+    """Calibration only times AUTO_BACKENDS; other backends are used when configured by name"""
+    print("🧪 Testing automatic backend selection...")
+
+    timings = calibrate_backends()
+    assert timings and set(timings) <= set(AUTO_BACKENDS)
+    assert "pytoshop" not in AUTO_BACKENDS
+    for operation in ("list", "decode", "write"):
+        assert select_psd_backend(operation).name in AUTO_BACKENDS
+
+    os.environ["APZ_PSD_BACKEND"] = "numpy"
+    try:
+        assert select_psd_backend("write").name == "numpy"
+    finally:
+        del os.environ["APZ_PSD_BACKEND"]
+    print("✅ Automatic selection limited to AUTO_BACKENDS")
+
+
+if __name__ == "__main__":
+    test_backends_round_trip()
+    test_backends_list_grouped_layers_alike()
+    if PytoshopBackend.available():
+        test_pytoshop_round_trip()
+    test_auto_selection_skips_pytoshop()
+    print("\n🎉 PSD backends test passed!")
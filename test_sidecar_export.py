@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the per-layer PNG and flattened sidecars written next to a PSD
+"""
+
+import os
+import sys
+import tempfile
+
+import numpy as np
+import torch
+from PIL import Image
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from psd_tools import PSDImage
+from utils.apz_psd_tools_utility import process_batch_to_psds, process_layers_to_psd
+
+
+def make_inputs():
+    torch.manual_seed(0)
+    top = torch.rand(1, 20, 30, 3)
+    mask = torch.zeros(1, 20, 30)
+    mask[:, 5:15, 10:20] = 1
+    return [top, torch.rand(1, 40, 50, 3)], ["Top / Shot", "Base"], [mask, None]
+
+
+def test_layer_and_flat_sidecars():
+    """Every layer gets a canvas-sized PNG with its mask in the alpha; the flat PNG equals the PSD composite"""
+    print("🧪 Testing sidecar export...")
+
+    images, names, masks = make_inputs()
+    with tempfile.TemporaryDirectory() as output_dir:
+        path, ok = process_layers_to_psd(images, names, masks, output_dir, "doc", layer_offsets=[(5, 8), (0, 0)],
+                                         sidecar_layers=True, sidecar_flat="png")
+        assert ok
+        assert sorted(os.listdir(output_dir)) == ["doc.png", "doc.psd", "doc_01_Top_Shot.png", "doc_02_Base.png"]
+        psd = PSDImage.open(path)
+
+        top = np.asarray(Image.open(os.path.join(output_dir, "doc_01_Top_Shot.png")))
+        assert top.shape == (40, 50, 4)
+        expected_rgb = np.asarray(psd[1].topil().convert('RGB'))
+        assert np.array_equal(top[8:28, 5:35, :3], expected_rgb)
+        # The mask went into the alpha, the rest of the canvas is transparent
+        assert (top[13:23, 15:25, 3] == 255).all()
+        assert top[8:13, :, 3].max() == 0 and top[:8, :, 3].max() == 0 and top[28:, :, 3].max() == 0
+
+        base = np.asarray(Image.open(os.path.join(output_dir, "doc_02_Base.png")))
+        assert np.array_equal(base[:, :, :3], np.asarray(psd[0].topil().convert('RGB')))
+        assert (base[:, :, 3] == 255).all()
+
+        flat = np.asarray(Image.open(os.path.join(output_dir, "doc.png")))
+        assert np.array_equal(flat, np.asarray(psd.topil().convert('RGB')))
+    print("✅ Layer and flat sidecars match the PSD")
+
+
+def test_lossy_flat_formats_and_batches():
+    """JPEG and WebP composites are written at canvas size; batch saves write sidecars per PSD"""
+    print("🧪 Testing sidecar formats...")
+
+    # Smooth gradients, which lossy encoders keep close to the original
+    ramp = torch.linspace(0, 1, 50).expand(40, 50)
+    images = [torch.stack([ramp, ramp.flip(1), torch.full_like(ramp, 0.5)], dim=-1)[None, :20, :30],
+              torch.stack([ramp.flip(1), torch.full_like(ramp, 0.25), ramp], dim=-1)[None]]
+    _, names, masks = make_inputs()
+    with tempfile.TemporaryDirectory() as output_dir:
+        for flat_format, extension in (("jpeg", ".jpg"), ("webp", ".webp")):
+            path, ok = process_layers_to_psd(images, names, masks, output_dir, f"doc_{flat_format}",
+                                             sidecar_flat=flat_format)
+            assert ok
+            with Image.open(os.path.splitext(path)[0] + extension) as flat:
+                assert flat.size == (50, 40) and flat.mode == "RGB"
+                reference = np.asarray(PSDImage.open(path).topil().convert('RGB'), dtype=np.int16)
+                assert np.abs(np.asarray(flat, dtype=np.int16) - reference).mean() < 4
+
+        batch = [torch.rand(3, 16, 16, 3)]
+        results = process_batch_to_psds(batch, ["Layer"], None, output_dir, "batch", sidecar_flat="png")
+        assert len(results) == 3 and all(ok for _, ok in results)
+        for path, _ in results:
+            assert os.path.exists(os.path.splitext(path)[0] + ".png")
+
+        path, ok = process_layers_to_psd(images, names, masks, output_dir, "none", sidecar_flat="none")
+        assert ok
+        assert not [name for name in os.listdir(output_dir) if name.startswith("none") and name != "none.psd"]
+    print("✅ Flat formats and batch sidecars written")
+
+
+if __name__ == "__main__":
+    test_layer_and_flat_sidecars()
+    test_lossy_flat_formats_and_batches()
+    print("\n🎉 Sidecar export tests passed!")
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the strip writer matches the in-memory PSD writer
+"""
+
+import contextlib
+import io
+import os
+import sys
+import tempfile
+
+import numpy as np
+import torch
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from psd_tools import PSDImage
+from utils.apz_psd_tools_utility import process_layers_to_psd
+from utils.apz_psd_stream_writer import expand_layer_sources, process_layers_to_psd_in_strips
+
+
+def test_strips_match_in_memory_writer():
+    """Layers, masks and composite written in strips equal a regular save"""
+    print("🧪 Testing strip writer...")
+
+    torch.manual_seed(0)
+    images = [torch.rand(1, 37, 53, 4), torch.rand(2, 20, 30, 3), torch.rand(1, 64, 80, 3),
+              torch.rand(1, 10, 12, 3), torch.rand(1, 10, 12, 3)]
+    images[0][0, :5, :, 3] = 0
+    images[0][0, :, 40:, 3] = 0
+    box_mask = torch.zeros(1, 20, 30)
+    box_mask[:, 3:9, 4:12] = 1
+    # A fully white mask is dropped, a fully black one hides its layer
+    masks = [torch.rand(1, 37, 53), box_mask, None, torch.ones(1, 10, 12), torch.zeros(1, 10, 12)]
+    names = ["A", "B", "C", "Full", "Hidden"]
+    options = dict(layer_offsets=[(-5, 3), (30, -4), (0, 0), (2, 2), (4, 4)],
+                   blend_modes=["normal", "multiply", "screen", "normal", "normal"], trim_layers=True)
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        reference_path, ok = process_layers_to_psd(images, names, masks, output_dir,
+                                                   "reference", **options)
+        assert ok
+        # An odd strip size, so strips straddle layer and mask edges
+        path, ok = process_layers_to_psd_in_strips(images, names, masks, output_dir,
+                                                   "strips", strip_rows=7, **options)
+        assert ok
+
+        reference, psd = PSDImage.open(reference_path), PSDImage.open(path)
+        assert psd.size == reference.size
+        assert [layer.name for layer in psd] == [layer.name for layer in reference] == ["Full", "C", "B 2", "B 1", "A"]
+        assert not psd[0].has_mask() and not reference[0].has_mask()
+        for layer, ref_layer in zip(psd, reference):
+            assert (layer.name, layer.bbox, layer.blend_mode) == (ref_layer.name, ref_layer.bbox, ref_layer.blend_mode)
+            assert np.array_equal(np.asarray(layer.topil()), np.asarray(ref_layer.topil()))
+            if ref_layer.mask is not None:
+                assert (layer.mask.bbox, layer.mask.background_color) == \
+                    (ref_layer.mask.bbox, ref_layer.mask.background_color)
+                if layer.mask.width:
+                    assert np.array_equal(np.asarray(layer.mask.topil()), np.asarray(ref_layer.mask.topil()))
+        assert np.array_equal(np.asarray(psd.topil()), np.asarray(reference.topil()))
+        print("✅ Strip writer output matches")
+
+
+def test_unnormalized_masks_are_sliced_per_strip():
+    """Masks outside 0-1 are normalized strip by strip, without copying them first"""
+    print("🧪 Testing strip writer mask normalization...")
+
+    torch.manual_seed(1)
+    images = [torch.rand(2, 40, 30, 3), torch.rand(1, 40, 30, 3)]
+    byte_masks = (torch.rand(2, 40, 30) * 255).round()
+    stretched_mask = torch.rand(1, 40, 30) * 4 - 2
+    masks = [byte_masks, stretched_mask]
+
+    sources, _ = expand_layer_sources(images, ["Bytes", "Stretched"], masks)
+    for source, mask in zip(sources, [byte_masks[0], byte_masks[1], stretched_mask[0]]):
+        assert source.mask.data_ptr() == mask.data_ptr(), "mask was copied"
+    assert byte_masks.max() > 1, "input was modified"
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        reference_path, ok = process_layers_to_psd(images, ["Bytes", "Stretched"], masks, output_dir, "reference")
+        assert ok
+        path, ok = process_layers_to_psd_in_strips(images, ["Bytes", "Stretched"], masks, output_dir,
+                                                   "strips", strip_rows=9)
+        assert ok
+        reference, psd = PSDImage.open(reference_path), PSDImage.open(path)
+        for layer, ref_layer in zip(psd, reference):
+            assert layer.mask.bbox == ref_layer.mask.bbox
+            assert np.array_equal(np.asarray(layer.mask.topil()), np.asarray(ref_layer.mask.topil()))
+        assert np.array_equal(np.asarray(psd.topil()), np.asarray(reference.topil()))
+    print("✅ Masks normalized per strip")
+
+
+def test_sidecars_are_rejected_with_warning():
+    """Sidecar options warn in strip mode and write no sidecar files"""
+    print("🧪 Testing strip writer sidecar options...")
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            path, ok = process_layers_to_psd_in_strips([torch.rand(1, 16, 16, 3)], ["Layer"], None, output_dir,
+                                                       "strips", strip_rows=4, sidecar_layers=True,
+                                                       sidecar_flat="png")
+        assert ok
+        assert "Sidecar files are not written" in output.getvalue()
+        assert os.listdir(output_dir) == [os.path.basename(path)]
+    print("✅ Sidecar options rejected with a warning")
+
+
+if __name__ == "__main__":
+    test_strips_match_in_memory_writer()
+    test_unnormalized_masks_are_sliced_per_strip()
+    test_sidecars_are_rejected_with_warning()
+    print("\n🎉 Strip writer tests passed!")
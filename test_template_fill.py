@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Test script to verify template fill replaces named layers and keeps every other layer byte for byte
+"""
+
+import contextlib
+import io
+import os
+import sys
+import tempfile
+
+import numpy as np
+import torch
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from psd_tools import PSDImage
+from psd_tools.constants import ChannelID
+from utils.apz_psd_template_utility import (
+    _template_cache, clear_template_cache, find_template_layer, load_template, process_template_fill
+)
+from utils.apz_psd_tools_utility import process_layers_to_psd
+
+
+def solid_image(height, width, color):
+    image = torch.zeros(1, height, width, 3)
+    image[..., :] = torch.tensor(color, dtype=torch.float32) / 255
+    return image
+
+
+def build_template(output_dir):
+    """Product (masked) over a Shadow inside a "Floor" group over a Background"""
+    mask = torch.zeros(1, 20, 20)
+    mask[:, 5:15, 5:15] = 1
+    path, ok = process_layers_to_psd(
+        [solid_image(20, 20, (255, 0, 0)), solid_image(10, 30, (0, 0, 0)), solid_image(50, 60, (255, 255, 255))],
+        ["Product", "Shadow", "Background"], [mask, None, None], output_dir, "template",
+        layer_offsets=[(10, 10), (5, 35), (0, 0)])
+    assert ok
+    psd = PSDImage.open(path)
+    psd.create_group([psd[1]], name="Floor")
+    psd.save(path)
+    return path
+
+
+def channel_bytes(layer):
+    return [(info.id, data.compression, data.data) for info, data in zip(layer._record.channel_info, layer._channels)]
+
+
+def test_fill_replaces_only_targeted_layers():
+    """The targeted layer gets the new pixels at its old position; every other layer is copied verbatim"""
+    print("🧪 Testing template fill...")
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        template_path = build_template(output_dir)
+        template = PSDImage.open(template_path)
+
+        product = torch.zeros(1, 12, 16, 3)
+        product[..., 1] = 1
+        path, ok = process_template_fill(template_path, ["Product"], [product], output_dir=output_dir,
+                                         filename_prefix="filled")
+        assert ok and path != template_path
+        filled = PSDImage.open(path)
+
+        assert [layer.name for layer in filled.descendants()] == [layer.name for layer in template.descendants()]
+        layer = find_template_layer(filled, "Product")
+        # Centered on the template layer's bounding box, at the new image's size
+        assert layer.bbox == (12, 14, 28, 26)
+        assert np.array_equal(np.asarray(layer.topil().convert('RGB'))[0, 0], [0, 255, 0])
+        # Without a new mask the template's mask channel is kept, byte for byte
+        old_mask = [item for item in channel_bytes(find_template_layer(template, "Product"))
+                    if item[0] == ChannelID.USER_LAYER_MASK]
+        assert old_mask and old_mask == [item for item in channel_bytes(layer) if item[0] == ChannelID.USER_LAYER_MASK]
+
+        for name in ("Shadow", "Background"):
+            old, new = find_template_layer(template, name), find_template_layer(filled, name)
+            assert channel_bytes(new) == channel_bytes(old), name
+            assert new.bbox == old.bbox
+
+        # The merged image shows the new pixels where the mask lets them through
+        assert filled.topil().convert('RGB').getpixel((20, 20)) == (0, 255, 0)
+        assert template.topil().convert('RGB').getpixel((20, 20)) == (255, 0, 0)
+    print("✅ Only the targeted layer was re-encoded")
+
+
+def test_fill_by_path_with_mask_and_stretch():
+    """Layers are found by "Group/Layer" path; a new mask replaces the template's; stretch fills the bbox"""
+    print("🧪 Testing template fill by path...")
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        template_path = build_template(output_dir)
+        mask = torch.ones(1, 4, 4)
+        mask[:, :, :2] = 0
+        path, ok = process_template_fill(template_path, ["Floor/Shadow"], [solid_image(4, 4, (0, 0, 255))],
+                                         mask_tensors=[mask], output_dir=output_dir, filename_prefix="filled",
+                                         fit="stretch")
+        assert ok
+        layer = find_template_layer(PSDImage.open(path), "Floor/Shadow")
+        assert layer.bbox == (5, 35, 35, 45)
+        assert np.array_equal(np.unique(np.asarray(layer.topil().convert('RGB')).reshape(-1, 3), axis=0),
+                              [[0, 0, 255]])
+        # The left half is hidden: the mask's default color is black and its rectangle starts right of the layer's edge
+        mask_pixels = np.asarray(layer.mask.topil())
+        assert layer.mask.background_color == 0 and layer.mask.bbox[0] > 5
+        assert mask_pixels[:, -1].min() == 255
+
+        assert find_template_layer(PSDImage.open(path), "Floor/Missing") is None
+        path, ok = process_template_fill(template_path, ["Missing"], [solid_image(4, 4, (0, 0, 255))],
+                                         output_dir=output_dir, filename_prefix="missing")
+        assert not ok
+    print("✅ Paths, masks and stretch fit applied")
+
+
+def test_batched_inputs_use_first_element():
+    """Only the first element of a batch fills the layer, with a warning; unbatched masks are accepted"""
+    print("🧪 Testing batched template fill...")
+
+    batch = torch.cat([solid_image(4, 4, (0, 255, 0)), solid_image(4, 4, (255, 0, 255)),
+                       solid_image(4, 4, (0, 0, 0))])
+    with tempfile.TemporaryDirectory() as output_dir:
+        template_path = build_template(output_dir)
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            path, ok = process_template_fill(template_path, ["Product"], [batch], mask_tensors=[torch.ones(4, 4)],
+                                             output_dir=output_dir, filename_prefix="batched", fit="stretch")
+        assert ok
+        assert "batch of 3 images; only the first is used" in output.getvalue()
+        layer = find_template_layer(PSDImage.open(path), "Product")
+        assert np.array_equal(np.unique(np.asarray(layer.topil().convert('RGB')).reshape(-1, 3), axis=0),
+                              [[0, 255, 0]])
+    print("✅ First batch element used")
+
+
+def test_template_is_parsed_once():
+    """The parsed template is cached until the file changes, and every fill gets its own copy"""
+    print("🧪 Testing template cache...")
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        template_path = build_template(output_dir)
+        clear_template_cache()
+        first = load_template(template_path)
+        cached = _template_cache[os.path.abspath(template_path)][2]
+        second = load_template(template_path)
+        assert _template_cache[os.path.abspath(template_path)][2] is cached
+        assert first is not second and first is not cached
+
+        find_template_layer(first, "Product").name = "Changed"
+        assert find_template_layer(second, "Product") is not None
+
+        stat = os.stat(template_path)
+        os.utime(template_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+        load_template(template_path)
+        assert _template_cache[os.path.abspath(template_path)][2] is not cached
+        clear_template_cache()
+    print("✅ Template parsed once per file version")
+
+
+def test_template_cache_is_bounded():
+    """Only the most recently used templates stay parsed; a size of 0 keeps none"""
+    print("🧪 Testing template cache size...")
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        template_path = build_template(output_dir)
+        paths = []
+        for index in range(3):
+            paths.append(os.path.join(output_dir, f"copy_{index}.psd"))
+            with open(template_path, "rb") as source, open(paths[-1], "wb") as target:
+                target.write(source.read())
+
+        os.environ["APZ_PSD_TEMPLATE_CACHE_SIZE"] = "2"
+        try:
+            clear_template_cache()
+            for path in paths[:2]:
+                load_template(path)
+            load_template(paths[0])
+            load_template(paths[2])
+            assert list(_template_cache) == [os.path.abspath(paths[0]), os.path.abspath(paths[2])]
+
+            os.environ["APZ_PSD_TEMPLATE_CACHE_SIZE"] = "0"
+            assert find_template_layer(load_template(paths[1]), "Product") is not None
+            assert not _template_cache
+        finally:
+            del os.environ["APZ_PSD_TEMPLATE_CACHE_SIZE"]
+            clear_template_cache()
+    print("✅ Template cache bounded")
+
+
+if __name__ == "__main__":
+    test_fill_replaces_only_targeted_layers()
+    test_fill_by_path_with_mask_and_stretch()
+    test_batched_inputs_use_first_element()
+    test_template_is_parsed_once()
+    test_template_cache_is_bounded()
+    print("\n🎉 Template fill tests passed!")
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the shared tensor to uint8 conversion kernel
+"""
+
+import os
+import sys
+
+import numpy as np
+import torch
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from PIL import Image
+
+from utils.apz_tensor_conversion import (
+    CHUNK_ELEMENTS, as_tensor, image_tensor_to_pil, image_tensor_to_uint8, mask_tensor_to_uint8, pil_to_image_tensor,
+    pil_to_mask_tensor
+)
+
+
+def reference_uint8(tensor):
+    """Straightforward clamp/scale/round/cast used as the expected result"""
+    return np.round(np.clip(tensor.float().numpy(), 0.0, 1.0) * 255).astype(np.uint8)
+
+
+def test_image_layouts_and_dtypes():
+    """NHWC and NCHW batches in every float dtype match the reference"""
+    print("🧪 Testing image conversion layouts and dtypes...")
+
+    torch.manual_seed(0)
+    nhwc = torch.rand(2, 17, 23, 3) * 1.2 - 0.1
+
+    for dtype in (torch.float32, torch.float16, torch.bfloat16):
+        source = nhwc.to(dtype)
+        expected = reference_uint8(source)
+        assert np.array_equal(image_tensor_to_uint8(source), expected)
+        assert np.array_equal(image_tensor_to_uint8(source.permute(0, 3, 1, 2)), expected)
+        print(f"✅ {dtype} matches reference")
+
+    as_uint8 = torch.from_numpy(reference_uint8(nhwc))
+    assert np.array_equal(image_tensor_to_uint8(as_uint8), as_uint8.numpy())
+
+
+def test_channels_and_output_buffer():
+    """Channel selection and reuse of a caller-provided output buffer"""
+    print("🧪 Testing channel handling and output buffer reuse...")
+
+    rgba = torch.rand(1, 8, 8, 4)
+    assert image_tensor_to_uint8(rgba).shape == (1, 8, 8, 3)
+    assert image_tensor_to_uint8(rgba, channels=4).shape == (1, 8, 8, 4)
+
+    gray = torch.rand(1, 8, 8, 1)
+    rgb = image_tensor_to_uint8(gray)
+    assert rgb.shape == (1, 8, 8, 3)
+    assert np.array_equal(rgb[..., 0], rgb[..., 2])
+
+    out = np.empty((1, 8, 8, 3), dtype=np.uint8)
+    result = image_tensor_to_uint8(rgba, out=out)
+    assert result is out
+    assert np.array_equal(out, reference_uint8(rgba[..., :3]))
+
+
+def test_mask_conversion():
+    """Masks in [B, H, W], [B, 1, H, W] and [H, W] shapes"""
+    print("🧪 Testing mask conversion...")
+
+    mask = torch.rand(3, 9, 11)
+    expected = reference_uint8(mask)
+    assert np.array_equal(mask_tensor_to_uint8(mask), expected)
+    assert np.array_equal(mask_tensor_to_uint8(mask.unsqueeze(1)), expected)
+    assert np.array_equal(mask_tensor_to_uint8(mask[0]), expected[:1])
+
+
+def test_zero_copy_and_round_trip():
+    """Views are shared instead of copied, and PIL round trips are exact at 8 bits"""
+    print("🧪 Testing zero-copy conversion...")
+
+    array = np.random.RandomState(0).randint(0, 256, (2, 6, 7, 3)).astype(np.uint8)
+    assert np.shares_memory(image_tensor_to_uint8(torch.from_numpy(array)), array)
+    mask = np.ascontiguousarray(array[..., 0])
+    assert np.shares_memory(mask_tensor_to_uint8(torch.from_numpy(mask)), mask)
+    readonly = np.asarray(Image.fromarray(array[0]))
+    assert as_tensor(readonly).data_ptr() == readonly.ctypes.data
+
+    images = image_tensor_to_pil(torch.from_numpy(array))
+    batch = pil_to_image_tensor(images)
+    assert batch.dtype == torch.float32 and batch.shape == (2, 6, 7, 3)
+    assert np.array_equal(image_tensor_to_uint8(batch), array)
+
+    masks = pil_to_mask_tensor([Image.fromarray(array[0, :, :, 0]), Image.fromarray(array[1, :, :, 0])])
+    assert np.array_equal(mask_tensor_to_uint8(masks), array[..., 0])
+    print("✅ No extra copies and exact round trips")
+
+
+def test_strided_input_makes_no_frame_copy():
+    """Permuted (NCHW) and sliced views are converted chunk by chunk, never copied whole"""
+    print("🧪 Testing strided input conversion...")
+    from torch.profiler import ProfilerActivity, profile
+
+    torch.manual_seed(0)
+    nchw = torch.rand(2, 3, 1024, 1024)
+    masks = torch.rand(2, 2048, 2048)[:, ::2, ::2]
+    image_out = np.empty((2, 1024, 1024, 3), dtype=np.uint8)
+    mask_out = np.empty((2, 1024, 1024), dtype=np.uint8)
+    # The first call allocates the scratch buffer
+    image_tensor_to_uint8(nchw, layout="NCHW", out=image_out)
+
+    with profile(activities=[ProfilerActivity.CPU], profile_memory=True) as prof:
+        image_tensor_to_uint8(nchw, layout="NCHW", out=image_out)
+        mask_tensor_to_uint8(masks, out=mask_out)
+    largest = max((event.cpu_memory_usage for event in prof.events()), default=0)
+    assert largest <= CHUNK_ELEMENTS * 4, f"{largest} bytes allocated in one piece"
+
+    assert np.array_equal(image_out, reference_uint8(nchw.permute(0, 2, 3, 1)))
+    assert np.array_equal(mask_out, reference_uint8(masks))
+    assert np.array_equal(image_tensor_to_uint8((nchw * 255).to(torch.int32), layout="NCHW"),
+                          image_tensor_to_uint8((nchw * 255).to(torch.uint8), layout="NCHW"))
+    print(f"✅ Largest allocation {largest} bytes")
+
+
+if __name__ == "__main__":
+    test_image_layouts_and_dtypes()
+    test_channels_and_output_buffer()
+    test_mask_conversion()
+    test_zero_copy_and_round_trip()
+    test_strided_input_makes_no_frame_copy()
+    print("\n🎉 All tensor conversion tests passed!")
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Test script to verify masks are written as PSD user layer masks, separate from the layer's transparency
+"""
+
+import os
+import sys
+import tempfile
+
+import numpy as np
+import torch
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from psd_tools import PSDImage
+from psd_tools.constants import ChannelID
+from utils.apz_compact_mask import compute_mask_rect
+from utils.apz_psd_loader_utility import extract_layer_mask
+from utils.apz_psd_tools_utility import process_layers_to_psd
+from utils.apz_tensor_conversion import image_tensor_to_uint8, mask_tensor_to_uint8
+
+
+def test_mask_is_separate_from_alpha():
+    """An RGBA input keeps its alpha as transparency; the mask goes into its own channel"""
+    print("🧪 Testing user mask channel...")
+
+    torch.manual_seed(0)
+    image = torch.rand(1, 24, 32, 4)
+    image[..., 3] = image[..., 3] * 0.8 + 0.2
+    mask = torch.zeros(1, 24, 32)
+    mask[:, 6:18, 10:26] = torch.rand(12, 16)
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        path, ok = process_layers_to_psd([image], ["Layer"], [mask], output_dir, "masked")
+        assert ok
+        layer = PSDImage.open(path)[0]
+
+        channel_ids = [info.id for info in layer._record.channel_info]
+        assert ChannelID.TRANSPARENCY_MASK in channel_ids and ChannelID.USER_LAYER_MASK in channel_ids
+        # The layer's own pixels, alpha included, are stored untouched by the mask
+        expected = image_tensor_to_uint8(image, channels=4)[0]
+        assert np.array_equal(np.asarray(layer.topil()), expected)
+
+        # The mask is stored as a separate rectangle over the region that is not black
+        assert layer.mask.background_color == 0
+        assert layer.mask.bbox == (10, 6, 26, 18)
+        expected_mask = mask_tensor_to_uint8(mask)[0]
+        assert np.array_equal(np.asarray(layer.mask.topil()), expected_mask[6:18, 10:26])
+        assert np.array_equal(np.asarray(extract_layer_mask(PSDImage.open(path), 0)), expected_mask)
+    print("✅ Mask stored in its own channel")
+
+
+def test_mask_default_color():
+    """A mostly white mask is stored as a white default with only the dark region in its rectangle"""
+    print("🧪 Testing user mask default color...")
+
+    mask = torch.ones(1, 40, 40)
+    mask[:, 30:35, 5:12] = 0
+    with tempfile.TemporaryDirectory() as output_dir:
+        path, ok = process_layers_to_psd([torch.rand(1, 40, 40, 3)], ["Layer"], [mask], output_dir, "hole")
+        assert ok
+        layer = PSDImage.open(path)[0]
+        assert layer.mask.background_color == 255
+        assert layer.mask.bbox == (5, 30, 12, 35)
+        assert np.asarray(layer.mask.topil()).max() == 0
+        assert np.array_equal(np.asarray(extract_layer_mask(PSDImage.open(path), 0)), mask_tensor_to_uint8(mask)[0])
+    print("✅ Mask default color chosen")
+
+
+def test_compute_mask_rect():
+    """The smaller of the black- and white-default rectangles wins; uniform masks store nothing"""
+    print("🧪 Testing mask rectangles...")
+
+    mask = np.zeros((10, 10), dtype=np.uint8)
+    assert compute_mask_rect(mask) == ((0, 0, 0, 0), 0)
+    assert compute_mask_rect(mask + 255) == ((0, 0, 0, 0), 255)
+
+    mask[2:4, 3:8] = 128
+    assert compute_mask_rect(mask) == ((3, 2, 8, 4), 0)
+    mask[:] = 255
+    mask[9, 9] = 0
+    assert compute_mask_rect(mask) == ((9, 9, 10, 10), 255)
+    print("✅ Mask rectangles computed")
+
+
+if __name__ == "__main__":
+    test_mask_is_separate_from_alpha()
+    test_mask_default_color()
+    test_compute_mask_rect()
+    print("\n🎉 User mask tests passed!")
@@ -0,0 +1,252 @@
+"""
+Encoded Channel Cache for the PSD Writers
+
+This module keeps compressed channel bytes keyed by the content of the raw
+plane, so a layer that appears in many output files (background, watermark,
+frame) is compressed once and then reused as a byte copy. Entries live in a
+bounded in-memory LRU cache and, when a cache directory is configured, in an
+on-disk cache shared by every process using that directory.
+
+Each on-disk entry starts with a header holding the length and a digest of
+its bytes; an entry that does not match it (truncated or corrupt) is
+deleted and treated as a miss. When the on-disk cache grows past its size
+limit, the least recently used entries are deleted.
+
+Configuration (environment variables):
+    APZ_PSD_CHANNEL_CACHE_MB: In-memory cache size in MB (default: 256, 0
+        disables the in-memory cache only)
+    APZ_PSD_CHANNEL_CACHE_DIR: Directory of the on-disk cache (default: disabled)
+    APZ_PSD_CHANNEL_CACHE_DISK_MB: On-disk cache size in MB (default: 2048)
+"""
+
+import hashlib
+import os
+import struct
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+# Planes smaller than this are cheaper to compress than to look up
+MIN_CACHED_PLANE_BYTES = 16 * 1024
+
+# On-disk entry header: magic, data length, blake2b digest of the data
+DISK_ENTRY_MAGIC = b"APZC"
+DISK_ENTRY_HEADER = struct.Struct(">4sQ16s")
+
+# When the on-disk cache is over its limit, entries are deleted down to this fraction of it
+DISK_EVICTION_TARGET = 0.9
+
+
+class ChannelCache:
+    """
+    Content-addressed cache of compressed channel bytes.
+
+    Keys are blake2b digests of the raw plane, its dimensions, bit depth and
+    compression mode. Safe to use from several threads.
+
+    Args:
+        max_bytes: In-memory cache size; 0 disables the in-memory cache
+        cache_dir: Directory of the on-disk cache, or None to disable it
+        max_disk_bytes: On-disk cache size
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, cache_dir: Optional[str] = None,
+                 max_disk_bytes: int = 2048 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[bytes, bytes]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        # Bytes in the on-disk cache, counted on first write (other processes may add more)
+        self._disk_size: Optional[int] = None
+        self._disk_lock = threading.Lock()
+
+    @staticmethod
+    def make_key(plane: np.ndarray, compression: int, depth: int = 8, version: int = 1) -> bytes:
+        """Returns the cache key of a raw [H, W] plane (version: 1 for PSD, 2 for PSB)."""
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(f"{plane.shape[1]}x{plane.shape[0]}:{depth}:{compression}:{version}:".encode("ascii"))
+        digest.update(np.ascontiguousarray(plane).data)
+        return digest.digest()
+
+    def _disk_path(self, key: bytes) -> str:
+        name = key.hex()
+        return os.path.join(self.cache_dir, name[:2], name)
+
+    def get(self, key: bytes) -> Optional[bytes]:
+        """Returns cached compressed bytes, or None."""
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                return data
+
+        if self.cache_dir:
+            data = self._read_disk_entry(self._disk_path(key))
+            if data is not None:
+                self._remember(key, data)
+            return data
+        return None
+
+    def put(self, key: bytes, data: bytes) -> None:
+        """Stores compressed bytes in memory and, if configured, on disk."""
+        self._remember(key, data)
+
+        if self.cache_dir:
+            path = self._disk_path(key)
+            if os.path.exists(path) or DISK_ENTRY_HEADER.size + len(data) > self.max_disk_bytes:
+                return
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                # Write to a private file and rename it, so other processes
+                # never read a partially written entry
+                fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".")
+                with os.fdopen(fd, "wb") as f:
+                    f.write(DISK_ENTRY_HEADER.pack(DISK_ENTRY_MAGIC, len(data), self._digest(data)))
+                    f.write(data)
+                os.replace(temp_path, path)
+            except OSError as e:
+                print(f"⚠️ Could not write channel cache entry: {e}")
+                return
+            self._account_disk(DISK_ENTRY_HEADER.size + len(data))
+
+    @staticmethod
+    def _digest(data: bytes) -> bytes:
+        return hashlib.blake2b(data, digest_size=16).digest()
+
+    def _read_disk_entry(self, path: str) -> Optional[bytes]:
+        try:
+            with open(path, "rb") as f:
+                header = f.read(DISK_ENTRY_HEADER.size)
+                data = f.read()
+        except OSError:
+            return None
+        if len(header) == DISK_ENTRY_HEADER.size:
+            magic, length, digest = DISK_ENTRY_HEADER.unpack(header)
+            if magic == DISK_ENTRY_MAGIC and length == len(data) and digest == self._digest(data):
+                try:
+                    # Mark the entry as recently used for eviction
+                    os.utime(path)
+                except OSError:
+                    pass
+                return data
+        print(f"⚠️ Dropping corrupt channel cache entry: {path}")
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        return None
+
+    def _disk_entries(self) -> List[Tuple[float, int, str]]:
+        """Returns (last use, size, path) of every on-disk entry."""
+        entries = []
+        for root, _, names in os.walk(self.cache_dir):
+            for name in names:
+                if name.startswith("."):
+                    continue  # Entry still being written
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _account_disk(self, added: int) -> None:
+        with self._disk_lock:
+            if self._disk_size is None:
+                self._disk_size = sum(size for _, size, _ in self._disk_entries())
+            else:
+                self._disk_size += added
+            if self._disk_size <= self.max_disk_bytes:
+                return
+
+            # Recount, since other processes share the directory, then delete the least recently used entries
+            entries = sorted(self._disk_entries())
+            self._disk_size = sum(size for _, size, _ in entries)
+            target = int(self.max_disk_bytes * DISK_EVICTION_TARGET)
+            for _, size, path in entries:
+                if self._disk_size <= target:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                self._disk_size -= size
+
+    def _remember(self, key: bytes, data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return
+            self._entries[key] = data
+            self._size += len(data)
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def get_or_encode(self, plane: np.ndarray, compression: int, encode: Callable[[], bytes],
+                      depth: int = 8, version: int = 1) -> bytes:
+        """
+        Returns the compressed bytes of a plane, encoding it only on a cache miss.
+
+        Args:
+            plane: numpy array with shape [H, W]
+            compression: Compression mode value
+            encode: Function compressing the plane
+            depth: Bit depth of the plane
+            version: File version the bytes are encoded for (1 PSD, 2 PSB)
+
+        Returns:
+            compressed channel bytes
+        """
+        if (self.max_bytes <= 0 and not self.cache_dir) or plane.nbytes < MIN_CACHED_PLANE_BYTES:
+            return encode()
+
+        key = self.make_key(plane, compression, depth, version)
+        data = self.get(key)
+        if data is not None:
+            self.hits += 1
+            return data
+
+        self.misses += 1
+        data = encode()
+        self.put(key, data)
+        return data
+
+    def clear(self) -> None:
+        """Drops all in-memory entries (the on-disk cache is kept)."""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+
+_channel_cache: Optional[ChannelCache] = None
+_channel_cache_lock = threading.Lock()
+
+
+def get_channel_cache() -> ChannelCache:
+    """Returns the process-wide channel cache, configured from the environment."""
+    global _channel_cache
+    with _channel_cache_lock:
+        if _channel_cache is None:
+            try:
+                max_mb = float(os.environ.get("APZ_PSD_CHANNEL_CACHE_MB", "256"))
+            except ValueError:
+                max_mb = 256
+            try:
+                max_disk_mb = float(os.environ.get("APZ_PSD_CHANNEL_CACHE_DISK_MB", "2048"))
+            except ValueError:
+                max_disk_mb = 2048
+            _channel_cache = ChannelCache(int(max_mb * 1024 * 1024),
+                                          os.environ.get("APZ_PSD_CHANNEL_CACHE_DIR") or None,
+                                          int(max_disk_mb * 1024 * 1024))
+        return _channel_cache
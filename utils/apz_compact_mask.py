@@ -0,0 +1,264 @@
+"""
+Compact Masks for ComfyUI
+
+Most masks are either mostly empty or mostly solid, yet a MASK tensor stores
+every pixel as float32 (128 MB for an 8K mask). A CompactMask stores only
+the rectangle that differs from a default value (0 or 255, whichever leaves
+the smaller rectangle) as 8-bit data, either raw or as the PackBits rows a
+PSD RLE channel is made of. A PSD user mask is stored exactly that way, so
+the mask channel of a layer is written from the rectangle, the default
+color and the encoded rows as they are, without expanding the mask.
+
+Conversion to and from MASK tensors is exact for masks at 8-bit precision,
+which is the precision of a PSD mask channel.
+"""
+
+from typing import List, Optional, Tuple, Union
+
+import numpy as np
+import torch
+
+try:
+    from psd_tools.compression import decode_rle, encode_rle
+    RLE_AVAILABLE = True
+except ImportError:
+    RLE_AVAILABLE = False
+    decode_rle = None
+    encode_rle = None
+
+from .apz_tensor_conversion import mask_tensor_to_uint8
+from .apz_mask_engine import as_mask_batch, masks_from_uint8
+
+MASK_ENCODINGS = ("raw", "rle")
+
+
+def compute_alpha_bbox(alpha: np.ndarray) -> Optional[Tuple[int, int, int, int]]:
+    """
+    Computes the bounding box of the non-transparent pixels of an alpha plane or mask.
+
+    Uses one row and one column reduction instead of scanning pixels.
+
+    Args:
+        alpha: numpy array with shape [H, W]
+
+    Returns:
+        tuple of (left, top, right, bottom), or None if every pixel is transparent
+    """
+    rows = np.flatnonzero(alpha.any(axis=1))
+    if rows.size == 0:
+        return None
+    cols = np.flatnonzero(alpha.any(axis=0))
+    return int(cols[0]), int(rows[0]), int(cols[-1]) + 1, int(rows[-1]) + 1
+
+
+def compute_mask_rect(mask: np.ndarray) -> Tuple[Tuple[int, int, int, int], int]:
+    """
+    Finds the smallest rectangle a PSD user mask has to store.
+
+    Outside its rectangle a user mask takes its default color, so only the
+    pixels that differ from it need to be stored. Both black and white are
+    tried as default color and the one leaving the smaller rectangle wins.
+
+    Args:
+        mask: numpy array with shape [H, W] in uint8 format
+
+    Returns:
+        tuple of ((left, top, right, bottom), default_color); the rectangle is
+        empty (0, 0, 0, 0) for a uniform black or white mask
+    """
+    best_rect, best_color, best_area = None, 0, None
+    for default_color in (0, 255):
+        rect = compute_alpha_bbox(mask != default_color)
+        if rect is None:
+            return (0, 0, 0, 0), default_color
+        area = (rect[2] - rect[0]) * (rect[3] - rect[1])
+        if best_area is None or area < best_area:
+            best_rect, best_color, best_area = rect, default_color, area
+    return best_rect, best_color
+
+
+class CompactMask:
+    """
+    An 8-bit mask stored as a rectangle, a default value outside it and the pixels inside it.
+
+    Attributes:
+        width: Width of the whole mask
+        height: Height of the whole mask
+        bbox: (left, top, right, bottom) of the stored rectangle, (0, 0, 0, 0)
+            for a uniform mask
+        default_color: Value (0 or 255) of every pixel outside bbox
+        encoding: "raw" (data is a uint8 array of the rectangle) or "rle"
+            (data is the PackBits rows of the rectangle, row_lengths their
+            byte counts)
+    """
+
+    __slots__ = ("width", "height", "bbox", "default_color", "encoding", "data", "row_lengths")
+
+    def __init__(self, width: int, height: int, bbox: Tuple[int, int, int, int], default_color: int,
+                 encoding: str, data: Union[np.ndarray, bytes], row_lengths: Optional[np.ndarray] = None):
+        self.width = width
+        self.height = height
+        self.bbox = bbox
+        self.default_color = default_color
+        self.encoding = encoding
+        self.data = data
+        self.row_lengths = row_lengths
+
+    def __repr__(self):
+        return (f"CompactMask({self.width}x{self.height}, bbox={self.bbox}, default={self.default_color}, "
+                f"{self.encoding}, {self.nbytes} bytes)")
+
+    @classmethod
+    def from_array(cls, mask: np.ndarray, encoding: Optional[str] = None) -> "CompactMask":
+        """
+        Compacts a uint8 mask.
+
+        Args:
+            mask: numpy array with shape [H, W] in uint8 format
+            encoding: "raw" or "rle"; by default "rle" when psd-tools is
+                installed, "raw" otherwise
+
+        Returns:
+            CompactMask
+        """
+        if encoding is None:
+            encoding = "rle" if RLE_AVAILABLE else "raw"
+        if encoding not in MASK_ENCODINGS:
+            raise ValueError(f"Unknown mask encoding: {encoding}, expected one of {MASK_ENCODINGS}")
+        if encoding == "rle" and not RLE_AVAILABLE:
+            raise ImportError("psd-tools is required for RLE compact masks")
+
+        height, width = mask.shape
+        bbox, default_color = compute_mask_rect(mask)
+        left, top, right, bottom = bbox
+        crop = np.ascontiguousarray(mask[top:bottom, left:right])
+        if encoding == "raw":
+            return cls(width, height, bbox, default_color, "raw", crop)
+
+        rows = bottom - top
+        encoded = encode_rle(crop.tobytes(), right - left, rows, 8, 2) if rows else b""
+        row_lengths = np.frombuffer(encoded, dtype=">u4", count=rows).astype(np.uint32)
+        return cls(width, height, bbox, default_color, "rle", encoded[4 * rows:], row_lengths)
+
+    @classmethod
+    def from_tensor(cls, mask: torch.Tensor, encoding: Optional[str] = None) -> "CompactMask":
+        """
+        Compacts the first mask of a MASK tensor.
+
+        Args:
+            mask: Tensor with shape [H, W], [B, H, W] or [B, 1, H, W] in the 0-1 range
+            encoding: "raw" or "rle", see from_array
+
+        Returns:
+            CompactMask
+        """
+        return cls.from_array(mask_tensor_to_uint8(as_mask_batch(mask)[:1])[0], encoding)
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the stored rectangle."""
+        if self.encoding == "raw":
+            return self.data.nbytes
+        return len(self.data) + self.row_lengths.nbytes
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        """(width, height) of the whole mask, as PIL reports it."""
+        return self.width, self.height
+
+    def crop_array(self) -> np.ndarray:
+        """
+        Returns the pixels of the stored rectangle.
+
+        Returns:
+            numpy array with shape [bottom - top, right - left] in uint8 format
+        """
+        left, top, right, bottom = self.bbox
+        if self.encoding == "raw":
+            return self.data
+        rows, cols = bottom - top, right - left
+        if rows == 0 or cols == 0:
+            return np.empty((rows, cols), dtype=np.uint8)
+        decoded = decode_rle(self.row_lengths.astype(">u4").tobytes() + self.data, cols, rows, 8, 2)
+        return np.frombuffer(decoded, dtype=np.uint8).reshape(rows, cols)
+
+    def to_array(self) -> np.ndarray:
+        """
+        Expands the mask.
+
+        Returns:
+            numpy array with shape [H, W] in uint8 format
+        """
+        mask = np.full((self.height, self.width), self.default_color, dtype=np.uint8)
+        left, top, right, bottom = self.bbox
+        mask[top:bottom, left:right] = self.crop_array()
+        return mask
+
+    def __array__(self, dtype=None, copy=None):
+        mask = self.to_array()
+        return mask if dtype is None else mask.astype(dtype, copy=False)
+
+    def to_tensor(self) -> torch.Tensor:
+        """
+        Expands the mask to a MASK tensor.
+
+        Returns:
+            tensor with shape [1, H, W] in float32 format [0, 1]
+        """
+        mask = torch.full((1, self.height, self.width), self.default_color / 255.0, dtype=torch.float32)
+        left, top, right, bottom = self.bbox
+        mask[:, top:bottom, left:right] = masks_from_uint8(self.crop_array())
+        return mask
+
+    def rle_channel_bytes(self, version: int = 1) -> bytes:
+        """
+        Returns the stored rectangle as the data of a PSD RLE channel.
+
+        RLE masks are not re-encoded; only their row byte counts are written
+        in the width the file version uses.
+
+        Args:
+            version: File version (1 PSD with 2-byte row counts, 2 PSB with 4-byte ones)
+
+        Returns:
+            row byte counts followed by the PackBits rows
+        """
+        if self.encoding == "raw":
+            left, top, right, bottom = self.bbox
+            if bottom == top:
+                return b""
+            return encode_rle(self.data.tobytes(), right - left, bottom - top, 8, version)
+        return self.row_lengths.astype(">u2" if version == 1 else ">u4").tobytes() + self.data
+
+
+def compact_masks(masks: torch.Tensor, encoding: Optional[str] = None) -> List[CompactMask]:
+    """
+    Compacts every mask of a MASK batch.
+
+    Args:
+        masks: Tensor with shape [H, W], [B, H, W] or [B, 1, H, W] in the 0-1 range
+        encoding: "raw" or "rle", see CompactMask.from_array
+
+    Returns:
+        list of CompactMask, one per mask
+    """
+    masks = as_mask_batch(masks)
+    return [CompactMask.from_array(mask_tensor_to_uint8(masks[b:b + 1])[0], encoding)
+            for b in range(masks.shape[0])]
+
+
+def expand_compact_masks(masks: List[CompactMask]) -> torch.Tensor:
+    """
+    Expands same-sized compact masks into a MASK batch.
+
+    Args:
+        masks: list of CompactMask
+
+    Returns:
+        tensor with shape [B, H, W] in float32 format [0, 1]
+    """
+    if not masks:
+        raise ValueError("No masks provided")
+    if any(mask.size != masks[0].size for mask in masks):
+        raise ValueError("Compact masks of a batch must all have the same size")
+    return torch.cat([mask.to_tensor() for mask in masks])
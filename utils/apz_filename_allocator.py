@@ -0,0 +1,138 @@
+"""
+Output Filename Allocation for the PSD Savers
+
+This module hands out unique output filenames ("output.psd", "output_002.psd",
+"output_003.psd", ...), or runs of numbered ones for batches ("output_001.psd",
+"output_002.psd", ...) that continue the same sequence. The output directory
+is scanned once per filename to find the highest counter in use, and the
+counter is then cached, so the next name is found without probing every
+existing file. Names are claimed by creating an empty file with O_CREAT |
+O_EXCL, which makes the allocation safe between threads and between processes
+sharing the same output directory.
+"""
+
+import os
+import re
+import threading
+from typing import Dict, List, Tuple
+
+# Next counter to try, keyed by (directory, name, extension)
+_next_counters: Dict[Tuple[str, str, str], int] = {}
+_counters_lock = threading.Lock()
+
+
+def _format_filename(name: str, ext: str, counter: int, numbered: bool = False) -> str:
+    return f"{name}{ext}" if counter == 1 and not numbered else f"{name}_{counter:03d}{ext}"
+
+
+def _scan_next_counter(directory: str, name: str, ext: str) -> int:
+    """Returns one past the highest counter used by name in the directory."""
+    pattern = re.compile(rf"{re.escape(name)}(?:_(\d{{3,}}))?{re.escape(ext)}")
+    highest = 0
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                match = pattern.fullmatch(entry.name)
+                if match:
+                    highest = max(highest, int(match.group(1)) if match.group(1) else 1)
+    except FileNotFoundError:
+        pass
+    return highest + 1
+
+
+def _claim_next(output_dir: str, name: str, ext: str, numbered: bool = False) -> str:
+    """Claims the next free name of the sequence; the caller holds _counters_lock."""
+    key = (os.path.abspath(output_dir), name, ext)
+    counter = _next_counters.get(key)
+    if counter is None:
+        counter = _scan_next_counter(output_dir, name, ext)
+
+    while True:
+        path = os.path.join(output_dir, _format_filename(name, ext, counter, numbered))
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o666)
+        except FileExistsError:
+            # Claimed by another process since the scan
+            counter += 1
+            continue
+        os.close(fd)
+        _next_counters[key] = counter + 1
+        return path
+
+
+def allocate_filename(filename: str, output_dir: str = ".", overwrite: bool = False) -> str:
+    """
+    Claims a unique file path in the output directory.
+
+    The first file gets the plain filename, the following ones a three-digit
+    counter ("output_002.psd"). The claimed file is created empty; callers
+    write their data over it (and should call release_filename if they fail).
+
+    Args:
+        filename: Base filename (e.g., "output.psd")
+        output_dir: Output directory, created if missing
+        overwrite: Return the plain filename without claiming it, so an
+            existing file is overwritten
+
+    Returns:
+        Path of the claimed file
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    if overwrite:
+        return os.path.join(output_dir, filename)
+
+    name, ext = os.path.splitext(filename)
+    with _counters_lock:
+        return _claim_next(output_dir, name, ext)
+
+
+def allocate_filenames(filename: str, count: int, output_dir: str = ".", overwrite: bool = False) -> List[str]:
+    """
+    Claims count numbered file paths in the output directory, e.g. for a batch.
+
+    Every name carries a counter, the first one included ("output_001.psd",
+    "output_002.psd", ...). The names continue the sequence allocate_filename
+    uses for the same filename, so saving the batch again goes on at the next
+    free counter ("output_003.psd", ...) instead of stacking suffixes.
+
+    Args:
+        filename: Base filename (e.g., "output.psd")
+        count: Number of paths to claim
+        output_dir: Output directory, created if missing
+        overwrite: Return "_001" to count without claiming them, so existing
+            files are overwritten
+
+    Returns:
+        List of claimed paths, in counter order
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    name, ext = os.path.splitext(filename)
+    if overwrite:
+        return [os.path.join(output_dir, _format_filename(name, ext, counter, numbered=True))
+                for counter in range(1, count + 1)]
+
+    paths = []
+    with _counters_lock:
+        try:
+            for _ in range(count):
+                paths.append(_claim_next(output_dir, name, ext, numbered=True))
+        except OSError:
+            for path in paths:
+                release_filename(path)
+            raise
+    return paths
+
+
+def release_filename(path: str) -> None:
+    """Removes a claimed file that was never written to."""
+    try:
+        if os.path.getsize(path) == 0:
+            os.remove(path)
+    except OSError:
+        pass
+
+
+def reset_filename_counters() -> None:
+    """Forgets the cached counters; the next allocations rescan their directories."""
+    with _counters_lock:
+        _next_counters.clear()
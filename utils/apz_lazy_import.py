@@ -0,0 +1,126 @@
+"""
+Lazy Utility Imports for ComfyUI
+
+ComfyUI imports every custom node module while it boots, but a node only
+needs psd-tools, PIL and torch once it runs. Node modules therefore bind
+their utility functions with lazy_function: the utility module is imported
+on the first call, so importing the nodes only costs the standard library.
+
+This module itself must only import the standard library.
+"""
+
+import importlib
+import importlib.machinery
+import importlib.util
+import os
+import sys
+import threading
+from types import ModuleType
+from typing import Callable, Dict, List
+
+_UTILS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+_modules: Dict[str, ModuleType] = {}
+_modules_lock = threading.RLock()
+_install_attempted = False
+# Utility modules bound with lazy_function, in binding order
+_bound_modules: Dict[str, None] = {}
+
+
+# Package our utility modules are imported under when another "utils"
+# package shadows ours; it is registered in sys.modules once, so every
+# utility module (and the relative imports between them) is loaded once
+FALLBACK_PACKAGE = "apz_psd_tools_utils"
+
+
+def _fallback_package() -> ModuleType:
+    with _modules_lock:
+        package = sys.modules.get(FALLBACK_PACKAGE)
+        if package is None:
+            spec = importlib.machinery.ModuleSpec(FALLBACK_PACKAGE, None, is_package=True)
+            spec.submodule_search_locations = [_UTILS_DIR]
+            package = importlib.util.module_from_spec(spec)
+            sys.modules[FALLBACK_PACKAGE] = package
+        return package
+
+
+def _import_utility(module_name: str) -> ModuleType:
+    try:
+        return importlib.import_module(f"utils.{module_name}")
+    except ModuleNotFoundError as e:
+        # Another package named "utils" (ComfyUI has one) shadows ours; only a
+        # missing utils module means that, a missing dependency is re-raised
+        if e.name not in ("utils", f"utils.{module_name}"):
+            raise
+    _fallback_package()
+    return importlib.import_module(f"{FALLBACK_PACKAGE}.{module_name}")
+
+
+def _install_dependencies() -> bool:
+    """Runs the automatic dependency installer once per process."""
+    global _install_attempted
+    if _install_attempted:
+        return False
+    _install_attempted = True
+    extension_root = os.path.dirname(_UTILS_DIR)
+    if extension_root not in sys.path:
+        sys.path.insert(0, extension_root)
+    try:
+        from auto_installer import ensure_dependencies
+    except ImportError:
+        return False
+    print("📦 Installing missing PSD Tools dependencies...")
+    return ensure_dependencies()
+
+
+def load_utility(module_name: str) -> ModuleType:
+    """
+    Imports a utility module once and returns it.
+
+    A dependency missing at that point is installed with the automatic
+    dependency installer (once per process) before the import is retried.
+
+    Args:
+        module_name: Module name in utils/ (e.g. "apz_psd_tools_utility")
+
+    Returns:
+        the utility module
+    """
+    with _modules_lock:
+        module = _modules.get(module_name)
+        if module is None:
+            try:
+                module = _import_utility(module_name)
+            except ModuleNotFoundError as e:
+                print(f"⚠️ {module_name} needs {e.name}, which is not installed")
+                if not _install_dependencies():
+                    raise
+                module = _import_utility(module_name)
+            _modules[module_name] = module
+        return module
+
+
+def bound_utility_modules() -> List[str]:
+    """Returns the utility modules bound with lazy_function so far."""
+    return list(_bound_modules)
+
+
+def lazy_function(module_name: str, name: str) -> Callable:
+    """
+    Returns a function that imports its utility module on the first call.
+
+    Args:
+        module_name: Module name in utils/
+        name: Function name in that module
+
+    Returns:
+        function forwarding every call to module_name.name
+    """
+    _bound_modules.setdefault(module_name)
+
+    def call(*args, **kwargs):
+        return getattr(load_utility(module_name), name)(*args, **kwargs)
+
+    call.__name__ = call.__qualname__ = name
+    call.__doc__ = f"Calls {module_name}.{name}, importing {module_name} on first use."
+    return call
@@ -0,0 +1,309 @@
+"""
+Batched Mask Engine for ComfyUI
+
+This module provides the mask operations used by the savers, the loader and
+PSDMaskUtility. Every operation works on a whole MASK batch [B, H, W] at once,
+and the element-wise ones write their result into the batch they were given,
+so no full-size temporaries are allocated. Operations made of several steps (normalize,
+subtract, threshold) run them row chunk by row chunk, so each chunk is read
+from memory once and the remaining steps work on it while it is in cache.
+
+Masks are float tensors in the 0-1 range, as ComfyUI's MASK type.
+"""
+
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+from .apz_tensor_conversion import as_tensor, mask_tensor_to_uint8, uint8_to_float_tensor
+
+# Number of elements processed per chunk by the multi-step operations
+CHUNK_ELEMENTS = 1 << 20
+
+MASK_OPERATIONS = ("union", "intersect", "subtract")
+
+# Resampling filters for resize_masks: interpolate mode and antialias flag.
+# "antialias" is bicubic with a filter widened to the scale factor when
+# shrinking, the closest match to PIL's LANCZOS; "area" averages the source
+# pixels under each target pixel (and repeats them when enlarging)
+MASK_RESIZE_FILTERS = {
+    "antialias": ("bicubic", True),
+    "bicubic": ("bicubic", False),
+    "bilinear": ("bilinear", False),
+    "area": ("area", False),
+    "nearest": ("nearest-exact", False),
+}
+DEFAULT_MASK_RESIZE_FILTER = "antialias"
+
+# Older spellings accepted by combine_masks
+_OPERATION_ALIASES = {"intersection": "intersect", "difference": "subtract"}
+
+
+def as_mask_batch(mask: Union[torch.Tensor, np.ndarray]) -> torch.Tensor:
+    """
+    Returns a mask as a [B, H, W] tensor view, without copying it.
+
+    Args:
+        mask: Tensor or numpy array with shape [H, W], [B, H, W] or
+            [B, C, H, W] (first channel is used)
+
+    Returns:
+        tensor with shape [B, H, W]
+    """
+    mask = as_tensor(mask)
+    if mask.dim() == 2:
+        mask = mask.unsqueeze(0)
+    elif mask.dim() == 4:
+        mask = mask[:, 0]
+    if mask.dim() != 3:
+        raise ValueError(f"Expected a 2D, 3D or 4D mask, got shape {tuple(mask.shape)}")
+    return mask
+
+
+def masks_from_uint8(mask: Union[np.ndarray, torch.Tensor]) -> torch.Tensor:
+    """
+    Converts 8-bit masks to a float32 MASK batch in one pass.
+
+    Args:
+        mask: uint8 array or tensor with shape [H, W] or [B, H, W]
+
+    Returns:
+        tensor with shape [B, H, W] in float32 format [0, 1]
+    """
+    return uint8_to_float_tensor(as_mask_batch(mask))
+
+
+def _row_chunks(*masks: torch.Tensor) -> Iterator[Tuple[torch.Tensor, ...]]:
+    """Yields matching [rows, W] views of same-shaped [B, H, W] batches."""
+    if not all(mask.is_contiguous() for mask in masks):
+        raise ValueError("Mask batches must be contiguous to be modified in place")
+    rows = [mask.view(-1, mask.shape[-1]) for mask in masks]
+    width = max(1, masks[0].shape[-1])
+    rows_per_chunk = max(1, CHUNK_ELEMENTS // width)
+    for start in range(0, rows[0].shape[0], rows_per_chunk):
+        yield tuple(flat[start:start + rows_per_chunk] for flat in rows)
+
+
+def mask_ranges(masks: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    Returns the minimum and maximum of every mask of a batch in one reduction.
+
+    Args:
+        masks: tensor with shape [B, H, W]
+
+    Returns:
+        tuple of (minimums, maximums), tensors with shape [B]
+    """
+    if masks.numel() == 0:
+        zeros = masks.new_zeros(masks.shape[0])
+        return zeros, zeros
+    return torch.aminmax(masks.reshape(masks.shape[0], -1), dim=1)
+
+
+def mask_normalization(masks: torch.Tensor) -> Optional[Tuple[torch.Tensor, torch.Tensor]]:
+    """
+    Returns the scale and offset normalize_masks applies to every mask of a batch.
+
+    A mask is normalized as (mask * scale + offset).clamp(0, 1); the ranges
+    of the whole batch come from a single reduction and nothing is copied.
+
+    Args:
+        masks: float tensor with shape [B, H, W]
+
+    Returns:
+        tuple of (scales, offsets), tensors with shape [B], or None when
+        every mask is already in 0-1
+    """
+    minimums, maximums = mask_ranges(masks)
+    unit = (minimums >= 0) & (maximums <= 1)
+    if bool(unit.all()):
+        return None
+
+    byte_range = (minimums >= 0) & (maximums <= 255)
+    spread = maximums - minimums
+    scale = torch.where(unit, torch.ones_like(spread),
+                        torch.where(byte_range, torch.full_like(spread, 1.0 / 255.0),
+                                    torch.where(spread > 0, 1.0 / spread.clamp(min=1e-12),
+                                                torch.zeros_like(spread))))
+    offset = torch.where(unit | byte_range, torch.zeros_like(spread), -minimums * scale)
+    return scale, offset
+
+
+def normalize_masks(masks: torch.Tensor, inplace: bool = True) -> torch.Tensor:
+    """
+    Brings every mask of a batch to the 0-1 range.
+
+    Masks already in 0-1 are left alone, masks in 0-255 are divided by 255
+    and any other range is stretched to 0-1 (a uniform mask becomes 0). The
+    ranges of the whole batch come from a single reduction, and only the
+    masks that need it are scaled, chunk by chunk.
+
+    Args:
+        masks: float tensor with shape [B, H, W]
+        inplace: Write into masks; otherwise masks is only copied if one of
+            them actually needs scaling
+
+    Returns:
+        the normalized batch (masks itself when nothing had to change)
+    """
+    normalization = mask_normalization(masks)
+    if normalization is None:
+        return masks
+    scale, offset = normalization
+
+    if not inplace:
+        masks = masks.clone()
+    for index in torch.nonzero((scale != 1) | (offset != 0)).flatten().tolist():
+        index_scale, index_offset = float(scale[index]), float(offset[index])
+        for (chunk,) in _row_chunks(masks[index:index + 1]):
+            chunk.mul_(index_scale).add_(index_offset).clamp_(0.0, 1.0)
+    return masks
+
+
+def invert_masks(masks: torch.Tensor) -> torch.Tensor:
+    """Replaces every mask of a batch by 1 - mask, in place."""
+    return torch.add(masks.new_ones(()), masks, alpha=-1, out=masks)
+
+
+def union_masks(masks: torch.Tensor, other: torch.Tensor) -> torch.Tensor:
+    """Keeps the maximum of masks and other in masks (other may broadcast)."""
+    return torch.maximum(masks, other, out=masks)
+
+
+def intersect_masks(masks: torch.Tensor, other: torch.Tensor) -> torch.Tensor:
+    """Keeps the minimum of masks and other in masks (other may broadcast)."""
+    return torch.minimum(masks, other, out=masks)
+
+
+def subtract_masks(masks: torch.Tensor, other: torch.Tensor) -> torch.Tensor:
+    """Removes other from masks (clamped at 0), in place (other may have a batch of 1)."""
+    other = as_mask_batch(other).contiguous()
+    for index in range(masks.shape[0]):
+        other_index = index if other.shape[0] > 1 else 0
+        for chunk, other_chunk in _row_chunks(masks[index:index + 1], other[other_index:other_index + 1]):
+            chunk.sub_(other_chunk).clamp_(min=0.0)
+    return masks
+
+
+def threshold_masks(masks: torch.Tensor, threshold: float = 0.5) -> torch.Tensor:
+    """
+    Turns every mask of a batch into a hard 0/1 mask, in place.
+
+    Args:
+        masks: float tensor with shape [B, H, W]
+        threshold: Values at or above the threshold become 1, others 0
+
+    Returns:
+        masks
+    """
+    for (chunk,) in _row_chunks(masks):
+        chunk.copy_(chunk >= threshold)
+    return masks
+
+
+def combine_masks(masks: Union[torch.Tensor, Sequence[torch.Tensor]],
+                  operation: str = "union") -> torch.Tensor:
+    """
+    Combines masks into one.
+
+    A [B, H, W] batch is reduced along the batch dimension in one reduction.
+    A list of same-sized masks is accumulated into a copy of the first one.
+
+    Args:
+        masks: tensor with shape [B, H, W] or list of masks
+        operation: "union", "intersect" or "subtract" (the first mask minus
+            all the others)
+
+    Returns:
+        tensor with shape [1, H, W]
+    """
+    operation = _OPERATION_ALIASES.get(operation, operation)
+    if operation not in MASK_OPERATIONS:
+        raise ValueError(f"Unknown operation: {operation}, expected one of {MASK_OPERATIONS}")
+
+    if isinstance(masks, torch.Tensor):
+        masks = as_mask_batch(masks)
+        if masks.shape[0] == 0:
+            raise ValueError("No masks provided")
+        if operation == "union":
+            return masks.amax(dim=0, keepdim=True)
+        if operation == "intersect":
+            return masks.amin(dim=0, keepdim=True)
+        result = masks[:1].clone()
+        return subtract_masks(result, masks[1:].amax(dim=0, keepdim=True)) if masks.shape[0] > 1 else result
+
+    masks = [as_mask_batch(mask) for mask in masks]
+    if not masks:
+        raise ValueError("No masks provided")
+    result = masks[0][:1].clone()
+    apply = {"union": union_masks, "intersect": intersect_masks, "subtract": subtract_masks}[operation]
+    for mask in masks[1:]:
+        apply(result, mask[:1].to(result.dtype))
+    return result
+
+
+def resize_masks(masks: torch.Tensor, height: int, width: int,
+                 resize_filter: str = DEFAULT_MASK_RESIZE_FILTER) -> torch.Tensor:
+    """
+    Resizes every mask of a batch in one interpolation call.
+
+    Args:
+        masks: tensor with shape [B, H, W]
+        height: Target height
+        width: Target width
+        resize_filter: One of MASK_RESIZE_FILTERS
+
+    Returns:
+        float tensor with shape [B, height, width] (masks itself if it
+        already has that size)
+    """
+    if resize_filter not in MASK_RESIZE_FILTERS:
+        raise ValueError(f"Unknown mask resize filter: {resize_filter}, "
+                         f"expected one of {list(MASK_RESIZE_FILTERS)}")
+    masks = as_mask_batch(masks)
+    if tuple(masks.shape[1:]) == (height, width):
+        return masks
+    if not masks.is_floating_point():
+        masks = masks.float()
+
+    mode, antialias = MASK_RESIZE_FILTERS[resize_filter]
+    options = {}
+    if mode in ("bilinear", "bicubic"):
+        options = {"align_corners": False, "antialias": antialias}
+    resized = F.interpolate(masks[:, None], size=(height, width), mode=mode, **options)[:, 0]
+    # Bicubic overshoots at hard edges
+    return resized.clamp_(0.0, 1.0) if mode == "bicubic" else resized
+
+
+def resize_mask_arrays(masks: Sequence[np.ndarray],
+                       sizes: Sequence[Tuple[int, int]],
+                       resize_filter: str = DEFAULT_MASK_RESIZE_FILTER) -> List[np.ndarray]:
+    """
+    Resizes a list of 8-bit masks, batching masks that share a source and target size.
+
+    Masks already at their target size are returned as they are. The others
+    are grouped by (source size, target size) and every group is stacked
+    and resized with one resize_masks call.
+
+    Args:
+        masks: uint8 numpy arrays with shape [H, W]
+        sizes: (height, width) target of every mask
+        resize_filter: One of MASK_RESIZE_FILTERS
+
+    Returns:
+        list of uint8 numpy arrays with the target sizes
+    """
+    results = list(masks)
+    groups: Dict[Tuple[Tuple[int, int], Tuple[int, int]], List[int]] = {}
+    for index, (mask, size) in enumerate(zip(masks, sizes)):
+        if tuple(mask.shape) != tuple(size):
+            groups.setdefault((tuple(mask.shape), tuple(size)), []).append(index)
+
+    for (_, (height, width)), indices in groups.items():
+        batch = masks_from_uint8(np.stack([masks[index] for index in indices]))
+        resized = mask_tensor_to_uint8(resize_masks(batch, height, width, resize_filter))
+        for index, mask in zip(indices, resized):
+            results[index] = mask
+    return results
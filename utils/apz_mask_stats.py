@@ -0,0 +1,126 @@
+"""
+Mask Statistics for ComfyUI
+
+This module measures MASK batches: coverage, tight bounding box, minimum,
+maximum and whether a mask is empty or full. All masks of a batch are
+measured together in a single pass over the data, row chunk by row chunk,
+so the saver can decide which layers to skip, which masks to drop and where
+to trim without scanning a mask more than once.
+"""
+
+from typing import List, NamedTuple, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import torch
+
+from .apz_mask_engine import CHUNK_ELEMENTS, as_mask_batch
+
+
+class MaskStats(NamedTuple):
+    """
+    Statistics of one mask.
+
+    Attributes:
+        coverage: Percentage of pixels that are not 0
+        bbox: (left, top, right, bottom) of the pixels that are not 0, or
+            None for an empty mask
+        minimum: Smallest value, in the 0-1 range
+        maximum: Largest value, in the 0-1 range
+        is_empty: Every pixel is 0
+        is_full: Every pixel is 1 (255 for 8-bit masks)
+    """
+    coverage: float
+    bbox: Optional[Tuple[int, int, int, int]]
+    minimum: float
+    maximum: float
+    is_empty: bool
+    is_full: bool
+
+
+def _first_last(flags: torch.Tensor) -> Optional[Tuple[int, int]]:
+    indices = torch.nonzero(flags).flatten()
+    if indices.numel() == 0:
+        return None
+    return int(indices[0]), int(indices[-1]) + 1
+
+
+def compute_mask_stats(masks: Union[torch.Tensor, np.ndarray]) -> List[MaskStats]:
+    """
+    Measures every mask of a batch in one pass.
+
+    Each row chunk of the batch is read once; the non-zero test, the pixel
+    count, the row and column occupancy and the extrema are all taken from
+    it while it is in cache.
+
+    Args:
+        masks: Tensor or numpy array with shape [H, W], [B, H, W] or
+            [B, 1, H, W]; float masks in the 0-1 range or uint8 masks
+
+    Returns:
+        list of MaskStats, one per mask
+    """
+    masks = as_mask_batch(masks)
+    batch_size, height, width = masks.shape
+    full_value = 255 if masks.dtype == torch.uint8 else 1.0
+    scale = 1.0 / 255.0 if masks.dtype == torch.uint8 else 1.0
+
+    if masks.numel() == 0:
+        return [MaskStats(0.0, None, 0.0, 0.0, True, False) for _ in range(batch_size)]
+
+    counts = torch.zeros(batch_size, dtype=torch.int64)
+    rows = torch.zeros(batch_size, height, dtype=torch.bool)
+    cols = torch.zeros(batch_size, width, dtype=torch.bool)
+    minimums, maximums = [], []
+
+    rows_per_chunk = max(1, CHUNK_ELEMENTS // max(1, batch_size * width))
+    for y0 in range(0, height, rows_per_chunk):
+        chunk = masks[:, y0:y0 + rows_per_chunk]
+        nonzero = chunk != 0
+        counts += nonzero.sum(dim=(1, 2))
+        rows[:, y0:y0 + rows_per_chunk] = nonzero.any(dim=2)
+        cols |= nonzero.any(dim=1)
+        chunk_min, chunk_max = torch.aminmax(chunk.reshape(batch_size, -1), dim=1)
+        minimums.append(chunk_min)
+        maximums.append(chunk_max)
+
+    minimums = torch.stack(minimums).amin(dim=0)
+    maximums = torch.stack(maximums).amax(dim=0)
+
+    stats = []
+    for b in range(batch_size):
+        row_span, col_span = _first_last(rows[b]), _first_last(cols[b])
+        bbox = (col_span[0], row_span[0], col_span[1], row_span[1]) if row_span else None
+        stats.append(MaskStats(
+            coverage=100.0 * int(counts[b]) / (height * width),
+            bbox=bbox,
+            minimum=float(minimums[b]) * scale,
+            maximum=float(maximums[b]) * scale,
+            is_empty=bbox is None,
+            is_full=bool(minimums[b] >= full_value)
+        ))
+    return stats
+
+
+def summarize_mask_stats(stats: Sequence[MaskStats]) -> MaskStats:
+    """
+    Combines the statistics of the masks of a batch into one.
+
+    Coverage is averaged, the bounding box is the union of the masks' boxes,
+    and the batch is empty (full) only if every mask is.
+    """
+    if not stats:
+        return MaskStats(0.0, None, 0.0, 0.0, True, False)
+
+    boxes = [s.bbox for s in stats if s.bbox is not None]
+    bbox = None
+    if boxes:
+        bbox = (min(b[0] for b in boxes), min(b[1] for b in boxes),
+                max(b[2] for b in boxes), max(b[3] for b in boxes))
+    return MaskStats(
+        coverage=sum(s.coverage for s in stats) / len(stats),
+        bbox=bbox,
+        minimum=min(s.minimum for s in stats),
+        maximum=max(s.maximum for s in stats),
+        is_empty=all(s.is_empty for s in stats),
+        is_full=all(s.is_full for s in stats)
+    )
@@ -10,6 +10,8 @@ import numpy as np
 from PIL import Image
 from typing import List, Tuple, Optional, Union
 
+from .apz_tensor_conversion import image_tensor_to_uint8, mask_tensor_to_uint8
+
 # Import pytoshop only when needed to avoid import errors
 try:
     import pytoshop
@@ -41,21 +43,9 @@ def tensor_to_numpy_array(image_tensor: torch.Tensor) -> np.ndarray:
     Returns:
         numpy array with shape [H, W, C] in uint8 format
     """
-    # Ensure the tensor is on the CPU and in the correct format
-    if image_tensor.is_floating_point():
-        image_tensor = (image_tensor * 255).type(torch.uint8)
-    
-    image_tensor = image_tensor.cpu()
-    
-    # Convert the tensor to [B, H, W, C] format if it's in [B, C, H, W]
-    if len(image_tensor.shape) == 4 and image_tensor.shape[1] == 3 or image_tensor.shape[1] == 4:
-        image_tensor = image_tensor.permute(0, 2, 3, 1)
-    
     # Take the first image from the batch
-    img_tensor = image_tensor[0]
-    img_np = img_tensor.numpy().astype(np.uint8)
-    
-    return img_np
+    return image_tensor_to_uint8(image_tensor[:1] if image_tensor.dim() == 4 else image_tensor,
+                                 channels=None)[0]
 
 
 def pil_to_numpy_array(pil_image: Image.Image) -> np.ndarray:
@@ -72,7 +62,7 @@ def pil_to_numpy_array(pil_image: Image.Image) -> np.ndarray:
     if pil_image.mode != 'RGB':
         pil_image = pil_image.convert('RGB')
     
-    return np.array(pil_image)
+    return np.asarray(pil_image)
 
 
 def mask_tensor_to_numpy_array(mask_tensor: torch.Tensor) -> np.ndarray:
@@ -85,27 +75,8 @@ def mask_tensor_to_numpy_array(mask_tensor: torch.Tensor) -> np.ndarray:
     Returns:
         numpy array with shape [H, W] in uint8 format (grayscale)
     """
-    # Ensure the tensor is on the CPU
-    mask_tensor = mask_tensor.cpu()
-    
-    # Handle different tensor shapes
-    if len(mask_tensor.shape) == 4 and mask_tensor.shape[1] == 1:
-        # [B, 1, H, W] -> [B, H, W]
-        mask_tensor = mask_tensor.squeeze(1)
-    elif len(mask_tensor.shape) == 4 and mask_tensor.shape[1] == 3:
-        # [B, 3, H, W] -> [B, H, W] (take first channel)
-        mask_tensor = mask_tensor[:, 0, :, :]
-    
     # Take the first mask from the batch
-    mask = mask_tensor[0]
-    
-    # Convert to numpy and ensure uint8
-    if mask.is_floating_point():
-        mask = (mask * 255).type(torch.uint8)
-    else:
-        mask = mask.type(torch.uint8)
-    
-    return mask.numpy()
+    return mask_tensor_to_uint8(mask_tensor[:1] if mask_tensor.dim() > 2 else mask_tensor)[0]
 
 
 def create_psd_layer(image_data: np.ndarray, 
@@ -0,0 +1,299 @@
+"""
+Incremental PSD Update Utilities for ComfyUI
+
+This module rewrites an existing PSD file written by the savers while
+re-encoding only the layers whose content changed. Every layer's content hash
+is stored in a private image resource; on update the records and encoded
+channel bytes of unchanged layers are copied from the old file with
+os.copy_file_range (or sendfile), and the new file replaces the old one
+atomically.
+"""
+
+import hashlib
+import os
+import struct
+import tempfile
+from typing import Callable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    from psd_tools.constants import ColorMode
+    from psd_tools.psd.header import FileHeader
+    from psd_tools.psd.color_mode_data import ColorModeData
+    from psd_tools.psd.image_resources import ImageResource, ImageResources
+    from psd_tools.psd.layer_and_mask import LayerRecord, ChannelDataList
+    from psd_tools.psd.image_data import ImageData
+    PSD_TOOLS_AVAILABLE = True
+except ImportError:
+    PSD_TOOLS_AVAILABLE = False
+    ColorMode = None
+    FileHeader = None
+    ColorModeData = None
+    ImageResource = None
+    ImageResources = None
+    LayerRecord = None
+    ChannelDataList = None
+    ImageData = None
+
+# Private image resource (plugin resource range) holding the layer content hashes
+LAYER_HASH_RESOURCE_ID = 4080
+LAYER_HASH_MAGIC = b"APZmedia-layer-hashes-v1\n"
+
+# Encodes one layer on demand: returns (LayerRecord, ChannelDataList)
+LayerEncoder = Callable[[], Tuple["LayerRecord", "ChannelDataList"]]
+
+
+def compute_layer_hash(rgba: np.ndarray, mask: Optional[np.ndarray], name: str,
+                       left: int, top: int, blend_mode: str) -> bytes:
+    """
+    Hashes everything that ends up in a layer's record and channels.
+
+    Args:
+        rgba: numpy array with shape [H, W, 4] in uint8 format
+        mask: Optional numpy array with shape [H, W] in uint8 format
+        name: Layer name
+        left: Offset of the layer from the left of the canvas
+        top: Offset of the layer from the top of the canvas
+        blend_mode: Blend mode name
+
+    Returns:
+        16-byte digest
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(struct.pack(">iiII?", left, top, rgba.shape[1], rgba.shape[0], mask is not None))
+    digest.update(f"{name}\0{blend_mode}\0".encode("utf-8"))
+    digest.update(np.ascontiguousarray(rgba).data)
+    if mask is not None:
+        digest.update(np.ascontiguousarray(mask).data)
+    return digest.digest()
+
+
+def create_layer_hash_resource(hashes: Sequence[bytes]) -> "ImageResource":
+    """
+    Creates the private image resource storing layer hashes (bottom to top).
+    """
+    return ImageResource(key=LAYER_HASH_RESOURCE_ID, name="APZmedia layer hashes",
+                         data=LAYER_HASH_MAGIC + b"".join(hashes))
+
+
+def read_layer_hashes(image_resources: "ImageResources") -> Optional[List[bytes]]:
+    """
+    Reads the layer hashes stored by create_layer_hash_resource.
+
+    Returns:
+        list of 16-byte digests (bottom to top), or None if absent or invalid
+    """
+    data = image_resources.get_data(LAYER_HASH_RESOURCE_ID)
+    if not isinstance(data, bytes) or not data.startswith(LAYER_HASH_MAGIC):
+        return None
+    data = data[len(LAYER_HASH_MAGIC):]
+    if len(data) % 16:
+        return None
+    return [data[i:i + 16] for i in range(0, len(data), 16)]
+
+
+def _copy_range(src_fd: int, dst_fd: int, offset: int, count: int) -> None:
+    """Copies count bytes at offset of src_fd to the current position of dst_fd."""
+    while count > 0:
+        copied = 0
+        try:
+            if hasattr(os, "copy_file_range"):
+                copied = os.copy_file_range(src_fd, dst_fd, count, offset)
+            elif hasattr(os, "sendfile"):
+                copied = os.sendfile(dst_fd, src_fd, offset, count)
+        except OSError:
+            # Cross-device or unsupported file system: copy through user space
+            copied = 0
+        if not copied:
+            chunk = os.pread(src_fd, min(count, 1 << 24), offset)
+            if not chunk:
+                raise IOError("Unexpected end of file while copying layer data")
+            copied = os.write(dst_fd, chunk)
+        offset += copied
+        count -= copied
+
+
+class PSDLayout:
+    """
+    Byte ranges of the sections and layers of a PSD file written by the savers.
+
+    Attributes:
+        header: psd_tools FileHeader
+        image_resources: psd_tools ImageResources
+        hashes: Layer hashes stored in the file (bottom to top), or None
+        record_ranges: (offset, length) of every layer record
+        channel_ranges: (offset, length) of every layer's channel data
+        layer_bboxes: (left, top, right, bottom) of every layer
+        layer_info_end: Offset of the end of the layer info section
+        layer_and_mask_end: Offset of the end of the layer and mask section
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as fp:
+            self.header = FileHeader.read(fp)
+            if self.header.version != 1 or self.header.depth != 8 or self.header.color_mode != ColorMode.RGB:
+                raise ValueError("Only 8-bit RGB PSD files can be updated in place")
+
+            ColorModeData.read(fp)
+            self.image_resources = ImageResources.read(fp)
+            self.hashes = read_layer_hashes(self.image_resources)
+
+            (layer_and_mask_length,) = struct.unpack(">I", fp.read(4))
+            self.layer_and_mask_end = fp.tell() + layer_and_mask_length
+            (layer_info_length,) = struct.unpack(">I", fp.read(4))
+            self.layer_info_end = fp.tell() + layer_info_length
+
+            layer_count = abs(struct.unpack(">h", fp.read(2))[0]) if layer_info_length else 0
+            self.record_ranges = []
+            self.layer_bboxes = []
+            records = []
+            for _ in range(layer_count):
+                start = fp.tell()
+                record = LayerRecord.read(fp)
+                records.append(record)
+                self.record_ranges.append((start, fp.tell() - start))
+                self.layer_bboxes.append((record.left, record.top, record.right, record.bottom))
+
+            self.channel_ranges = []
+            position = fp.tell()
+            for record in records:
+                length = sum(info.length for info in record.channel_info)
+                self.channel_ranges.append((position, length))
+                position += length
+
+            fp.seek(self.layer_and_mask_end)
+            (self.image_data_compression,) = struct.unpack(">H", fp.read(2))
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        return self.header.width, self.header.height
+
+    def read_composite(self) -> Optional[np.ndarray]:
+        """
+        Reads the stored merged image when it is uncompressed.
+
+        Returns:
+            numpy array with shape [3, H, W] in uint8 format, or None
+        """
+        if self.image_data_compression != 0 or self.header.channels != 3:
+            return None
+        width, height = self.size
+        planes = np.fromfile(self.path, dtype=np.uint8, count=3 * width * height,
+                             offset=self.layer_and_mask_end + 2)
+        if planes.size != 3 * width * height:
+            return None
+        return planes.reshape(3, height, width)
+
+
+def read_psd_layout(path: str) -> Optional[PSDLayout]:
+    """
+    Reads the layout of a PSD file previously written with layer hashes.
+
+    Returns:
+        PSDLayout, or None if the file cannot be updated in place
+    """
+    try:
+        layout = PSDLayout(path)
+    except (OSError, ValueError, struct.error) as e:
+        print(f"ℹ️ Cannot update {path} in place ({e}) - writing it from scratch")
+        return None
+
+    if layout.hashes is None or len(layout.hashes) != len(layout.record_ranges):
+        print(f"ℹ️ {path} has no layer hashes - writing it from scratch")
+        return None
+    return layout
+
+
+def splice_psd_update(layout: PSDLayout,
+                      canvas_width: int,
+                      canvas_height: int,
+                      layer_hashes: Sequence[bytes],
+                      layer_encoders: Sequence[LayerEncoder],
+                      composite_planes: Sequence[bytes],
+                      extra_resources: Sequence["ImageResource"] = ()) -> Tuple[int, int]:
+    """
+    Rewrites a PSD file, re-encoding only the layers whose hash is not in it.
+
+    Args:
+        layout: Layout of the existing file, from read_psd_layout
+        canvas_width: Width of the new canvas
+        canvas_height: Height of the new canvas
+        layer_hashes: Content hash of every new layer, bottom to top
+        layer_encoders: Functions encoding each layer, called for changed layers only
+        composite_planes: Raw R, G and B planes of the merged image
+        extra_resources: Image resources to add or replace (e.g. the thumbnail)
+
+    Returns:
+        tuple of (reused_layers, encoded_layers)
+    """
+    path = layout.path
+    old_index = {digest: index for index, digest in enumerate(layout.hashes)}
+
+    header = FileHeader(version=1, channels=3, height=canvas_height, width=canvas_width,
+                        depth=8, color_mode=ColorMode.RGB)
+    resources = layout.image_resources
+    for resource in list(extra_resources) + [create_layer_hash_resource(layer_hashes)]:
+        resources[resource.key] = resource
+
+    # Encode the changed layers before touching the file system
+    layers = []
+    for digest, encoder in zip(layer_hashes, layer_encoders):
+        index = old_index.get(digest)
+        layers.append(index if index is not None else encoder())
+    encoded = sum(1 for layer in layers if not isinstance(layer, int))
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(suffix=".psd.tmp", dir=directory)
+    try:
+        with open(path, "rb") as source, os.fdopen(fd, "wb", buffering=0) as out:
+            src_fd, dst_fd = source.fileno(), out.fileno()
+
+            header.write(out)
+            ColorModeData().write(out)
+            resources.write(out)
+
+            layer_and_mask_position = out.tell()
+            out.write(b"\0" * 8)
+            layer_info_start = out.tell()
+            out.write(struct.pack(">h", len(layers)))
+
+            # Records are small; changed ones are serialized, unchanged ones copied
+            for layer in layers:
+                if isinstance(layer, int):
+                    _copy_range(src_fd, dst_fd, *layout.record_ranges[layer])
+                else:
+                    layer[0].write(out)
+
+            for layer in layers:
+                if isinstance(layer, int):
+                    _copy_range(src_fd, dst_fd, *layout.channel_ranges[layer])
+                else:
+                    for channel in layer[1]:
+                        channel.write(out)
+
+            layer_info_length = out.tell() - layer_info_start
+            out.write(b"\0" * (-layer_info_length % 4))
+            layer_info_length += -layer_info_length % 4
+
+            # Global layer mask info and document tagged blocks are kept as they were
+            _copy_range(src_fd, dst_fd, layout.layer_info_end,
+                        layout.layer_and_mask_end - layout.layer_info_end)
+            layer_and_mask_end = out.tell()
+
+            image_data = ImageData()
+            image_data.set_data(composite_planes, header)
+            image_data.write(out)
+
+            out.seek(layer_and_mask_position)
+            out.write(struct.pack(">II", layer_and_mask_end - layer_and_mask_position - 4, layer_info_length))
+
+        os.chmod(temp_path, os.stat(path).st_mode & 0o7777)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    return len(layers) - encoded, encoded
@@ -0,0 +1,105 @@
+"""
+PSD Layer Stack Data Type for ComfyUI
+
+This module provides the PSD_LAYER_STACK data type that is passed between the
+layer stack builder nodes and the layer stack saver. A stack holds any number
+of layer entries (image, mask, name, offset and blend mode), so documents are
+not limited to a fixed number of node inputs.
+"""
+
+from typing import Iterator, List, Optional, Tuple, Any
+
+# ComfyUI type name for layer stacks
+LAYER_STACK_TYPE = "PSD_LAYER_STACK"
+
+# Blend modes offered by the builder nodes (psd-tools BlendMode names, lower case)
+BLEND_MODES = [
+    "normal", "dissolve",
+    "darken", "multiply", "color_burn", "linear_burn", "darker_color",
+    "lighten", "screen", "color_dodge", "linear_dodge", "lighter_color",
+    "overlay", "soft_light", "hard_light", "vivid_light", "linear_light", "pin_light", "hard_mix",
+    "difference", "exclusion", "subtract", "divide",
+    "hue", "saturation", "color", "luminosity",
+]
+
+
+class PSDLayerEntry:
+    """
+    A single layer of a layer stack.
+
+    Attributes:
+        image: IMAGE tensor [B, H, W, C]; every batch element becomes a layer
+        mask: Optional MASK tensor [B, H, W]
+        name: Layer name
+        offset: Optional (left, top) placement on the canvas, or None to center
+        blend_mode: Blend mode name from BLEND_MODES
+    """
+
+    __slots__ = ("image", "mask", "name", "offset", "blend_mode")
+
+    def __init__(self, image: Any, mask: Any = None, name: str = "Layer",
+                 offset: Optional[Tuple[int, int]] = None, blend_mode: str = "normal"):
+        if image is None:
+            raise ValueError("A layer stack entry requires an image")
+        if blend_mode not in BLEND_MODES:
+            raise ValueError(f"Unknown blend mode: {blend_mode}")
+        self.image = image
+        self.mask = mask
+        self.name = name
+        self.offset = offset
+        self.blend_mode = blend_mode
+
+    def __repr__(self) -> str:
+        shape = tuple(self.image.shape) if hasattr(self.image, 'shape') else '?'
+        return f"PSDLayerEntry(name={self.name!r}, image={shape}, mask={self.mask is not None}, offset={self.offset}, blend_mode={self.blend_mode!r})"
+
+
+class PSDLayerStack:
+    """
+    Immutable ordered collection of layer entries, top layer first.
+
+    Builder nodes never modify a stack they receive (ComfyUI may reuse cached
+    outputs), they return a new stack that shares the existing entries.
+    """
+
+    __slots__ = ("_entries",)
+
+    def __init__(self, entries: Optional[Tuple[PSDLayerEntry, ...]] = None):
+        self._entries = tuple(entries) if entries else ()
+
+    def add(self, entry: PSDLayerEntry) -> "PSDLayerStack":
+        """Returns a new stack with the entry placed on top of the existing layers."""
+        return PSDLayerStack((entry,) + self._entries)
+
+    def extend(self, other: "PSDLayerStack") -> "PSDLayerStack":
+        """Returns a new stack with all entries of another stack placed below."""
+        return PSDLayerStack(self._entries + other._entries)
+
+    @property
+    def entries(self) -> Tuple[PSDLayerEntry, ...]:
+        return self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __iter__(self) -> Iterator[PSDLayerEntry]:
+        return iter(self._entries)
+
+    def __getitem__(self, index: int) -> PSDLayerEntry:
+        return self._entries[index]
+
+    def __repr__(self) -> str:
+        return f"PSDLayerStack({len(self._entries)} layers)"
+
+    def as_lists(self) -> Tuple[List[Any], List[Any], List[str], List[Optional[Tuple[int, int]]], List[str]]:
+        """
+        Splits the stack into the parallel lists used by the PSD writers.
+
+        Returns:
+            tuple of (images, masks, names, offsets, blend_modes)
+        """
+        return ([entry.image for entry in self._entries],
+                [entry.mask for entry in self._entries],
+                [entry.name for entry in self._entries],
+                [entry.offset for entry in self._entries],
+                [entry.blend_mode for entry in self._entries])
@@ -11,6 +11,8 @@ from PIL import Image
 from typing import List, Tuple, Optional, Union
 import os
 
+from .apz_tensor_conversion import pil_to_image_tensor, pil_to_mask_tensor
+
 # Import psd-tools only when needed to avoid import errors
 try:
     from psd_tools import PSDImage
@@ -96,32 +98,7 @@ def pil_to_tensor(pil_image: Image.Image) -> torch.Tensor:
     Returns:
         PyTorch tensor with shape [1, H, W, C] in float32 format [0, 1]
     """
-    # Convert to RGB if not already
-    if pil_image.mode != 'RGB':
-        pil_image = pil_image.convert('RGB')
-    
-    # Get image dimensions
-    width, height = pil_image.size
-    
-    # Convert to tensor directly without numpy
-    try:
-        # Try using torch.from_numpy if numpy is available
-        img_array = np.array(pil_image, dtype=np.float32) / 255.0
-        tensor = torch.from_numpy(img_array).unsqueeze(0)
-    except (ImportError, RuntimeError):
-        # Fallback: convert pixel by pixel
-        pixels = list(pil_image.getdata())
-        img_data = []
-        for pixel in pixels:
-            if len(pixel) == 3:  # RGB
-                img_data.append([pixel[0]/255.0, pixel[1]/255.0, pixel[2]/255.0])
-            else:  # Handle other modes
-                img_data.append([pixel[0]/255.0, pixel[0]/255.0, pixel[0]/255.0])
-        
-        # Convert to tensor
-        tensor = torch.tensor(img_data, dtype=torch.float32).view(height, width, 3).unsqueeze(0)
-    
-    return tensor
+    return pil_to_image_tensor(pil_image)
 
 
 def pil_mask_to_tensor(pil_mask: Image.Image) -> torch.Tensor:
@@ -134,27 +111,7 @@ def pil_mask_to_tensor(pil_mask: Image.Image) -> torch.Tensor:
     Returns:
         PyTorch tensor with shape [1, H, W] in float32 format [0, 1]
     """
-    # Convert to grayscale if not already
-    if pil_mask.mode != 'L':
-        pil_mask = pil_mask.convert('L')
-    
-    # Get image dimensions
-    width, height = pil_mask.size
-    
-    # Convert to tensor directly without numpy
-    try:
-        # Try using torch.from_numpy if numpy is available
-        mask_array = np.array(pil_mask, dtype=np.float32) / 255.0
-        tensor = torch.from_numpy(mask_array).unsqueeze(0)
-    except (ImportError, RuntimeError):
-        # Fallback: convert pixel by pixel
-        pixels = list(pil_mask.getdata())
-        mask_data = [pixel/255.0 for pixel in pixels]
-        
-        # Convert to tensor
-        tensor = torch.tensor(mask_data, dtype=torch.float32).view(height, width).unsqueeze(0)
-    
-    return tensor
+    return pil_to_mask_tensor(pil_mask)
 
 
 def extract_layer_image(psd: PSDImage, layer_index: int) -> Optional[Image.Image]:
@@ -216,39 +173,24 @@ def extract_layer_mask(psd: PSDImage, layer_index: int) -> Optional[Image.Image]
             return None
         
         # Check if layer has a mask
-        if not hasattr(layer, '_record') or not hasattr(layer._record, 'mask_data') or layer._record.mask_data is None:
-            return None
-        
-        # Check if layer has mask channels
-        if not hasattr(layer, '_channels') or ChannelID.USER_LAYER_MASK not in layer._channels:
+        if not layer.has_mask():
             return None
         
-        # Get the mask channel data
-        mask_channel = layer._channels[ChannelID.USER_LAYER_MASK]
-        
-        # Get the mask data
-        if hasattr(mask_channel, 'data'):
-            mask_data = mask_channel.data
-        else:
-            return None
-        
-        # Convert bytes to numpy array
-        mask_array = np.frombuffer(mask_data, dtype=np.uint8)
-        
-        # Get mask dimensions from the mask data record
-        mask_info = layer._record.mask_data
-        mask_width = mask_info.right - mask_info.left
-        mask_height = mask_info.bottom - mask_info.top
+        mask = layer.mask
+        mask_image = mask.topil()
         
-        # Reshape the array
-        if len(mask_array) == mask_width * mask_height:
-            mask_array = mask_array.reshape((mask_height, mask_width))
-        else:
-            print(f"Warning: Mask data size {len(mask_array)} doesn't match expected size {mask_width * mask_height}")
+        # The mask has its own rectangle; outside of it the mask takes its
+        # default color. Lay it out over the layer's own rectangle.
+        layer_left, layer_top, layer_right, layer_bottom = layer.bbox
+        width = layer_right - layer_left
+        height = layer_bottom - layer_top
+        if width <= 0 or height <= 0:
             return None
         
-        # Create PIL Image
-        pil_mask = Image.fromarray(mask_array, 'L')
+        pil_mask = Image.new('L', (width, height), mask.background_color)
+        if mask_image is not None:
+            mask_left, mask_top = mask.left, mask.top
+            pil_mask.paste(mask_image.convert('L'), (mask_left - layer_left, mask_top - layer_top))
         
         return pil_mask
         
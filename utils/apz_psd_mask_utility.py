@@ -2,15 +2,19 @@
 PSD Mask Handling Utilities for ComfyUI
 
 This module provides utilities for handling masks in PSD layers,
-including mask processing, validation, and manipulation.
+including mask processing, validation, and manipulation. The mask
+arithmetic is done by the batched mask engine (apz_mask_engine).
 """
 
 import torch
 import numpy as np
 from PIL import Image
 from typing import List, Tuple, Optional, Union
-import pytoshop
-from pytoshop import enums
+
+from .apz_mask_engine import (
+    DEFAULT_MASK_RESIZE_FILTER, as_mask_batch, combine_masks, normalize_masks, resize_masks
+)
+from .apz_tensor_conversion import mask_tensor_to_uint8, uint8_to_float_tensor
 
 
 class PSDMaskUtility:
@@ -33,22 +37,12 @@ class PSDMaskUtility:
         """
         min_val, max_val = target_range
         
-        # Handle different input ranges
-        if mask.max() <= 1.0 and mask.min() >= 0.0:
-            # Assume normalized [0, 1] range
-            mask = mask * (max_val - min_val) + min_val
-        elif mask.max() <= 255 and mask.min() >= 0:
-            # Already in [0, 255] range, just ensure correct type
-            pass
-        else:
-            # Normalize to target range
-            mask_min, mask_max = mask.min(), mask.max()
-            if mask_max > mask_min:
-                mask = (mask - mask_min) / (mask_max - mask_min) * (max_val - min_val) + min_val
-            else:
-                mask = np.full_like(mask, min_val)
+        masks = as_mask_batch(np.asarray(mask, dtype=np.float32))
+        masks = normalize_masks(masks, inplace=False)
+        if (min_val, max_val) != (0, 1):
+            masks = masks * (max_val - min_val) + min_val
         
-        return mask.astype(np.uint8)
+        return masks[0].round_().clamp_(0, 255).numpy().astype(np.uint8)
     
     @staticmethod
     def create_inverted_mask(mask: np.ndarray) -> np.ndarray:
@@ -82,19 +76,10 @@ class PSDMaskUtility:
         if len(masks) == 1:
             return masks[0]
         
-        result = masks[0].copy()
-        
-        for mask in masks[1:]:
-            if operation == "union":
-                result = np.maximum(result, mask)
-            elif operation == "intersection":
-                result = np.minimum(result, mask)
-            elif operation == "difference":
-                result = np.maximum(result - mask, 0)
-            else:
-                raise ValueError(f"Unknown operation: {operation}")
-        
-        return result
+        dtype = masks[0].dtype
+        combined = combine_masks([torch.from_numpy(np.asarray(mask, dtype=np.float32)) for mask in masks],
+                                 operation)
+        return combined[0].numpy().astype(dtype)
     
     @staticmethod
     def apply_mask_to_image(image: np.ndarray, 
@@ -188,42 +173,37 @@ class PSDMaskUtility:
     
     @staticmethod
     def process_mask_for_psd(mask: Union[torch.Tensor, np.ndarray, Image.Image],
-                           target_shape: Optional[Tuple[int, int]] = None) -> np.ndarray:
+                           target_shape: Optional[Tuple[int, int]] = None,
+                           resize_filter: str = DEFAULT_MASK_RESIZE_FILTER) -> np.ndarray:
         """
         Processes a mask from various input formats for use in PSD layers.
         
         Args:
             mask: mask in various formats (tensor, numpy array, or PIL Image)
             target_shape: optional target shape (height, width) for resizing
+            resize_filter: resampling filter, one of MASK_RESIZE_FILTERS
             
         Returns:
             processed mask as numpy array [H, W] in uint8 format
         """
-        # Convert to numpy array
-        if isinstance(mask, torch.Tensor):
-            mask = mask.cpu().numpy()
-            if len(mask.shape) == 4:
-                mask = mask[0]  # Take first from batch
-            if len(mask.shape) == 3:
-                mask = mask[0]  # Take first channel
-        elif isinstance(mask, Image.Image):
-            mask = np.array(mask.convert('L'))  # Convert to grayscale
+        # Bring every input format to a [B, H, W] float batch
+        if isinstance(mask, Image.Image):
+            mask = np.asarray(mask.convert('L'))  # Convert to grayscale
+        if isinstance(mask, np.ndarray) and mask.ndim != 2:
+            raise ValueError(f"Expected 2D mask, got {mask.ndim}D")
+        masks = as_mask_batch(mask)[:1]
         
-        # Ensure 2D
-        if len(mask.shape) != 2:
-            raise ValueError(f"Expected 2D mask, got {len(mask.shape)}D")
-        
-        # Normalize to [0, 255]
-        mask = PSDMaskUtility.normalize_mask(mask)
+        if masks.dtype == torch.uint8:
+            # 8-bit masks are already in their final range
+            masks = uint8_to_float_tensor(masks)
+        else:
+            masks = normalize_masks(masks.float(), inplace=False)
         
         # Resize if target shape provided
         if target_shape:
-            from PIL import Image
-            pil_mask = Image.fromarray(mask)
-            pil_mask = pil_mask.resize((target_shape[1], target_shape[0]), Image.LANCZOS)
-            mask = np.array(pil_mask)
+            masks = resize_masks(masks, target_shape[0], target_shape[1], resize_filter)
         
-        return mask.astype(np.uint8)
+        return mask_tensor_to_uint8(masks)[0]
     
     @staticmethod
     def create_layer_mask_data(mask: np.ndarray,
@@ -248,22 +228,33 @@ class PSDMaskUtility:
     
     @staticmethod
     def batch_process_masks(masks: List[Union[torch.Tensor, np.ndarray, Image.Image]],
-                           target_shape: Optional[Tuple[int, int]] = None) -> List[np.ndarray]:
+                           target_shape: Optional[Tuple[int, int]] = None,
+                           resize_filter: str = DEFAULT_MASK_RESIZE_FILTER) -> List[np.ndarray]:
         """
         Processes a batch of masks for use in PSD layers.
         
         Args:
             masks: list of masks in various formats
             target_shape: optional target shape for resizing
+            resize_filter: resampling filter, one of MASK_RESIZE_FILTERS
             
         Returns:
             list of processed masks as numpy arrays
         """
+        # Float tensor masks of the same size are processed as one batch
+        if masks and all(isinstance(mask, torch.Tensor) and mask.is_floating_point() for mask in masks):
+            batches = [as_mask_batch(mask)[:1] for mask in masks]
+            if len({tuple(batch.shape) for batch in batches}) == 1:
+                batch = normalize_masks(torch.cat(batches).float(), inplace=True)
+                if target_shape:
+                    batch = resize_masks(batch, target_shape[0], target_shape[1], resize_filter)
+                return list(mask_tensor_to_uint8(batch))
+        
         processed_masks = []
         
         for i, mask in enumerate(masks):
             try:
-                processed_mask = PSDMaskUtility.process_mask_for_psd(mask, target_shape)
+                processed_mask = PSDMaskUtility.process_mask_for_psd(mask, target_shape, resize_filter)
                 processed_masks.append(processed_mask)
             except Exception as e:
                 print(f"Error processing mask {i}: {e}")
@@ -0,0 +1,511 @@
+"""
+Strip-wise PSD Writer for ComfyUI
+
+This module writes large documents without materializing full-size canvases.
+Layers are read from their input tensors in horizontal strips of N rows; each
+strip is converted to uint8, RLE-encoded row by row and composited into a
+strip of the merged image before the next strip is touched. Encoded channels
+and the raw merged image are spooled to temporary files (kept in memory while
+small) and then assembled into the PSD or PSB file, so peak memory depends on
+the strip size and the width of the canvas instead of its area.
+"""
+
+import shutil
+import struct
+import tempfile
+from typing import List, NamedTuple, Optional, Tuple
+
+import numpy as np
+import torch
+from PIL import Image
+
+try:
+    from psd_tools.compression import encode_rle
+    from psd_tools.constants import ColorMode, Compression
+    from psd_tools.psd.header import FileHeader
+    from psd_tools.psd.color_mode_data import ColorModeData
+    from psd_tools.psd.image_resources import ImageResources
+    PSD_TOOLS_AVAILABLE = True
+except ImportError:
+    PSD_TOOLS_AVAILABLE = False
+    encode_rle = None
+    ColorMode = None
+    Compression = None
+    FileHeader = None
+    ColorModeData = None
+    ImageResources = None
+
+from .apz_tensor_conversion import image_layout, image_tensor_to_uint8, mask_tensor_to_uint8
+from .apz_mask_engine import as_mask_batch, mask_normalization
+from .apz_psd_tools_utility import (
+    DEFAULT_MASK_RESIZE_FILTER,
+    THUMBNAIL_SIZE,
+    calculate_placed_canvas_size,
+    check_psd_tools_available,
+    choose_psd_version,
+    composite_layer_over,
+    composite_to_uint8,
+    create_layer_record,
+    create_thumbnail_resource,
+    fit_mask_batch,
+    generate_unique_filename,
+    psb_output_path,
+    release_filename
+)
+
+# Rows per strip when none is given
+DEFAULT_STRIP_ROWS = 256
+
+# Canvases with at least this many pixels are written in strips automatically
+STRIP_WRITER_MIN_PIXELS = 64 * 1024 * 1024
+
+# Spooled channels stay in memory up to this size, then move to a temporary file
+SPOOL_MEMORY_BYTES = 8 * 1024 * 1024
+
+
+class LayerSource(NamedTuple):
+    """
+    One layer read strip by strip from its tensors.
+
+    Attributes:
+        image: Tensor with shape [H, W, C] (a view into the input batch)
+        mask: Optional tensor with shape [H, W], same size as image (a view
+            into the input batch unless it had to be resized)
+        name: Layer name
+        width: Width of the layer
+        height: Height of the layer
+        mask_scale: Scale bringing the mask to 0-1, applied per strip
+        mask_offset: Offset bringing the mask to 0-1, applied per strip
+    """
+    image: torch.Tensor
+    mask: Optional[torch.Tensor]
+    name: str
+    width: int
+    height: int
+    mask_scale: float = 1.0
+    mask_offset: float = 0.0
+
+
+class _ChannelSpool:
+    """RLE row lengths and row data of one channel, appended strip by strip."""
+
+    def __init__(self, version: int):
+        self.version = version
+        self.row_lengths = bytearray()
+        self.data = tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY_BYTES)
+        self.data_size = 0
+
+    def add_rows(self, plane: np.ndarray) -> None:
+        height, width = plane.shape
+        if height == 0 or width == 0:
+            return
+        encoded = encode_rle(np.ascontiguousarray(plane).tobytes(), width, height, 8, self.version)
+        split = height * (2 if self.version == 1 else 4)
+        self.row_lengths += encoded[:split]
+        self.data.write(memoryview(encoded)[split:])
+        self.data_size += len(encoded) - split
+
+    @property
+    def length(self) -> int:
+        return 2 + len(self.row_lengths) + self.data_size
+
+    def write_to(self, fp) -> None:
+        fp.write(struct.pack(">H", Compression.RLE.value))
+        fp.write(self.row_lengths)
+        self.data.seek(0)
+        shutil.copyfileobj(self.data, fp, 1 << 20)
+        self.data.close()
+
+
+class _PlannedLayer(NamedTuple):
+    source: LayerSource
+    left: int
+    top: int
+    crop: Tuple[int, int, int, int]
+    mask_rect: Optional[Tuple[int, int, int, int]]
+    mask_color: int
+    blend_mode: str
+
+
+def expand_layer_sources(image_tensors: List[torch.Tensor],
+                         layer_names: List[str],
+                         mask_tensors: Optional[List[torch.Tensor]] = None,
+                         mask_resize_filter: str = DEFAULT_MASK_RESIZE_FILTER
+                         ) -> Tuple[List[LayerSource], List[int]]:
+    """
+    Splits batched inputs into one LayerSource per batch element, without converting them.
+
+    Follows the naming and mask pairing of expand_batched_layers. Masks of
+    their image's size are not copied: the scale and offset normalizing them
+    to 0-1 are applied to each strip as it is read. Other masks are resized
+    to their image by fit_mask_batch, one call per mask batch.
+
+    Returns:
+        tuple of (layer_sources, source_indices); source_indices maps each
+        layer back to its input
+    """
+    sources = []
+    source_indices = []
+
+    for i, tensor in enumerate(image_tensors):
+        if tensor.dim() == 3:
+            tensor = tensor.unsqueeze(0)
+        if image_layout(tensor) == "NCHW":
+            tensor = tensor.permute(0, 2, 3, 1)
+        name = layer_names[i] if i < len(layer_names) and layer_names[i] else f"Layer {i+1}"
+
+        batch_size, height, width = tensor.shape[:3]
+        mask_tensor = mask_tensors[i] if mask_tensors and i < len(mask_tensors) else None
+        normalization = None
+        if mask_tensor is not None:
+            mask_tensor = as_mask_batch(mask_tensor)
+            if tuple(mask_tensor.shape[1:]) != (height, width):
+                # Resizing makes a new batch anyway
+                mask_tensor = fit_mask_batch(mask_tensor, height, width, mask_resize_filter)
+            elif mask_tensor.is_floating_point():
+                normalization = mask_normalization(mask_tensor)
+
+        for b in range(batch_size):
+            mask, scale, offset = None, 1.0, 0.0
+            if mask_tensor is not None:
+                index = b % mask_tensor.shape[0]
+                mask = mask_tensor[index]
+                if normalization is not None:
+                    scale, offset = float(normalization[0][index]), float(normalization[1][index])
+            sources.append(LayerSource(tensor[b], mask, name if batch_size == 1 else f"{name} {b+1}",
+                                       width, height, scale, offset))
+            source_indices.append(i)
+
+    return sources, source_indices
+
+
+def use_strip_writer(image_tensors: List[torch.Tensor],
+                     layer_offsets: Optional[List[Optional[Tuple[int, int]]]] = None,
+                     strip_rows: int = 0) -> bool:
+    """
+    Decides whether a save goes through the strip writer.
+
+    Args:
+        image_tensors: List of PyTorch tensors with images
+        layer_offsets: Optional list of (left, top) offsets, one per input
+        strip_rows: Rows per strip; 0 writes in strips only when the canvas
+            has at least STRIP_WRITER_MIN_PIXELS pixels
+
+    Returns:
+        True to write in strips
+    """
+    if strip_rows > 0:
+        return True
+    sources, indices = expand_layer_sources(image_tensors, [""] * len(image_tensors))
+    offsets = [layer_offsets[i] if layer_offsets and i < len(layer_offsets) else None for i in indices]
+    width, height = calculate_placed_canvas_size(sources, offsets)
+    return width * height >= STRIP_WRITER_MIN_PIXELS
+
+
+def _rgba_rows(image: torch.Tensor, y0: int, y1: int, x0: int, x1: int) -> np.ndarray:
+    """Converts rows of an image tensor to a uint8 [h, w, 4] array (opaque without alpha)."""
+    rows = image_tensor_to_uint8(image[y0:y1, x0:x1].unsqueeze(0), channels=4, layout="NHWC")[0]
+    if rows.shape[2] == 4:
+        return rows
+    rgba = np.empty(rows.shape[:2] + (4,), dtype=np.uint8)
+    rgba[:, :, :3] = rows
+    rgba[:, :, 3] = 255
+    return rgba
+
+
+def _mask_rows(source: LayerSource, y0: int, y1: int, x0: int, x1: int) -> np.ndarray:
+    """Converts rows of a layer's mask to a uint8 [h, w] array, normalizing only those rows."""
+    rows = source.mask[y0:y1, x0:x1]
+    if source.mask_scale != 1.0 or source.mask_offset != 0.0:
+        rows = (rows * source.mask_scale).add_(source.mask_offset).clamp_(0.0, 1.0)
+    return mask_tensor_to_uint8(rows)[0]
+
+
+def _bbox(rows: np.ndarray, cols: np.ndarray) -> Optional[Tuple[int, int, int, int]]:
+    row_indices = np.flatnonzero(rows)
+    if row_indices.size == 0:
+        return None
+    col_indices = np.flatnonzero(cols)
+    return int(col_indices[0]), int(row_indices[0]), int(col_indices[-1]) + 1, int(row_indices[-1]) + 1
+
+
+def _plan_layer(source: LayerSource, left: int, top: int, blend_mode: str,
+                trim: bool, strip_rows: int) -> Optional[_PlannedLayer]:
+    """
+    Scans a layer's alpha and mask strip by strip for its trim box and mask rectangle.
+
+    Gives the same result as prepare_psd_layers and compute_mask_rect
+    without converting the layer as a whole: fully white masks are dropped
+    and layers with nothing visible are skipped (None), trimmed or not.
+    """
+    width, height = source.width, source.height
+    has_alpha = source.image.shape[2] == 4
+
+    crop = (0, 0, width, height)
+    mask_full = False
+    if source.mask is not None or has_alpha:
+        rows, cols = np.zeros(height, bool), np.zeros(width, bool)
+        mask_full = source.mask is not None
+        for y0 in range(0, height, strip_rows):
+            y1 = min(height, y0 + strip_rows)
+            visible = _mask_rows(source, y0, y1, 0, width) if source.mask is not None else None
+            if mask_full:
+                mask_full = bool((visible == 255).all())
+            if has_alpha:
+                alpha = image_tensor_to_uint8(source.image[y0:y1, :, 3:4].unsqueeze(0),
+                                              channels=None, layout="NHWC")[0, :, :, 0]
+                visible = alpha if visible is None else np.minimum(visible, alpha)
+            rows[y0:y1] = visible.any(axis=1)
+            cols |= visible.any(axis=0)
+        visible_box = _bbox(rows, cols)
+        if visible_box is None:
+            print(f"👻 Layer '{source.name}' is fully transparent - skipping it")
+            return None
+        if trim and visible_box != crop:
+            crop = visible_box
+            print(f"✂️ Trimmed layer '{source.name}' from {(width, height)} to "
+                  f"{crop[2] - crop[0]}x{crop[3] - crop[1]}")
+
+    mask_rect, mask_color = None, 0
+    if mask_full:
+        print(f"🎭 Mask of layer '{source.name}' is fully opaque - dropping it")
+    if source.mask is not None and not mask_full:
+        crop_x0, crop_y0, crop_x1, crop_y1 = crop
+        differs = {color: (np.zeros(crop_y1 - crop_y0, bool), np.zeros(crop_x1 - crop_x0, bool))
+                   for color in (0, 255)}
+        for y0 in range(crop_y0, crop_y1, strip_rows):
+            y1 = min(crop_y1, y0 + strip_rows)
+            mask = _mask_rows(source, y0, y1, crop_x0, crop_x1)
+            for color, (rows, cols) in differs.items():
+                plane = mask != color
+                rows[y0 - crop_y0:y1 - crop_y0] = plane.any(axis=1)
+                cols |= plane.any(axis=0)
+
+        # Same choice as compute_mask_rect: the default color leaving the smaller rectangle
+        best_area = None
+        for color, (rows, cols) in differs.items():
+            rect = _bbox(rows, cols)
+            if rect is None:
+                mask_rect, mask_color = (0, 0, 0, 0), color
+                break
+            area = (rect[2] - rect[0]) * (rect[3] - rect[1])
+            if best_area is None or area < best_area:
+                mask_rect, mask_color, best_area = rect, color, area
+
+    return _PlannedLayer(source, left + crop[0], top + crop[1], crop, mask_rect, mask_color, blend_mode)
+
+
+def write_psd_in_strips(planned: List[_PlannedLayer], canvas_width: int, canvas_height: int,
+                        output_path: str, version: int = 1, strip_rows: int = DEFAULT_STRIP_ROWS,
+                        background_color: Tuple[int, int, int] = (255, 255, 255),
+                        thumbnail: bool = True) -> None:
+    """
+    Encodes planned layers (top to bottom) strip by strip and writes the document.
+
+    Args:
+        planned: Layers from _plan_layer, top to bottom
+        canvas_width: Width of the canvas
+        canvas_height: Height of the canvas
+        output_path: Path of the file to write
+        version: 1 for PSD, 2 for PSB
+        strip_rows: Rows converted, encoded and composited at a time
+        background_color: RGB color below all layers in the merged image
+        thumbnail: Embed a thumbnail of the merged image
+    """
+    bottom_up = list(reversed(planned))
+    spools = [[_ChannelSpool(version) for _ in range(5 if layer.mask_rect is not None else 4)]
+              for layer in bottom_up]
+    merged_planes = [tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY_BYTES) for _ in range(3)]
+
+    scale = min(1.0, THUMBNAIL_SIZE / max(canvas_width, canvas_height))
+    thumb_size = (max(1, round(canvas_width * scale)), max(1, round(canvas_height * scale)))
+    thumb_rows = []
+
+    extents = [(layer.top, layer.top + layer.crop[3] - layer.crop[1]) for layer in bottom_up]
+    start = min([0] + [y0 for y0, y1 in extents if y0 < y1])
+    end = max([canvas_height] + [y1 for y0, y1 in extents if y0 < y1])
+    canvas_strip = np.empty((strip_rows, canvas_width, 3), dtype=np.float32)
+    background = np.asarray(background_color, dtype=np.float32) / 255
+
+    try:
+        for y0 in range(start, end, strip_rows):
+            y1 = min(end, y0 + strip_rows)
+            canvas_y0, canvas_y1 = max(y0, 0), min(y1, canvas_height)
+            canvas = canvas_strip[:max(0, canvas_y1 - canvas_y0)]
+            canvas[...] = background
+
+            for layer, channels, (layer_y0, layer_y1) in zip(bottom_up, spools, extents):
+                row0, row1 = max(y0, layer_y0), min(y1, layer_y1)
+                if row0 >= row1:
+                    continue
+                source, (crop_x0, crop_y0, crop_x1, _) = layer.source, layer.crop
+                # Rows of the source tensor covered by this strip
+                src0 = row0 - layer.top + crop_y0
+                src1 = row1 - layer.top + crop_y0
+                rgba = _rgba_rows(source.image, src0, src1, crop_x0, crop_x1)
+                mask = None
+                if layer.mask_rect is not None:
+                    mask = _mask_rows(source, src0, src1, crop_x0, crop_x1)
+
+                channels[0].add_rows(rgba[:, :, 3])
+                for index in range(3):
+                    channels[index + 1].add_rows(rgba[:, :, index])
+                if layer.mask_rect is not None:
+                    mask_x0, mask_y0, mask_x1, mask_y1 = layer.mask_rect
+                    rows0 = max(row0, layer_y0 + mask_y0) - row0
+                    rows1 = min(row1, layer_y0 + mask_y1) - row0
+                    if rows0 < rows1:
+                        channels[4].add_rows(mask[rows0:rows1, mask_x0:mask_x1])
+
+                if canvas.shape[0]:
+                    composite_layer_over(canvas, rgba, layer.left, row0 - canvas_y0, mask, layer.blend_mode)
+
+            if canvas.shape[0]:
+                merged = composite_to_uint8(canvas)
+                for index in range(3):
+                    merged_planes[index].write(np.ascontiguousarray(merged[:, :, index]).data)
+                if thumbnail:
+                    thumb_rows.append(np.asarray(Image.fromarray(merged, 'RGB').resize(
+                        (thumb_size[0], merged.shape[0]), Image.BOX)))
+
+        resources = ImageResources.new()
+        if thumbnail:
+            thumb = Image.fromarray(np.concatenate(thumb_rows), 'RGB').resize(thumb_size, Image.BOX)
+            resource = create_thumbnail_resource(np.asarray(thumb))
+            resources[resource.key] = resource
+
+        records = []
+        for layer, channels in zip(bottom_up, spools):
+            crop_x0, crop_y0, crop_x1, crop_y1 = layer.crop
+            records.append(create_layer_record(layer.source.name, layer.left, layer.top,
+                                               crop_x1 - crop_x0, crop_y1 - crop_y0, layer.blend_mode,
+                                               [channel.length for channel in channels],
+                                               layer.mask_rect, layer.mask_color))
+
+        length_format = ">I" if version == 1 else ">Q"
+        length_size = struct.calcsize(length_format)
+        with open(output_path, "wb") as out:
+            FileHeader(version=version, channels=3, height=canvas_height, width=canvas_width,
+                       depth=8, color_mode=ColorMode.RGB).write(out)
+            ColorModeData().write(out)
+            resources.write(out)
+
+            layer_and_mask_position = out.tell()
+            out.write(b"\0" * 2 * length_size)
+            layer_info_start = out.tell()
+            out.write(struct.pack(">h", len(records)))
+            for record in records:
+                record.write(out, version=version)
+            for channels in spools:
+                for channel in channels:
+                    channel.write_to(out)
+
+            layer_info_length = out.tell() - layer_info_start
+            out.write(b"\0" * (-layer_info_length % 4))
+            layer_info_length += -layer_info_length % 4
+            # Empty global layer mask info
+            out.write(struct.pack(">I", 0))
+            layer_and_mask_end = out.tell()
+
+            # Merged image, uncompressed
+            out.write(struct.pack(">H", Compression.RAW.value))
+            for plane in merged_planes:
+                plane.seek(0)
+                shutil.copyfileobj(plane, out, 1 << 20)
+
+            out.seek(layer_and_mask_position)
+            out.write(struct.pack(length_format, layer_and_mask_end - layer_and_mask_position - length_size))
+            out.write(struct.pack(length_format, layer_info_length))
+    finally:
+        for channels in spools:
+            for channel in channels:
+                channel.data.close()
+        for plane in merged_planes:
+            plane.close()
+
+
+def process_layers_to_psd_in_strips(image_tensors: List[torch.Tensor],
+                                    layer_names: List[str],
+                                    mask_tensors: Optional[List[torch.Tensor]] = None,
+                                    output_dir: str = ".",
+                                    filename_prefix: str = "output",
+                                    layer_offsets: Optional[List[Optional[Tuple[int, int]]]] = None,
+                                    blend_modes: Optional[List[str]] = None,
+                                    trim_layers: bool = False,
+                                    output_path: Optional[str] = None,
+                                    strip_rows: int = DEFAULT_STRIP_ROWS,
+                                    mask_resize_filter: str = DEFAULT_MASK_RESIZE_FILTER,
+                                    sidecar_layers: bool = False,
+                                    sidecar_flat: Optional[str] = None) -> Tuple[str, bool]:
+    """
+    Writes image tensors as PSD layers in strips of rows, see process_layers_to_psd.
+
+    Layers are never converted as a whole: every strip is read from the
+    input tensors, encoded and composited, then released.
+
+    Args:
+        image_tensors: List of PyTorch tensors with images
+        layer_names: List of names for each layer
+        mask_tensors: Optional list of PyTorch tensors with masks
+        output_dir: Directory to save the PSD file
+        filename_prefix: Prefix for the filename
+        layer_offsets: Optional list of (left, top) offsets, one per input
+        blend_modes: Optional list of blend mode names, one per input
+        trim_layers: Crop layers to the bounding box of their visible pixels
+        output_path: Path to write to; by default a unique name is claimed
+        strip_rows: Rows per strip
+        mask_resize_filter: Filter for masks whose size differs from their
+            image (one of MASK_RESIZE_FILTERS)
+        sidecar_layers, sidecar_flat: Not supported in strips; sidecar files
+            need whole-canvas images, so requesting them only prints a warning
+
+    Returns:
+        tuple of (output_path, success_boolean)
+    """
+    try:
+        check_psd_tools_available()
+        strip_rows = max(1, strip_rows or DEFAULT_STRIP_ROWS)
+        if sidecar_layers or sidecar_flat not in (None, "none"):
+            print("⚠️ Sidecar files are not written for documents saved in strips "
+                  "(they need whole-canvas images) - skipping them")
+
+        sources, indices = expand_layer_sources(image_tensors, layer_names, mask_tensors,
+                                                 mask_resize_filter)
+        offsets = [layer_offsets[i] if layer_offsets and i < len(layer_offsets) else None for i in indices]
+        modes = [blend_modes[i] if blend_modes and i < len(blend_modes) else "normal" for i in indices]
+
+        canvas_width, canvas_height = calculate_placed_canvas_size(sources, offsets)
+        print(f"📐 Canvas size: {canvas_width}x{canvas_height}, writing in strips of {strip_rows} rows")
+
+        planned = []
+        for source, offset, mode in zip(sources, offsets, modes):
+            if offset is None:
+                left, top = (canvas_width - source.width) // 2, (canvas_height - source.height) // 2
+            else:
+                left, top = offset
+            layer = _plan_layer(source, left, top, mode, trim_layers, strip_rows)
+            if layer is not None:
+                planned.append(layer)
+
+        version = choose_psd_version(canvas_width, canvas_height,
+                                     [(layer.crop[2] - layer.crop[0], layer.crop[3] - layer.crop[1],
+                                       layer.mask_rect is not None) for layer in planned])
+
+        if output_path is None:
+            output_path = generate_unique_filename(f"{filename_prefix}.psd", output_dir)
+        if version == 2:
+            print(f"📦 Document exceeds PSD limits - writing PSB (large document format)")
+            output_path = psb_output_path(output_path)
+
+        print(f"💾 Saving PSD file to: {output_path}")
+        write_psd_in_strips(planned, canvas_width, canvas_height, output_path, version, strip_rows)
+        print(f"🎉 Successfully created PSD file with {len(planned)} layers!")
+        return output_path, True
+
+    except Exception as e:
+        print(f"❌ Error in process_layers_to_psd_in_strips: {e}")
+        if output_path:
+            release_filename(output_path)
+        import traceback
+        traceback.print_exc()
+        return "", False
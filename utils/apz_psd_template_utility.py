@@ -0,0 +1,328 @@
+"""
+PSD Template Fill Utilities for ComfyUI using psd-tools
+
+This module fills named layers of an existing PSD template with new images
+and masks. Parsed templates are cached, only the targeted layers are
+re-encoded, and the encoded channel bytes of every other layer are written
+back unchanged.
+
+Configuration (environment variables):
+    APZ_PSD_TEMPLATE_CACHE_SIZE: Number of parsed templates kept in memory
+        (default: 4, 0 disables the cache); the least recently used
+        template is dropped first
+"""
+
+import copy
+import os
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+import numpy as np
+import torch
+from PIL import Image
+
+try:
+    from psd_tools import PSDImage
+    from psd_tools.api.layers import PixelLayer
+    from psd_tools.constants import ChannelID
+    PSD_TOOLS_AVAILABLE = True
+except ImportError:
+    PSD_TOOLS_AVAILABLE = False
+    PSDImage = None
+    PixelLayer = None
+    ChannelID = None
+
+from .apz_psd_tools_utility import (
+    DEFAULT_MASK_RESIZE_FILTER,
+    check_psd_tools_available,
+    encode_layer_record,
+    generate_unique_filename,
+    release_filename,
+    resize_mask_arrays,
+    save_psd_file,
+    tensor_to_pil_images,
+    tensor_to_pil_masks
+)
+
+# Separator between group names in a layer path, e.g. "Product/Shadow"
+LAYER_PATH_SEPARATOR = "/"
+
+# Parsed templates kept when APZ_PSD_TEMPLATE_CACHE_SIZE is not set
+DEFAULT_TEMPLATE_CACHE_SIZE = 4
+
+# Parsed templates keyed by absolute path, least recently used first: (mtime_ns, size, PSDImage)
+_template_cache: "OrderedDict[str, Tuple[int, int, PSDImage]]" = OrderedDict()
+_template_cache_lock = threading.Lock()
+
+
+def _template_cache_size() -> int:
+    try:
+        return max(0, int(os.environ.get("APZ_PSD_TEMPLATE_CACHE_SIZE", DEFAULT_TEMPLATE_CACHE_SIZE)))
+    except ValueError:
+        return DEFAULT_TEMPLATE_CACHE_SIZE
+
+
+def load_template(template_path: str) -> PSDImage:
+    """
+    Returns a private copy of a parsed PSD template.
+
+    The template is parsed once and kept in a cache until the file changes
+    or it is one of more than APZ_PSD_TEMPLATE_CACHE_SIZE templates; every
+    call returns a deep copy that can be modified freely. Encoded channel
+    bytes are immutable and shared between the copies.
+
+    Args:
+        template_path: Path to the PSD template
+
+    Returns:
+        psd_tools PSDImage object
+    """
+    check_psd_tools_available()
+
+    path = os.path.abspath(template_path)
+    stat = os.stat(path)
+
+    with _template_cache_lock:
+        cached = _template_cache.get(path)
+        if cached is None or cached[0] != stat.st_mtime_ns or cached[1] != stat.st_size:
+            print(f"📂 Parsing PSD template: {path}")
+            cached = (stat.st_mtime_ns, stat.st_size, PSDImage.open(path))
+        _template_cache[path] = cached
+        _template_cache.move_to_end(path)
+        while len(_template_cache) > _template_cache_size():
+            _template_cache.popitem(last=False)
+        template = cached[2]
+
+    return copy.deepcopy(template)
+
+
+def clear_template_cache() -> None:
+    """Drops all cached templates."""
+    with _template_cache_lock:
+        _template_cache.clear()
+
+
+def find_template_layer(psd: PSDImage, layer_key: str):
+    """
+    Finds a layer by name or by path.
+
+    Args:
+        psd: psd_tools PSDImage object
+        layer_key: Layer name (first match anywhere in the document) or a
+            path of group and layer names separated by "/"
+
+    Returns:
+        psd_tools layer object, or None if not found
+    """
+    if LAYER_PATH_SEPARATOR in layer_key:
+        node = psd
+        for name in layer_key.strip(LAYER_PATH_SEPARATOR).split(LAYER_PATH_SEPARATOR):
+            node = next((layer for layer in node if layer.name == name), None) if node.is_group() else None
+            if node is None:
+                return None
+        return node
+
+    return next((layer for layer in psd.descendants() if layer.name == layer_key), None)
+
+
+def replace_layer_pixels(layer, pil_image: Image.Image,
+                         pil_mask: Optional[Image.Image] = None,
+                         offset: Optional[Tuple[int, int]] = None,
+                         fit: str = "center",
+                         mask_resize_filter: str = DEFAULT_MASK_RESIZE_FILTER) -> None:
+    """
+    Replaces the pixel (and optionally mask) channels of a template layer.
+
+    The layer record is updated in place, so the layer keeps its name, blend
+    mode, opacity, effects and other settings. Without a new mask the
+    template's layer mask is kept as it is.
+
+    Args:
+        layer: psd_tools PixelLayer to fill
+        pil_image: PIL Image in RGB or RGBA mode
+        pil_mask: Optional PIL Image mask in L mode
+        offset: Optional (left, top) position on the canvas; overrides fit
+        fit: "center" keeps the image size and centers it on the layer's
+            bounding box, "stretch" resizes it to the bounding box. Empty
+            layers use the whole canvas as their bounding box
+        mask_resize_filter: Filter used when the mask size differs from the
+            image (one of MASK_RESIZE_FILTERS)
+    """
+    if not isinstance(layer, PixelLayer):
+        raise ValueError(f"Layer '{layer.name}' is not a pixel layer (type: {type(layer).__name__})")
+
+    if pil_image.mode != 'RGBA':
+        pil_image = pil_image.convert('RGBA')
+    if pil_mask is not None and pil_mask.mode != 'L':
+        pil_mask = pil_mask.convert('L')
+
+    if layer.width and layer.height:
+        box = layer.bbox
+    else:
+        box = (0, 0, layer._psd.width, layer._psd.height)
+    box_width, box_height = box[2] - box[0], box[3] - box[1]
+
+    if offset is not None:
+        left, top = offset
+    elif fit == "stretch":
+        if pil_image.size != (box_width, box_height):
+            pil_image = pil_image.resize((box_width, box_height), Image.LANCZOS)
+        left, top = box[0], box[1]
+    else:
+        left = box[0] + (box_width - pil_image.width) // 2
+        top = box[1] + (box_height - pil_image.height) // 2
+
+    mask_np = np.asarray(pil_mask) if pil_mask is not None else None
+    if pil_mask is not None and pil_mask.size != pil_image.size:
+        print(f"📏 Resizing mask from {pil_mask.size} to {pil_image.size}")
+        mask_np = resize_mask_arrays([mask_np], [(pil_image.height, pil_image.width)], mask_resize_filter)[0]
+
+    new_record, new_channels = encode_layer_record(
+        np.asarray(pil_image), layer.name, top=top, left=left,
+        mask=mask_np,
+        version=layer._psd.version
+    )
+
+    record = layer._record
+    channel_info = list(new_record.channel_info)
+    channels = list(new_channels)
+    if pil_mask is None:
+        # Keep the template's mask channels, byte for byte
+        for info, data in zip(record.channel_info, layer._channels):
+            if info.id in (ChannelID.USER_LAYER_MASK, ChannelID.REAL_USER_LAYER_MASK):
+                channel_info.append(info)
+                channels.append(data)
+    else:
+        record.mask_data = new_record.mask_data
+
+    record.top, record.left = new_record.top, new_record.left
+    record.bottom, record.right = new_record.bottom, new_record.right
+    record.channel_info[:] = channel_info
+    layer._channels[:] = channels
+
+    # Drop the mask wrapper psd-tools memoised from the old record
+    if hasattr(layer, '_mask'):
+        del layer._mask
+
+
+def fill_psd_template(template_path: str,
+                      layer_keys: List[str],
+                      pil_images: List[Image.Image],
+                      pil_masks: Optional[List[Optional[Image.Image]]] = None,
+                      layer_offsets: Optional[List[Optional[Tuple[int, int]]]] = None,
+                      fit: str = "center",
+                      update_composite: bool = True,
+                      mask_resize_filter: str = DEFAULT_MASK_RESIZE_FILTER) -> PSDImage:
+    """
+    Fills the targeted layers of a cached template.
+
+    Args:
+        template_path: Path to the PSD template
+        layer_keys: Layer names or paths to fill
+        pil_images: PIL Images, one per layer key
+        pil_masks: Optional list of PIL masks (None keeps the template mask)
+        layer_offsets: Optional list of (left, top) positions
+        fit: "center" or "stretch", see replace_layer_pixels
+        update_composite: Re-render the merged image from the layers on save;
+            otherwise the template's merged image is kept
+        mask_resize_filter: Filter for masks whose size differs from their image
+
+    Returns:
+        psd_tools PSDImage object
+    """
+    psd = load_template(template_path)
+
+    for i, (layer_key, pil_image) in enumerate(zip(layer_keys, pil_images)):
+        layer = find_template_layer(psd, layer_key)
+        if layer is None:
+            raise ValueError(f"Layer '{layer_key}' not found in template {template_path}")
+
+        pil_mask = pil_masks[i] if pil_masks and i < len(pil_masks) else None
+        offset = layer_offsets[i] if layer_offsets and i < len(layer_offsets) else None
+        replace_layer_pixels(layer, pil_image, pil_mask, offset=offset, fit=fit,
+                             mask_resize_filter=mask_resize_filter)
+        print(f"🔁 Replaced layer '{layer_key}' with {pil_image.size} image"
+              f"{' and mask' if pil_mask is not None else ''}")
+
+    # Rebuild the layer section from the (mostly unchanged) records and channels
+    psd._update_record()
+    if not update_composite:
+        # Keep the template's merged image instead of re-rendering it on save
+        psd._updated = False
+
+    return psd
+
+
+def _first_in_batch(tensor: torch.Tensor, unbatched_dims: int) -> torch.Tensor:
+    """Returns the first element of a batched tensor, keeping the batch dimension."""
+    return tensor[:1] if tensor.dim() > unbatched_dims else tensor
+
+
+def process_template_fill(template_path: str,
+                          layer_keys: List[str],
+                          image_tensors: List[torch.Tensor],
+                          mask_tensors: Optional[List[Optional[torch.Tensor]]] = None,
+                          layer_offsets: Optional[List[Optional[Tuple[int, int]]]] = None,
+                          output_dir: str = ".",
+                          filename_prefix: str = "output",
+                          fit: str = "center",
+                          update_composite: bool = True,
+                          mask_resize_filter: str = DEFAULT_MASK_RESIZE_FILTER) -> Tuple[str, bool]:
+    """
+    Fills the targeted layers of a template with image tensors and saves the result.
+
+    Only the first element of batched images and masks is used; a warning
+    is printed for batched images.
+
+    Args:
+        template_path: Path to the PSD template
+        layer_keys: Layer names or paths to fill
+        image_tensors: List of PyTorch tensors with images
+        mask_tensors: Optional list of PyTorch tensors with masks
+        layer_offsets: Optional list of (left, top) positions
+        output_dir: Directory to save the PSD file
+        filename_prefix: Prefix for the filename
+        fit: "center" or "stretch", see replace_layer_pixels
+        update_composite: Re-render the merged image from the layers on save
+        mask_resize_filter: Filter for masks whose size differs from their image
+
+    Returns:
+        tuple of (output_path, success_boolean)
+    """
+    try:
+        check_psd_tools_available()
+
+        # A template is filled once per call, so only the first batch element is converted
+        for layer_key, image in zip(layer_keys, image_tensors):
+            if image.dim() == 4 and image.shape[0] > 1:
+                print(f"⚠️ Layer '{layer_key}' got a batch of {image.shape[0]} images; only the first is used")
+        pil_images = [tensor_to_pil_images(_first_in_batch(image, 3), keep_alpha=True)[0]
+                      for image in image_tensors]
+        pil_masks = None
+        if mask_tensors:
+            pil_masks = [tensor_to_pil_masks(_first_in_batch(mask, 2))[0] if mask is not None else None
+                         for mask in mask_tensors]
+
+        psd = fill_psd_template(template_path, layer_keys, pil_images, pil_masks,
+                                layer_offsets, fit, update_composite, mask_resize_filter)
+
+        # PSB templates are saved as PSB
+        extension = ".psb" if psd.version == 2 else ".psd"
+        output_path = generate_unique_filename(f"{filename_prefix}{extension}", output_dir)
+
+        print(f"💾 Saving filled template to: {output_path}")
+        success = save_psd_file(psd, output_path)
+        if success:
+            print(f"🎉 Successfully filled {len(pil_images)} template layers!")
+        else:
+            release_filename(output_path)
+            print("❌ Failed to save PSD file")
+
+        return output_path, success
+
+    except Exception as e:
+        print(f"❌ Error in process_template_fill: {e}")
+        import traceback
+        traceback.print_exc()
+        return "", False
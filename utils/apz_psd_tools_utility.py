@@ -8,14 +8,37 @@ to PSD layer format using the psd-tools library and PIL.
 import torch
 import numpy as np
 from PIL import Image, ImageOps
-from typing import List, Tuple, Optional, Union
+from typing import List, NamedTuple, Sequence, Tuple, Optional, Union
+import io
 import os
+from concurrent.futures import ThreadPoolExecutor
+
+from .apz_tensor_conversion import (
+    image_tensor_to_pil, image_tensor_to_uint8, mask_tensor_to_pil, mask_tensor_to_uint8,
+    uint8_to_float_tensor
+)
+from .apz_mask_engine import (
+    DEFAULT_MASK_RESIZE_FILTER, MASK_RESIZE_FILTERS,
+    as_mask_batch, normalize_masks, resize_mask_arrays, resize_masks
+)
+from .apz_mask_stats import MaskStats, compute_mask_stats
+from .apz_compact_mask import CompactMask, compute_alpha_bbox, compute_mask_rect
+from .apz_channel_cache import get_channel_cache
+from .apz_psd_incremental import (
+    compute_layer_hash, create_layer_hash_resource, read_psd_layout, splice_psd_update
+)
+from .apz_filename_allocator import allocate_filename, allocate_filenames, release_filename
+from .apz_sidecar_utility import submit_sidecar_exports, collect_sidecar_results
 
 # Import psd-tools only when needed to avoid import errors
 try:
     from psd_tools import PSDImage
     from psd_tools.api.layers import PixelLayer
-    from psd_tools.constants import ColorMode, ChannelID
+    from psd_tools.constants import ColorMode, ChannelID, BlendMode, Compression, Resource, Tag
+    from psd_tools.psd.layer_and_mask import (
+        LayerRecord, ChannelInfo, ChannelData, ChannelDataList, MaskData, MaskFlags
+    )
+    from psd_tools.psd.image_resources import ImageResource, ThumbnailResource
     PSD_TOOLS_AVAILABLE = True
 except ImportError:
     PSD_TOOLS_AVAILABLE = False
@@ -23,6 +46,17 @@ except ImportError:
     PixelLayer = None
     ColorMode = None
     ChannelID = None
+    BlendMode = None
+    Compression = None
+    Resource = None
+    LayerRecord = None
+    ChannelInfo = None
+    ChannelData = None
+    ChannelDataList = None
+    MaskData = None
+    MaskFlags = None
+    ImageResource = None
+    ThumbnailResource = None
 
 
 def check_psd_tools_available():
@@ -34,98 +68,95 @@ def check_psd_tools_available():
         )
 
 
-def tensor_to_pil_image(image_tensor: torch.Tensor) -> Image.Image:
+def tensor_batch_to_uint8(image_tensor: torch.Tensor, keep_alpha: bool = False) -> np.ndarray:
     """
-    Converts a PyTorch tensor to a PIL Image.
+    Converts a whole IMAGE batch to a uint8 RGB array in one pass.
     
     Args:
-        image_tensor: PyTorch tensor with shape [B, H, W, C] or [B, C, H, W]
+        image_tensor: PyTorch tensor with shape [B, H, W, C], [B, C, H, W] or [H, W, C]
+        keep_alpha: Keep the fourth channel of RGBA input instead of dropping it
         
     Returns:
-        PIL Image in RGB mode
+        numpy array with shape [B, H, W, 3] (or [B, H, W, 4] for RGBA input
+        with keep_alpha) in uint8 format
+    """
+    return image_tensor_to_uint8(image_tensor, channels=4 if keep_alpha else 3)
+
+
+def mask_batch_to_uint8(mask_tensor: torch.Tensor) -> np.ndarray:
     """
-    # Ensure the tensor is on the CPU
-    image_tensor = image_tensor.cpu()
+    Converts a whole MASK batch to a uint8 array in one pass.
     
-    # Convert the tensor to [B, H, W, C] format if it's in [B, C, H, W]
-    if len(image_tensor.shape) == 4 and image_tensor.shape[1] in [1, 3, 4]:
-        image_tensor = image_tensor.permute(0, 2, 3, 1)
+    Args:
+        mask_tensor: PyTorch tensor with shape [B, H, W], [B, 1, H, W] or [H, W]
+        
+    Returns:
+        numpy array with shape [B, H, W] in uint8 format
+    """
+    return mask_tensor_to_uint8(mask_tensor)
+
+
+def tensor_to_pil_images(image_tensor: torch.Tensor, keep_alpha: bool = False) -> List[Image.Image]:
+    """
+    Converts every image of an IMAGE batch to a PIL Image.
     
-    # Take the first image from the batch
-    img_tensor = image_tensor[0]
+    Args:
+        image_tensor: PyTorch tensor with shape [B, H, W, C] or [B, C, H, W]
+        keep_alpha: Return RGBA images for 4-channel input
+        
+    Returns:
+        List of PIL Images in RGB (or RGBA) mode, one per batch element
+    """
+    return image_tensor_to_pil(image_tensor, keep_alpha)
+
+
+def tensor_to_pil_masks(mask_tensor: torch.Tensor) -> List[Image.Image]:
+    """
+    Converts every mask of a MASK batch to a PIL Image in grayscale mode.
     
-    # Clamp values to [0, 1] range if they're floating point
-    if img_tensor.is_floating_point():
-        img_tensor = torch.clamp(img_tensor, 0.0, 1.0)
-        # Convert to 8-bit
-        img_tensor = (img_tensor * 255).type(torch.uint8)
-    else:
-        img_tensor = img_tensor.type(torch.uint8)
-    
-    # Convert to numpy array
-    img_np = img_tensor.numpy()
-    
-    # Handle different channel counts
-    if img_np.shape[2] == 1:
-        # Grayscale - convert to RGB
-        img_np = np.repeat(img_np, 3, axis=2)
-    elif img_np.shape[2] == 4:
-        # RGBA - convert to RGB (drop alpha)
-        img_np = img_np[:, :, :3]
-    elif img_np.shape[2] != 3:
-        # Unexpected channel count - convert to RGB
-        if img_np.shape[2] > 3:
-            img_np = img_np[:, :, :3]
-        else:
-            # Pad with zeros
-            padding = np.zeros((img_np.shape[0], img_np.shape[1], 3 - img_np.shape[2]), dtype=img_np.dtype)
-            img_np = np.concatenate([img_np, padding], axis=2)
+    Args:
+        mask_tensor: PyTorch tensor with shape [B, H, W] or [B, 1, H, W]
+        
+    Returns:
+        List of PIL Images in L (grayscale) mode, one per batch element
+    """
+    return mask_tensor_to_pil(mask_tensor)
+
+
+def tensor_to_pil_image(image_tensor: torch.Tensor) -> Image.Image:
+    """
+    Converts a PyTorch tensor to a PIL Image.
     
-    # Create PIL Image
-    pil_image = Image.fromarray(img_np, 'RGB')
+    Only the first image of the batch is returned; use tensor_to_pil_images
+    to convert the whole batch.
     
-    return pil_image
+    Args:
+        image_tensor: PyTorch tensor with shape [B, H, W, C] or [B, C, H, W]
+        
+    Returns:
+        PIL Image in RGB mode
+    """
+    if image_tensor.dim() == 4:
+        image_tensor = image_tensor[:1]
+    return tensor_to_pil_images(image_tensor)[0]
 
 
 def tensor_to_pil_mask(mask_tensor: torch.Tensor) -> Image.Image:
     """
     Converts a mask tensor to a PIL Image in grayscale mode.
     
+    Only the first mask of the batch is returned; use tensor_to_pil_masks
+    to convert the whole batch.
+    
     Args:
         mask_tensor: PyTorch tensor with shape [B, H, W] or [B, 1, H, W]
         
     Returns:
         PIL Image in L (grayscale) mode
     """
-    # Ensure the tensor is on the CPU
-    mask_tensor = mask_tensor.cpu()
-    
-    # Handle different tensor shapes
-    if len(mask_tensor.shape) == 4 and mask_tensor.shape[1] == 1:
-        # [B, 1, H, W] -> [B, H, W]
-        mask_tensor = mask_tensor.squeeze(1)
-    elif len(mask_tensor.shape) == 4 and mask_tensor.shape[1] == 3:
-        # [B, 3, H, W] -> [B, H, W] (take first channel)
-        mask_tensor = mask_tensor[:, 0, :, :]
-    
-    # Take the first mask from the batch
-    mask = mask_tensor[0]
-    
-    # Clamp values to [0, 1] range if they're floating point
-    if mask.is_floating_point():
-        mask = torch.clamp(mask, 0.0, 1.0)
-        # Convert to 8-bit
-        mask = (mask * 255).type(torch.uint8)
-    else:
-        mask = mask.type(torch.uint8)
-    
-    # Convert to numpy array
-    mask_np = mask.numpy()
-    
-    # Create PIL Image
-    pil_mask = Image.fromarray(mask_np, 'L')
-    
-    return pil_mask
+    if mask_tensor.dim() >= 3:
+        mask_tensor = mask_tensor[:1]
+    return tensor_to_pil_masks(mask_tensor)[0]
 
 
 def calculate_canvas_size(images: List[Image.Image]) -> Tuple[int, int]:
@@ -177,7 +208,8 @@ def resize_image_to_canvas(image: Image.Image, canvas_width: int, canvas_height:
     return canvas
 
 
-def apply_mask_to_image(image: Image.Image, mask: Image.Image) -> Image.Image:
+def apply_mask_to_image(image: Image.Image, mask: Image.Image,
+                        resize_filter: str = DEFAULT_MASK_RESIZE_FILTER) -> Image.Image:
     """
     Applies a mask to an image using PIL compositing.
     This is simpler and more reliable than manual PSD mask creation.
@@ -185,6 +217,8 @@ def apply_mask_to_image(image: Image.Image, mask: Image.Image) -> Image.Image:
     Args:
         image: PIL Image in RGBA mode
         mask: PIL Image mask in L mode
+        resize_filter: Filter used when the mask size differs from the image
+            (one of MASK_RESIZE_FILTERS)
         
     Returns:
         PIL Image with mask applied
@@ -198,7 +232,8 @@ def apply_mask_to_image(image: Image.Image, mask: Image.Image) -> Image.Image:
         mask = mask.convert('L')
     
     if mask.size != image.size:
-        mask = mask.resize(image.size, Image.LANCZOS)
+        mask_np = resize_mask_arrays([np.asarray(mask)], [(image.height, image.width)], resize_filter)[0]
+        mask = Image.fromarray(mask_np, 'L')
     
     # Apply mask by replacing the alpha channel
     r, g, b, a = image.split()
@@ -207,87 +242,419 @@ def apply_mask_to_image(image: Image.Image, mask: Image.Image) -> Image.Image:
     return image_with_mask
 
 
+# Channel compressions layers can be written with; RLE is what Photoshop writes
+CHANNEL_COMPRESSIONS = ("raw", "rle", "zip")
+
+
+def _channel_compression(compression: str):
+    if compression not in CHANNEL_COMPRESSIONS:
+        raise ValueError(f"Unknown channel compression: {compression}, expected one of {CHANNEL_COMPRESSIONS}")
+    return Compression[compression.upper()]
+
+
+def _encode_channel(plane: np.ndarray, compression=None, version: int = 1) -> ChannelData:
+    """
+    Compresses one uint8 plane [H, W] into psd-tools channel data (RLE unless compression is given).
+    
+    Identical planes are compressed once and then served from the channel cache.
+    PSB files (version 2) store 4-byte RLE row lengths instead of 2-byte ones.
+    """
+    channel_data = ChannelData(compression if compression is not None else Compression.RLE)
+    plane = np.ascontiguousarray(plane)
+    
+    def encode() -> bytes:
+        channel_data.set_data(plane.tobytes(), plane.shape[1], plane.shape[0], 8, version)
+        return channel_data.data
+    
+    channel_data.data = get_channel_cache().get_or_encode(plane, channel_data.compression.value, encode,
+                                                          version=version)
+    return channel_data
+
+
+def _encode_compact_mask_channel(mask: CompactMask, version: int = 1, compression=None) -> ChannelData:
+    """Returns the channel of a compact mask's rectangle, reusing its encoded rows for RLE."""
+    if compression not in (None, Compression.RLE):
+        return _encode_channel(mask.crop_array(), compression, version)
+    if mask.encoding == "raw":
+        return _encode_channel(mask.data, version=version)
+    channel_data = ChannelData(Compression.RLE)
+    channel_data.data = mask.rle_channel_bytes(version)
+    return channel_data
+
+
+def encode_layer_record(rgba: np.ndarray, layer_name: str, top: int = 0, left: int = 0,
+                        mask: Optional[Union[np.ndarray, CompactMask]] = None,
+                        blend_mode: str = "normal",
+                        version: int = 1,
+                        compression: str = "rle") -> Tuple[LayerRecord, ChannelDataList]:
+    """
+    Builds a layer record and its compressed channels from uint8 planes.
+    
+    The image alpha is stored as the transparency channel and the mask, if
+    any, as a separate user layer mask channel with its own rectangle and
+    default color, so neither overwrites the other.
+    
+    Args:
+        rgba: numpy array with shape [H, W, 4] in uint8 format
+        layer_name: Name for the layer
+        top: Offset of the layer from the top of the canvas
+        left: Offset of the layer from the left of the canvas
+        mask: Optional numpy array with shape [H, W] in uint8 format, aligned
+            with rgba, or CompactMask whose rectangle and rows are written as
+            they are
+        blend_mode: Blend mode name (e.g. "normal", "multiply")
+        version: File version the channels are encoded for (1 PSD, 2 PSB)
+        compression: Channel compression, one of CHANNEL_COMPRESSIONS
+        
+    Returns:
+        tuple of (LayerRecord, ChannelDataList)
+    """
+    check_psd_tools_available()
+    channel_compression = _channel_compression(compression)
+    
+    height, width = rgba.shape[:2]
+    planes = [rgba[:, :, 3]] + [rgba[:, :, index] for index in range(3)]
+    
+    mask_rect, default_color = None, 0
+    if isinstance(mask, CompactMask):
+        mask_rect, default_color = mask.bbox, mask.default_color
+    elif mask is not None:
+        mask_rect, default_color = compute_mask_rect(mask)
+        mask_left, mask_top, mask_right, mask_bottom = mask_rect
+        planes.append(mask[mask_top:mask_bottom, mask_left:mask_right])
+    
+    channels = ChannelDataList(_encode_channel(plane, channel_compression, version) for plane in planes)
+    if isinstance(mask, CompactMask):
+        channels.append(_encode_compact_mask_channel(mask, version, channel_compression))
+    record = create_layer_record(layer_name, left, top, width, height, blend_mode,
+                                 [len(channel_data.data) + 2 for channel_data in channels],
+                                 mask_rect, default_color)
+    return record, channels
+
+
+def create_layer_record(layer_name: str, left: int, top: int, width: int, height: int,
+                        blend_mode: str, channel_lengths: List[int],
+                        mask_rect: Optional[Tuple[int, int, int, int]] = None,
+                        mask_color: int = 0) -> LayerRecord:
+    """
+    Builds the record of a layer whose channels are already encoded.
+    
+    Args:
+        layer_name: Name for the layer
+        left: Offset of the layer from the left of the canvas
+        top: Offset of the layer from the top of the canvas
+        width: Width of the layer
+        height: Height of the layer
+        blend_mode: Blend mode name (e.g. "normal", "multiply")
+        channel_lengths: Encoded length of the transparency, R, G and B
+            channels, then of the user mask channel if there is one
+        mask_rect: (left, top, right, bottom) of the stored user mask,
+            relative to the layer, or None for no mask
+        mask_color: Default color of the user mask outside its rectangle
+        
+    Returns:
+        psd_tools LayerRecord
+    """
+    channel_ids = [ChannelID.TRANSPARENCY_MASK, ChannelID(0), ChannelID(1), ChannelID(2)]
+    record = LayerRecord(top=top, left=left, bottom=top + height, right=left + width,
+                         channel_info=[], blend_mode=BlendMode[blend_mode.upper()])
+    record.name = layer_name
+    # The Pascal name is Mac Roman; readers take the full name from the Unicode block
+    record.tagged_blocks.set_data(Tag.UNICODE_LAYER_NAME, layer_name)
+    
+    if mask_rect is not None:
+        mask_left, mask_top, mask_right, mask_bottom = mask_rect
+        record.mask_data = MaskData(
+            top=top + mask_top, left=left + mask_left,
+            bottom=top + mask_bottom, right=left + mask_right,
+            background_color=mask_color, flags=MaskFlags()
+        )
+        channel_ids.append(ChannelID.USER_LAYER_MASK)
+    
+    for channel_id, length in zip(channel_ids, channel_lengths):
+        record.channel_info.append(ChannelInfo(id=channel_id, length=length))
+    return record
+
+
+# Separable blend modes applied when compositing; backdrop b and source s in 0-1.
+# Other blend modes are composited as "normal".
+COMPOSITE_BLEND_FUNCTIONS = {
+    "multiply": lambda b, s: b * s,
+    "screen": lambda b, s: b + s - b * s,
+    "darken": np.minimum,
+    "lighten": np.maximum,
+    "difference": lambda b, s: np.abs(b - s),
+    "linear_dodge": lambda b, s: np.minimum(b + s, 1.0),
+    "subtract": lambda b, s: np.maximum(b - s, 0.0),
+}
+
+# Longest side of the embedded thumbnail, as written by Photoshop
+THUMBNAIL_SIZE = 160
+
+# Classic PSD limits; larger documents are written as PSB
+PSD_MAX_DIMENSION = 30000
+PSD_MAX_SECTION_LENGTH = 2**32 - 1
+
+
+def composite_layer_over(canvas: np.ndarray, rgba: np.ndarray, left: int, top: int,
+                         mask: Optional[np.ndarray] = None,
+                         blend_mode: str = "normal") -> None:
+    """
+    Composites one layer over an opaque canvas in place.
+    
+    Only the part of the canvas covered by the layer is read and written.
+    
+    Args:
+        canvas: float32 numpy array with shape [H, W, 3] in the 0-1 range
+        rgba: numpy array with shape [h, w, 4] in uint8 format
+        left: Offset of the layer from the left of the canvas
+        top: Offset of the layer from the top of the canvas
+        mask: Optional numpy array with shape [h, w] in uint8 format, aligned with rgba
+        blend_mode: Blend mode name (e.g. "normal", "multiply")
+    """
+    canvas_height, canvas_width = canvas.shape[:2]
+    x0, y0 = max(left, 0), max(top, 0)
+    x1 = min(left + rgba.shape[1], canvas_width)
+    y1 = min(top + rgba.shape[0], canvas_height)
+    if x0 >= x1 or y0 >= y1:
+        return
+    
+    source = rgba[y0 - top:y1 - top, x0 - left:x1 - left]
+    alpha = source[:, :, 3].astype(np.float32)
+    if mask is not None:
+        alpha *= mask[y0 - top:y1 - top, x0 - left:x1 - left] * np.float32(1 / 255)
+    alpha *= np.float32(1 / 255)
+    
+    region = canvas[y0:y1, x0:x1]
+    color = source[:, :, :3].astype(np.float32)
+    color *= np.float32(1 / 255)
+    blend = COMPOSITE_BLEND_FUNCTIONS.get(blend_mode)
+    if blend is not None:
+        color = blend(region, color)
+    
+    # Alpha-over: region = region + (color - region) * alpha
+    color -= region
+    color *= alpha[:, :, None]
+    region += color
+
+
+def composite_to_uint8(canvas: np.ndarray) -> np.ndarray:
+    """
+    Converts a composited float canvas to uint8, reusing the canvas as scratch space.
+    
+    Args:
+        canvas: float32 numpy array with shape [H, W, 3] in the 0-1 range
+        
+    Returns:
+        numpy array with shape [H, W, 3] in uint8 format
+    """
+    merged = np.empty(canvas.shape, dtype=np.uint8)
+    np.multiply(canvas, 255.0, out=canvas)
+    np.rint(canvas, out=canvas)
+    np.clip(canvas, 0.0, 255.0, out=canvas)
+    merged[...] = canvas
+    return merged
+
+
+def create_thumbnail_resource(merged: np.ndarray) -> ImageResource:
+    """
+    Creates a JPEG thumbnail image resource from a merged image.
+    
+    Args:
+        merged: numpy array with shape [H, W, 3] in uint8 format
+        
+    Returns:
+        psd_tools ImageResource for Resource.THUMBNAIL_RESOURCE
+    """
+    thumb = Image.fromarray(merged, 'RGB')
+    thumb.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+    with io.BytesIO() as buffer:
+        thumb.save(buffer, format='JPEG', quality=85)
+        jpeg_data = buffer.getvalue()
+    row = (thumb.width * 24 + 31) // 32 * 4
+    return ImageResource(
+        key=Resource.THUMBNAIL_RESOURCE,
+        data=ThumbnailResource(fmt=1, width=thumb.width, height=thumb.height, row=row,
+                               total_size=row * thumb.height, bits=24, planes=1,
+                               data=jpeg_data)
+    )
+
+
+def store_psd_composite(psd: PSDImage, canvas: np.ndarray, thumbnail: bool = True) -> None:
+    """
+    Stores a composited canvas as the document's merged image data.
+    
+    Args:
+        psd: psd_tools PSDImage object in RGB mode
+        canvas: float32 numpy array with shape [H, W, 3] in the 0-1 range,
+            or an already converted uint8 merged image
+        thumbnail: Also embed a JPEG thumbnail resource
+    """
+    check_psd_tools_available()
+    
+    merged = canvas if canvas.dtype == np.uint8 else composite_to_uint8(canvas)
+    
+    header = psd._record.header
+    planes = [merged[:, :, index].tobytes() for index in range(3)]
+    # Any extra channel (composite alpha) is fully opaque
+    planes += [b"\xff" * (header.width * header.height)] * (header.channels - 3)
+    psd._record.image_data.set_data(planes, header)
+    
+    # The stored composite is current; keep psd-tools from re-rendering it on save
+    psd._updated = False
+    
+    if thumbnail:
+        psd._record.image_resources[Resource.THUMBNAIL_RESOURCE] = create_thumbnail_resource(merged)
+
+
 def create_simple_psd_layer(pil_image: Image.Image, layer_name: str, 
-                           pil_mask: Optional[Image.Image] = None) -> PixelLayer:
+                           pil_mask: Optional[Union[Image.Image, CompactMask]] = None,
+                           top: int = 0, left: int = 0,
+                           blend_mode: str = "normal",
+                           parent: Optional[PSDImage] = None,
+                           mask_resize_filter: str = DEFAULT_MASK_RESIZE_FILTER,
+                           compression: str = "rle") -> PixelLayer:
     """
-    Creates a PSD layer from a PIL image with optional mask using simple approach.
-    Instead of complex manual mask creation, we composite the mask into the image.
+    Creates a PSD layer from a PIL image with an optional user layer mask.
+    
+    The mask is written as a real PSD layer mask (USER_LAYER_MASK channel)
+    instead of being merged into the image alpha, so it stays editable in
+    Photoshop and the original alpha is kept.
+    
+    The layer is built directly from its record and compressed channels and
+    appended on top of the layers already in parent; no pixel buffer other
+    than the layer's own channels is allocated.
     
     Args:
         pil_image: PIL Image in RGB or RGBA mode
         layer_name: Name for the layer
-        pil_mask: Optional PIL Image mask in L mode
+        pil_mask: Optional PIL Image mask in L mode, or CompactMask with the
+            size of the image
+        top: Offset of the layer from the top of the canvas
+        left: Offset of the layer from the left of the canvas
+        blend_mode: Blend mode name (e.g. "normal", "multiply")
+        parent: Document the layer is added to (usually from
+            create_psd_document); a 1x1 document is created when omitted
+        mask_resize_filter: Filter used when the mask size differs from the
+            image (one of MASK_RESIZE_FILTERS)
+        compression: Channel compression, one of CHANNEL_COMPRESSIONS
         
     Returns:
         psd_tools PixelLayer object
     """
     check_psd_tools_available()
     
-    # If mask is provided, apply it to the image
-    if pil_mask is not None:
+    if parent is None:
+        parent = create_psd_document(1, 1)
+    
+    # Keep the image alpha (fully opaque for RGB images)
+    if pil_image.mode != 'RGBA':
+        pil_image = pil_image.convert('RGBA')
+    
+    mask_np = None
+    if isinstance(pil_mask, CompactMask):
+        print(f"🎭 Using compact mask for layer '{layer_name}': {pil_mask}")
+        mask_np = pil_mask
+    elif pil_mask is not None:
         print(f"🎭 Processing mask for layer '{layer_name}': {pil_mask.size} mode: {pil_mask.mode}")
         
         # Validate mask
-        if pil_mask.mode not in ['L', 'LA']:
+        if pil_mask.mode != 'L':
             print(f"⚠️ Converting mask from {pil_mask.mode} to L mode")
             pil_mask = pil_mask.convert('L')
         
+        mask_np = np.asarray(pil_mask)
+        
         # Resize mask to match image if needed
         if pil_mask.size != pil_image.size:
             print(f"📏 Resizing mask from {pil_mask.size} to {pil_image.size}")
-            pil_mask = pil_mask.resize(pil_image.size, Image.LANCZOS)
-        
-        # Apply mask to image using PIL compositing
-        original_mode = pil_image.mode
-        pil_image = apply_mask_to_image(pil_image, pil_mask)
-        print(f"✅ Applied mask to layer '{layer_name}' (image mode: {original_mode} -> {pil_image.mode})")
-        
-        # Verify mask was applied by checking alpha channel
-        if pil_image.mode == 'RGBA':
-            alpha_channel = pil_image.split()[3]
-            alpha_stats = alpha_channel.getextrema()
-            print(f"🔍 Alpha channel range for '{layer_name}': {alpha_stats[0]}-{alpha_stats[1]}")
-        
+            mask_np = resize_mask_arrays([mask_np], [(pil_image.height, pil_image.width)],
+                                         mask_resize_filter)[0]
     else:
         print(f"ℹ️ No mask provided for layer '{layer_name}' - using full opacity")
-        # Ensure image has alpha channel for consistency
-        if pil_image.mode != 'RGBA':
-            pil_image = pil_image.convert('RGBA')
-    
-    # Create a temporary PSD to get the layer
-    temp_psd = PSDImage.new(mode='RGB', size=pil_image.size, color=(0, 0, 0))
     
-    # Create the layer from the PIL image (psd-tools handles the conversion)
-    layer = PixelLayer.frompil(pil_image, temp_psd, layer_name)
+    # Create the layer from its record and compressed channels
+    record, channels = encode_layer_record(np.asarray(pil_image), layer_name, top=top, left=left,
+                                           mask=mask_np, blend_mode=blend_mode or "normal",
+                                           version=parent.version, compression=compression)
+    layer = PixelLayer(parent, record, channels)
+    parent.append(layer)
     
-    print(f"🎨 Created PSD layer '{layer_name}' with size {pil_image.size}")
+    print(f"🎨 Created PSD layer '{layer_name}' with size {pil_image.size} at ({left}, {top})"
+          f"{' and a layer mask' if mask_np is not None else ''}")
     
     return layer
 
 
-def create_psd_from_layers(layers: List[PixelLayer], canvas_width: int, canvas_height: int,
-                          background_color: Tuple[int, int, int] = (255, 255, 255)) -> PSDImage:
+def choose_psd_version(canvas_width: int, canvas_height: int,
+                       layer_sizes: Sequence[Tuple[int, int, bool]] = ()) -> int:
     """
-    Creates a PSD file from a list of layers using simple approach.
+    Picks the file format a document fits in.
+    
+    Classic PSD is limited to 30,000 pixels per side and 4 GB per section;
+    anything larger is written as PSB (large document format), which has
+    8-byte section and channel lengths and allows 300,000 pixels per side.
     
     Args:
-        layers: List of psd_tools PixelLayer objects
         canvas_width: Width of the canvas
         canvas_height: Height of the canvas
-        background_color: RGB color for background
+        layer_sizes: (width, height, has_mask) of every layer
         
     Returns:
-        psd_tools PSDImage object
+        1 for PSD, 2 for PSB
     """
-    check_psd_tools_available()
+    if max(canvas_width, canvas_height) > PSD_MAX_DIMENSION:
+        return 2
     
-    # Create new PSD document
-    psd = PSDImage.new(mode='RGB', size=(canvas_width, canvas_height), color=background_color)
+    # Worst case RLE output is slightly larger than the raw planes, plus the row lengths
+    layer_bytes = 0
+    for width, height, has_mask in layer_sizes:
+        if max(width, height) > PSD_MAX_DIMENSION:
+            return 2
+        planes = 5 if has_mask else 4
+        layer_bytes += planes * (height * (width + (width + 127) // 128 + 2) + 2)
+    if layer_bytes > PSD_MAX_SECTION_LENGTH:
+        return 2
+    return 1
+
+
+def psb_output_path(output_path: str) -> str:
+    """
+    Returns the ".psb" path used instead of a ".psd" output path.
+    
+    An empty placeholder claimed by generate_unique_filename is released and
+    the matching ".psb" name is claimed instead.
+    """
+    stem, ext = os.path.splitext(output_path)
+    if ext.lower() != ".psd":
+        return output_path
+    if os.path.exists(output_path) and os.path.getsize(output_path) == 0:
+        release_filename(output_path)
+        return generate_unique_filename(os.path.basename(stem) + ".psb", os.path.dirname(output_path) or ".")
+    return stem + ".psb"
+
+
+def create_psd_document(canvas_width: int, canvas_height: int,
+                        background_color: Tuple[int, int, int] = (255, 255, 255),
+                        version: Optional[int] = None) -> PSDImage:
+    """
+    Creates the empty PSD document that layers are created against.
     
-    # Add layers to PSD (in reverse order since PSD layers are bottom-to-top)
-    for layer in reversed(layers):
-        psd.append(layer)
+    Args:
+        canvas_width: Width of the canvas
+        canvas_height: Height of the canvas
+        background_color: RGB color of the document's initial composite
+        version: 1 for PSD, 2 for PSB; by default PSB is used only for
+            canvases larger than 30,000 pixels per side
+        
+    Returns:
+        psd_tools PSDImage object
+    """
+    check_psd_tools_available()
     
+    psd = PSDImage.new(mode='RGB', size=(max(1, canvas_width), max(1, canvas_height)), color=background_color)
+    if version is not None:
+        psd._record.header.version = version
     return psd
 
 
@@ -310,51 +677,610 @@ def save_psd_file(psd: PSDImage, filepath: str) -> bool:
         return False
 
 
-def generate_unique_filename(base_path: str, output_dir: str = ".") -> str:
+def generate_unique_filename(base_path: str, output_dir: str = ".", overwrite: bool = False) -> str:
     """
-    Generates a unique filename by appending numbers if the file exists.
+    Claims a unique filename by appending a counter if the file exists.
+    
+    The file is created empty so concurrent savers never pick the same name;
+    see apz_filename_allocator.allocate_filename.
     
     Args:
         base_path: Base file path (e.g., "output.psd")
         output_dir: Output directory
+        overwrite: Return the base path as is, overwriting an existing file
         
     Returns:
         Unique file path
     """
-    # Extract filename and extension
-    filename = os.path.basename(base_path)
-    name, ext = os.path.splitext(filename)
+    return allocate_filename(os.path.basename(base_path), output_dir, overwrite)
+
+
+def fit_mask_batch(mask_tensor: torch.Tensor, height: int, width: int,
+                   resize_filter: str = DEFAULT_MASK_RESIZE_FILTER) -> torch.Tensor:
+    """
+    Brings a MASK batch to the 0-1 range and to its image's size.
+    
+    Masks outside 0-1 (e.g. 0-255 floats) are normalized instead of clipped,
+    and the whole batch is resized with one interpolation call. The input
+    tensor is never modified; it is only copied when something changes.
+    
+    Args:
+        mask_tensor: PyTorch tensor with shape [B, H, W], [B, 1, H, W] or [H, W]
+        height: Height of the image the masks belong to
+        width: Width of the image the masks belong to
+        resize_filter: One of MASK_RESIZE_FILTERS
+        
+    Returns:
+        PyTorch tensor with shape [B, height, width]
+    """
+    mask_batch = as_mask_batch(mask_tensor)
+    if mask_batch.is_floating_point():
+        mask_batch = normalize_masks(mask_batch, inplace=False)
+    if tuple(mask_batch.shape[1:]) != (height, width):
+        print(f"📏 Resizing {mask_batch.shape[0]} mask(s) from {tuple(mask_batch.shape[:0:-1])} "
+              f"to {(width, height)} ({resize_filter})")
+        if not mask_batch.is_floating_point():
+            mask_batch = uint8_to_float_tensor(mask_batch)
+        mask_batch = resize_masks(mask_batch, height, width, resize_filter)
+    return mask_batch
+
+
+def expand_batched_layers(image_tensors: List[torch.Tensor],
+                          layer_names: List[str],
+                          mask_tensors: Optional[List[torch.Tensor]] = None,
+                          mask_resize_filter: str = DEFAULT_MASK_RESIZE_FILTER
+                          ) -> Tuple[List[Image.Image], List[str], List[Optional[Image.Image]], List[int]]:
+    """
+    Expands batched layer inputs so that every batch element becomes its own layer.
+    
+    Each IMAGE batch is converted to uint8 in a single vectorized pass. Mask
+    batches are normalized and resized to their image batch by
+    fit_mask_batch first. A mask batch of size 1 is shared by all elements
+    of its image batch; otherwise mask element i is paired with image
+    element i.
+    
+    Args:
+        image_tensors: List of PyTorch tensors with images, each [B, H, W, C]
+        layer_names: List of names for each input
+        mask_tensors: Optional list of PyTorch tensors with masks
+        mask_resize_filter: Filter for masks whose size differs from their
+            image (one of MASK_RESIZE_FILTERS)
+        
+    Returns:
+        tuple of (pil_images, layer_names, pil_masks, source_indices), one entry
+        per layer; source_indices maps each layer back to its input
+    """
+    pil_images = []
+    names = []
+    pil_masks = []
+    source_indices = []
     
-    # Start with the original filename
-    counter = 1
-    while True:
-        if counter == 1:
-            unique_filename = filename
+    for i, tensor in enumerate(image_tensors):
+        images = tensor_to_pil_images(tensor, keep_alpha=True)
+        name = layer_names[i] if i < len(layer_names) and layer_names[i] else f"Layer {i+1}"
+        
+        masks = [None]
+        mask_tensor = mask_tensors[i] if mask_tensors and i < len(mask_tensors) else None
+        if mask_tensor is not None:
+            try:
+                mask_batch = fit_mask_batch(mask_tensor, images[0].height, images[0].width,
+                                            mask_resize_filter)
+                masks = tensor_to_pil_masks(mask_batch)
+            except Exception as e:
+                print(f"❌ Failed to convert mask {i+1}: {e}")
+                masks = [None]
+        
+        if len(masks) not in (1, len(images)):
+            print(f"⚠️ Mask batch size {len(masks)} doesn't match image batch size {len(images)} "
+                  f"for '{name}' - repeating masks")
+        
+        for b, pil_image in enumerate(images):
+            pil_images.append(pil_image)
+            names.append(name if len(images) == 1 else f"{name} {b+1}")
+            pil_masks.append(masks[b % len(masks)])
+            source_indices.append(i)
+        
+        print(f"✅ Converted input {i+1} '{name}': {len(images)} image(s) of size {images[0].size}")
+    
+    return pil_images, names, pil_masks, source_indices
+
+
+def resolve_layer_offsets(placement: str,
+                          layer_offsets: Optional[List[Optional[Tuple[int, int]]]],
+                          count: int) -> List[Optional[Tuple[int, int]]]:
+    """
+    Resolves a placement mode into per-layer offsets.
+    
+    Args:
+        placement: "center" (layers without an explicit offset are centered),
+            "top_left" (every layer at 0, 0) or "offset" (explicit offsets, 0, 0
+            for layers without one)
+        layer_offsets: Optional list of (left, top) offsets
+        count: Number of layers
+        
+    Returns:
+        List of (left, top) offsets or None for centered layers
+    """
+    if layer_offsets is None:
+        layer_offsets = []
+    offsets = [layer_offsets[i] if i < len(layer_offsets) else None for i in range(count)]
+    
+    if placement == "top_left":
+        return [(0, 0)] * count
+    if placement == "offset":
+        return [offset if offset is not None else (0, 0) for offset in offsets]
+    if placement == "center":
+        return offsets
+    raise ValueError(f"Unknown placement mode: {placement}")
+
+
+def calculate_placed_canvas_size(images: List[Image.Image],
+                                 layer_offsets: List[Optional[Tuple[int, int]]]) -> Tuple[int, int]:
+    """
+    Calculates the canvas size for layers that may carry explicit offsets.
+    
+    Layers with an offset extend the canvas to their right/bottom edge,
+    layers without one are centered and only need to fit.
+    
+    Args:
+        images: List of PIL Images
+        layer_offsets: List of (left, top) offsets or None, one per image
+        
+    Returns:
+        tuple of (width, height)
+    """
+    if not images:
+        return 512, 512  # Default size
+    
+    width = 1
+    height = 1
+    for image, offset in zip(images, layer_offsets):
+        left, top = offset if offset is not None else (0, 0)
+        width = max(width, left + image.width)
+        height = max(height, top + image.height)
+    
+    return width, height
+
+
+def _visible_bbox(mask: Optional[np.ndarray], mask_stats: Optional["MaskStats"],
+                  alpha: Optional[np.ndarray]) -> Optional[Tuple[int, int, int, int]]:
+    """
+    Finds the bounding box of the pixels a layer shows (alpha and mask both non-zero).
+    
+    The mask's statistics give its box directly; the alpha is measured the
+    same way, and only where both boxes overlap are the two planes combined.
+    
+    Returns:
+        (left, top, right, bottom), or None when nothing is visible
+    """
+    if alpha is None:
+        return mask_stats.bbox
+    alpha_stats = compute_mask_stats(alpha)[0]
+    if mask is None or alpha_stats.is_empty:
+        return alpha_stats.bbox
+    if alpha_stats.is_full or mask_stats.is_empty:
+        return mask_stats.bbox
+    
+    # Only the overlap of both boxes can be visible
+    left = max(mask_stats.bbox[0], alpha_stats.bbox[0])
+    top = max(mask_stats.bbox[1], alpha_stats.bbox[1])
+    right = min(mask_stats.bbox[2], alpha_stats.bbox[2])
+    bottom = min(mask_stats.bbox[3], alpha_stats.bbox[3])
+    if left >= right or top >= bottom:
+        return None
+    bbox = compute_alpha_bbox(np.minimum(mask[top:bottom, left:right], alpha[top:bottom, left:right]))
+    if bbox is None:
+        return None
+    return bbox[0] + left, bbox[1] + top, bbox[2] + left, bbox[3] + top
+
+
+class PreparedLayer(NamedTuple):
+    """
+    A layer ready to be encoded: converted, placed and (optionally) trimmed.
+    
+    Attributes:
+        image: PIL Image in RGBA mode
+        mask: Optional CompactMask aligned with image (np.asarray expands it)
+        name: Layer name
+        left: Offset of the layer from the left of the canvas
+        top: Offset of the layer from the top of the canvas
+        blend_mode: Blend mode name
+    """
+    image: Image.Image
+    mask: Optional[CompactMask]
+    name: str
+    left: int
+    top: int
+    blend_mode: str
+
+
+def prepare_psd_layers(pil_images: List[Image.Image],
+                       layer_names: List[str],
+                       pil_masks: Optional[List[Optional[Image.Image]]] = None,
+                       layer_offsets: Optional[List[Optional[Tuple[int, int]]]] = None,
+                       blend_modes: Optional[List[str]] = None,
+                       trim_layers: bool = False,
+                       mask_resize_filter: str = DEFAULT_MASK_RESIZE_FILTER) -> Tuple[int, int, List[PreparedLayer]]:
+    """
+    Places, trims and converts layers before they are encoded.
+    
+    Args:
+        pil_images: List of PIL Images, one per layer (top to bottom)
+        layer_names: List of names for each layer
+        pil_masks: Optional list of PIL masks (None entries for layers without mask)
+        layer_offsets: Optional list of (left, top) offsets; layers without one
+            are centered on the canvas. Layers are always written at their
+            native size with the position stored in the layer record
+        blend_modes: Optional list of blend mode names
+        trim_layers: Store only the bounding box of each layer's visible
+            (non-transparent, unmasked) pixels instead of the full layer.
+            Layers with no visible pixels are always left out
+        mask_resize_filter: Filter for masks whose size differs from their
+            layer; all of them are resized together (see resize_mask_arrays)
+        
+    Returns:
+        tuple of (canvas_width, canvas_height, prepared layers top to bottom)
+    """
+    if pil_masks is None:
+        pil_masks = [None] * len(pil_images)
+    if layer_offsets is None:
+        layer_offsets = [None] * len(pil_images)
+    if blend_modes is None:
+        blend_modes = ["normal"] * len(pil_images)
+    
+    # Calculate canvas size
+    canvas_width, canvas_height = calculate_placed_canvas_size(pil_images, layer_offsets)
+    print(f"📐 Canvas size: {canvas_width}x{canvas_height}")
+    
+    # Resize every mismatched mask in one batched pass
+    pil_masks = [pil_masks[i] if i < len(pil_masks) else None for i in range(len(pil_images))]
+    mismatched = [i for i, (pil_image, pil_mask) in enumerate(zip(pil_images, pil_masks))
+                  if pil_mask is not None and pil_mask.size != pil_image.size]
+    if mismatched:
+        print(f"📏 Resizing {len(mismatched)} mask(s) to their layer size ({mask_resize_filter})")
+        resized = resize_mask_arrays([np.asarray(pil_masks[i].convert('L')) for i in mismatched],
+                                     [(pil_images[i].height, pil_images[i].width) for i in mismatched],
+                                     mask_resize_filter)
+        for i, mask_np in zip(mismatched, resized):
+            pil_masks[i] = Image.fromarray(mask_np, 'L')
+    
+    prepared = []
+    for i, (pil_image, layer_name) in enumerate(zip(pil_images, layer_names)):
+        # Get corresponding mask
+        pil_mask = pil_masks[i]
+        offset = layer_offsets[i] if i < len(layer_offsets) else None
+        blend_mode = blend_modes[i] if i < len(blend_modes) else "normal"
+        
+        # Every layer keeps its native size; its position goes into the layer record
+        if offset is None:
+            left = (canvas_width - pil_image.width) // 2
+            top = (canvas_height - pil_image.height) // 2
+        else:
+            left, top = offset
+        placed_image = pil_image
+        
+        if pil_mask is not None and pil_mask.mode != 'L':
+            pil_mask = pil_mask.convert('L')
+        mask_np = np.asarray(pil_mask) if pil_mask is not None else None
+        mask_stats = compute_mask_stats(mask_np)[0] if mask_np is not None else None
+        if mask_stats is not None and mask_stats.is_full:
+            # A fully white mask hides nothing
+            print(f"🎭 Mask of layer '{layer_name}' is fully opaque - dropping it")
+            pil_mask, mask_np, mask_stats = None, None, None
+        
+        # Find what the layer shows (alpha and mask); a layer showing nothing is skipped
+        alpha = np.asarray(pil_image.getchannel('A')) if pil_image.mode == 'RGBA' else None
+        if mask_stats is not None and mask_stats.is_empty:
+            bbox = None
+        elif mask_np is not None or alpha is not None:
+            bbox = _visible_bbox(mask_np, mask_stats, alpha)
+        else:
+            bbox = (0, 0, pil_image.width, pil_image.height)
+        if bbox is None:
+            print(f"👻 Layer '{layer_name}' is fully transparent - skipping it")
+            continue
+        
+        if trim_layers and bbox != (0, 0, pil_image.width, pil_image.height):
+            # Crop the layer to its visible bbox and shift its offset accordingly
+            print(f"✂️ Trimmed layer '{layer_name}' from {pil_image.size} to {bbox[2] - bbox[0]}x{bbox[3] - bbox[1]}")
+            placed_image = pil_image.crop(bbox)
+            if mask_np is not None:
+                mask_np = mask_np[bbox[1]:bbox[3], bbox[0]:bbox[2]]
+            left += bbox[0]
+            top += bbox[1]
+        
+        if placed_image.mode != 'RGBA':
+            placed_image = placed_image.convert('RGBA')
+        
+        # Keep only the mask's rectangle, already encoded for the mask channel
+        compact_mask = CompactMask.from_array(mask_np) if mask_np is not None else None
+        prepared.append(PreparedLayer(placed_image, compact_mask, layer_name, left, top, blend_mode))
+    
+    return canvas_width, canvas_height, prepared
+
+
+def composite_prepared_layers(prepared: List[PreparedLayer], canvas_width: int, canvas_height: int,
+                              background_color: Tuple[int, int, int] = (255, 255, 255),
+                              region: Optional[Tuple[int, int, int, int]] = None) -> np.ndarray:
+    """
+    Composites prepared layers (top to bottom) over a background color.
+    
+    Args:
+        prepared: Prepared layers, top to bottom
+        canvas_width: Width of the canvas
+        canvas_height: Height of the canvas
+        background_color: RGB color below all layers
+        region: Optional (left, top, right, bottom) part of the canvas to
+            composite; only layers overlapping it are read
+        
+    Returns:
+        float32 numpy array with shape [H, W, 3] (the region's size if given)
+        in the 0-1 range
+    """
+    x0, y0, x1, y1 = region if region is not None else (0, 0, max(1, canvas_width), max(1, canvas_height))
+    canvas = np.empty((y1 - y0, x1 - x0, 3), dtype=np.float32)
+    canvas[...] = np.asarray(background_color, dtype=np.float32) / 255
+    for layer in reversed(prepared):
+        if (layer.left >= x1 or layer.top >= y1 or
+                layer.left + layer.image.width <= x0 or layer.top + layer.image.height <= y0):
+            continue
+        composite_layer_over(canvas, np.asarray(layer.image), layer.left - x0, layer.top - y0,
+                             np.asarray(layer.mask) if layer.mask is not None else None, layer.blend_mode)
+    return canvas
+
+
+def _prepared_layer_sizes(prepared: List[PreparedLayer]) -> List[Tuple[int, int, bool]]:
+    return [(layer.image.width, layer.image.height, layer.mask is not None) for layer in prepared]
+
+
+def render_psd_composite(prepared: List[PreparedLayer], canvas_width: int, canvas_height: int,
+                         background_color: Tuple[int, int, int] = (255, 255, 255)) -> np.ndarray:
+    """
+    Composites prepared layers (top to bottom) into the document's merged image.
+    
+    Returns:
+        numpy array with shape [H, W, 3] in uint8 format
+    """
+    return composite_to_uint8(composite_prepared_layers(prepared, canvas_width, canvas_height, background_color))
+
+
+def assemble_psd_document(prepared: List[PreparedLayer], canvas_width: int, canvas_height: int,
+                          thumbnail: bool = True, merged: Optional[np.ndarray] = None,
+                          compression: str = "rle") -> PSDImage:
+    """
+    Encodes prepared layers (top to bottom) into a new PSD document with its composite.
+    
+    The composite is rendered from the layers unless merged (from
+    render_psd_composite) is given. Layer channels are compressed with
+    compression (one of CHANNEL_COMPRESSIONS).
+    
+    Returns:
+        psd_tools PSDImage object
+    """
+    check_psd_tools_available()
+    
+    # Create the document once; every layer is created directly inside it
+    print("📄 Creating PSD document...")
+    background_color = (255, 255, 255)
+    version = choose_psd_version(canvas_width, canvas_height, _prepared_layer_sizes(prepared))
+    if version == 2:
+        print(f"📦 Document exceeds PSD limits - writing PSB (large document format)")
+    psd = create_psd_document(canvas_width, canvas_height, background_color, version=version)
+    
+    # Add layers bottom to top, since PSD layers are stored bottom-to-top
+    for i in reversed(range(len(prepared))):
+        layer = prepared[i]
+        print(f"🎨 Creating layer {i+1}: '{layer.name}'")
+        create_simple_psd_layer(layer.image, layer.name, layer.mask,
+                                top=layer.top, left=layer.left, blend_mode=layer.blend_mode, parent=psd,
+                                compression=compression)
+        print(f"✅ Created layer '{layer.name}' successfully")
+    
+    if merged is None:
+        merged = render_psd_composite(prepared, canvas_width, canvas_height, background_color)
+    store_psd_composite(psd, merged, thumbnail=thumbnail)
+    return psd
+
+
+def write_prepared_document(prepared: List[PreparedLayer], canvas_width: int, canvas_height: int,
+                            output_path: str, merged: Optional[np.ndarray] = None,
+                            thumbnail: bool = True, compression: str = "rle") -> bool:
+    """
+    Encodes prepared layers (top to bottom) with psd-tools and saves the document.
+    
+    This is the psd-tools write path; see apz_psd_backends for the others.
+    
+    Args:
+        prepared: Prepared layers, top to bottom
+        canvas_width: Width of the canvas
+        canvas_height: Height of the canvas
+        output_path: Path of the file to write (PSB documents should use a
+            .psb path, see psb_output_path)
+        merged: Optional merged image from render_psd_composite
+        thumbnail: Embed a thumbnail of the composite
+        compression: Channel compression, one of CHANNEL_COMPRESSIONS
+        
+    Returns:
+        True if successful, False otherwise
+    """
+    psd = assemble_psd_document(prepared, canvas_width, canvas_height, thumbnail=thumbnail, merged=merged,
+                                compression=compression)
+    return save_psd_file(psd, output_path)
+
+
+def build_psd_document(pil_images: List[Image.Image],
+                       layer_names: List[str],
+                       pil_masks: Optional[List[Optional[Image.Image]]] = None,
+                       layer_offsets: Optional[List[Optional[Tuple[int, int]]]] = None,
+                       blend_modes: Optional[List[str]] = None,
+                       trim_layers: bool = False,
+                       thumbnail: bool = True) -> PSDImage:
+    """
+    Builds a PSD document from already converted PIL images and masks.
+    
+    The merged image is composited from the layers, so viewers that only
+    read the composite show the real result.
+    
+    Args:
+        pil_images: List of PIL Images, one per layer (top to bottom)
+        layer_names: List of names for each layer
+        pil_masks: Optional list of PIL masks (None entries for layers without mask)
+        layer_offsets: Optional list of (left, top) offsets, see prepare_psd_layers
+        blend_modes: Optional list of blend mode names
+        trim_layers: Store only the bounding box of each layer's visible pixels
+        thumbnail: Embed a thumbnail of the composite
+        
+    Returns:
+        psd_tools PSDImage object
+    """
+    check_psd_tools_available()
+    
+    canvas_width, canvas_height, prepared = prepare_psd_layers(
+        pil_images, layer_names, pil_masks, layer_offsets, blend_modes, trim_layers)
+    return assemble_psd_document(prepared, canvas_width, canvas_height, thumbnail=thumbnail)
+
+
+def write_psd_update(prepared: List[PreparedLayer], canvas_width: int, canvas_height: int,
+                     output_path: str, thumbnail: bool = True) -> bool:
+    """
+    Writes prepared layers to a fixed path, updating an existing file in place.
+    
+    Every layer's content hash is stored in the file. When the file already
+    exists, only layers whose hash it does not contain are encoded, and only
+    the region they cover (now or before) is recomposited; the records and
+    channel bytes of the other layers are copied from the old file. Files
+    without hashes are written from scratch.
+    
+    Args:
+        prepared: Prepared layers, top to bottom
+        canvas_width: Width of the canvas
+        canvas_height: Height of the canvas
+        output_path: Path of the PSD file to create or update
+        thumbnail: Embed a thumbnail of the composite
+        
+    Returns:
+        True if successful, False otherwise
+    """
+    check_psd_tools_available()
+    
+    # PSD records are stored bottom to top
+    bottom_up = list(reversed(prepared))
+    hashes = [compute_layer_hash(np.asarray(layer.image),
+                                 np.asarray(layer.mask) if layer.mask is not None else None,
+                                 layer.name, layer.left, layer.top, layer.blend_mode)
+              for layer in bottom_up]
+    
+    layout = read_psd_layout(output_path) if os.path.exists(output_path) else None
+    if layout is not None and choose_psd_version(canvas_width, canvas_height, _prepared_layer_sizes(prepared)) == 2:
+        # In-place updates write classic PSD only
+        layout = None
+    if layout is not None:
+        width, height = max(1, canvas_width), max(1, canvas_height)
+        if hashes == layout.hashes and layout.size == (width, height):
+            print(f"♻️ {output_path} is up to date - no layers changed")
+            return True
+        
+        # Dirty region: where changed layers are now, and where removed layers were
+        old_hashes, new_hashes = set(layout.hashes), set(hashes)
+        dirty = [(layer.left, layer.top, layer.left + layer.image.width, layer.top + layer.image.height)
+                 for layer, digest in zip(bottom_up, hashes) if digest not in old_hashes]
+        dirty += [bbox for bbox, digest in zip(layout.layer_bboxes, layout.hashes) if digest not in new_hashes]
+        # ...and where kept layers changed stacking position: for any two layers that
+        # swapped order, at least one of them changed position, and both cover their overlap
+        old_order = [digest for digest in layout.hashes if digest in new_hashes]
+        new_order = [digest for digest in hashes if digest in old_hashes]
+        moved = {new for old, new in zip(old_order, new_order) if old != new}
+        dirty += [(layer.left, layer.top, layer.left + layer.image.width, layer.top + layer.image.height)
+                  for layer, digest in zip(bottom_up, hashes) if digest in moved]
+        
+        planar = layout.read_composite() if layout.size == (width, height) else None
+        if planar is not None:
+            planar = planar.copy()
+            region = (0, 0, 0, 0)
+            if dirty:
+                region = (max(0, min(box[0] for box in dirty)), max(0, min(box[1] for box in dirty)),
+                          min(width, max(box[2] for box in dirty)), min(height, max(box[3] for box in dirty)))
+            if region[0] < region[2] and region[1] < region[3]:
+                canvas = composite_prepared_layers(prepared, width, height, region=region)
+                merged_region = composite_to_uint8(canvas)
+                np.moveaxis(planar, 0, -1)[region[1]:region[3], region[0]:region[2]] = merged_region
         else:
-            unique_filename = f"{name}_{counter:03d}{ext}"
+            merged = composite_to_uint8(composite_prepared_layers(prepared, width, height))
+            planar = np.ascontiguousarray(np.moveaxis(merged, -1, 0))
         
-        full_path = os.path.join(output_dir, unique_filename)
+        extra_resources = [create_thumbnail_resource(np.moveaxis(planar, 0, -1))] if thumbnail else []
         
-        if not os.path.exists(full_path):
-            return full_path
+        def encoder(layer):
+            return lambda: encode_layer_record(
+                np.asarray(layer.image), layer.name, top=layer.top, left=layer.left,
+                mask=layer.mask, blend_mode=layer.blend_mode)
         
-        counter += 1
+        reused, encoded = splice_psd_update(layout, width, height, hashes,
+                                            [encoder(layer) for layer in bottom_up],
+                                            [plane.tobytes() for plane in planar], extra_resources)
+        print(f"♻️ Updated {output_path} in place: {encoded} layers encoded, {reused} reused")
+        return True
+    
+    psd = assemble_psd_document(prepared, canvas_width, canvas_height, thumbnail=thumbnail)
+    hash_resource = create_layer_hash_resource(hashes)
+    psd._record.image_resources[hash_resource.key] = hash_resource
+    return save_psd_file(psd, output_path)
+
+
+def read_psd_merged(output_path: str) -> Optional[np.ndarray]:
+    """
+    Reads the merged image back from a written PSD file, e.g. after an in-place update.
+    
+    Returns:
+        numpy array with shape [H, W, 3] in uint8 format, or None if unreadable
+    """
+    layout = read_psd_layout(output_path)
+    planar = layout.read_composite() if layout is not None else None
+    if planar is None:
+        return None
+    return np.ascontiguousarray(np.moveaxis(planar, 0, -1))
 
 
 def process_layers_to_psd(image_tensors: List[torch.Tensor],
                          layer_names: List[str],
                          mask_tensors: Optional[List[torch.Tensor]] = None,
                          output_dir: str = ".",
-                         filename_prefix: str = "output") -> Tuple[str, bool]:
+                         filename_prefix: str = "output",
+                         layer_offsets: Optional[List[Optional[Tuple[int, int]]]] = None,
+                         blend_modes: Optional[List[str]] = None,
+                         trim_layers: bool = False,
+                         update_existing: bool = False,
+                         output_path: Optional[str] = None,
+                         sidecar_layers: bool = False,
+                         sidecar_flat: Optional[str] = None,
+                         mask_resize_filter: str = DEFAULT_MASK_RESIZE_FILTER,
+                         backend=None) -> Tuple[str, bool]:
     """
     Processes a list of image tensors and creates a PSD file using simplified approach.
     
+    Batched inputs are expanded so that each batch element becomes its own layer.
+    
     Args:
         image_tensors: List of PyTorch tensors with images
         layer_names: List of names for each layer
         mask_tensors: Optional list of PyTorch tensors with masks
         output_dir: Directory to save the PSD file
         filename_prefix: Prefix for the filename
+        layer_offsets: Optional list of (left, top) offsets, one per input
+        blend_modes: Optional list of blend mode names, one per input
+        trim_layers: Crop layers to the bounding box of their visible pixels
+        update_existing: Write to "{filename_prefix}.psd" and, if it exists,
+            re-encode only the layers that changed (see write_psd_update)
+        output_path: Path to write to, e.g. from generate_unique_filename;
+            by default a unique name is claimed in output_dir
+        sidecar_layers: Also write one PNG per layer next to the PSD
+        sidecar_flat: Also write the composite as "jpeg", "webp" or "png"
+            (None or "none" to skip), see submit_sidecar_exports
+        mask_resize_filter: Filter for masks whose size differs from their
+            image (one of MASK_RESIZE_FILTERS)
+        backend: Optional PSD backend (see apz_psd_backends) writing the
+            document; psd-tools by default. In-place updates always use
+            psd-tools
         
     Returns:
         tuple of (output_path, success_boolean)
@@ -364,77 +1290,202 @@ def process_layers_to_psd(image_tensors: List[torch.Tensor],
         
         print(f"🔄 Processing {len(image_tensors)} layers for PSD creation...")
         
-        # Convert tensors to PIL images
-        pil_images = []
-        for i, tensor in enumerate(image_tensors):
-            pil_image = tensor_to_pil_image(tensor)
-            pil_images.append(pil_image)
-            print(f"✅ Converted tensor {i+1} to PIL image: {pil_image.size}")
-        
-        # Calculate canvas size
-        canvas_width, canvas_height = calculate_canvas_size(pil_images)
-        print(f"📐 Canvas size: {canvas_width}x{canvas_height}")
-        
-        # Process masks if provided
-        pil_masks = []
-        if mask_tensors:
-            print(f"🎭 Processing {len(mask_tensors)} mask tensors...")
-            for i, mask_tensor in enumerate(mask_tensors):
-                if mask_tensor is not None:
-                    try:
-                        pil_mask = tensor_to_pil_mask(mask_tensor)
-                        pil_masks.append(pil_mask)
-                        print(f"✅ Converted mask {i+1} to PIL mask: {pil_mask.size} mode: {pil_mask.mode}")
-                    except Exception as e:
-                        print(f"❌ Failed to convert mask {i+1}: {e}")
-                        pil_masks.append(None)
-                else:
-                    pil_masks.append(None)
-                    print(f"ℹ️ No mask provided for layer {i+1}")
-        else:
-            pil_masks = [None] * len(pil_images)
-            print(f"ℹ️ No mask tensors provided - creating {len(pil_images)} empty mask slots")
-        
-        # Create layers using simplified approach
-        layers = []
-        for i, (pil_image, layer_name) in enumerate(zip(pil_images, layer_names)):
-            print(f"🎨 Creating layer {i+1}: '{layer_name}'")
-            
-            # Resize image to canvas size
-            resized_image = resize_image_to_canvas(pil_image, canvas_width, canvas_height)
-            
-            # Get corresponding mask
-            pil_mask = pil_masks[i] if i < len(pil_masks) else None
-            
-            # Create PSD layer with simplified approach
-            layer = create_simple_psd_layer(resized_image, layer_name, pil_mask)
-            layers.append(layer)
-            print(f"✅ Created layer '{layer_name}' successfully")
-        
-        # Create PSD file
-        print("📄 Creating PSD document...")
-        psd = create_psd_from_layers(layers, canvas_width, canvas_height)
-        
-        # Generate unique filename
-        base_filename = f"{filename_prefix}.psd"
-        output_path = generate_unique_filename(base_filename, output_dir)
-        
-        # Ensure output directory exists
-        os.makedirs(output_dir, exist_ok=True)
-        
-        # Save PSD file
+        # Convert tensors to PIL images, one layer per batch element
+        pil_images, names, pil_masks, sources = expand_batched_layers(image_tensors, layer_names, mask_tensors,
+                                                                      mask_resize_filter)
+        
+        offsets = None
+        if layer_offsets:
+            offsets = [layer_offsets[i] if i < len(layer_offsets) else None for i in sources]
+        modes = None
+        if blend_modes:
+            modes = [blend_modes[i] if i < len(blend_modes) else "normal" for i in sources]
+        
+        canvas_width, canvas_height, prepared = prepare_psd_layers(
+            pil_images, names, pil_masks, offsets, modes, trim_layers, mask_resize_filter)
+        
+        if update_existing:
+            os.makedirs(output_dir, exist_ok=True)
+            output_path = os.path.join(output_dir, f"{filename_prefix}.psd")
+            if choose_psd_version(canvas_width, canvas_height, _prepared_layer_sizes(prepared)) == 2:
+                output_path = psb_output_path(output_path)
+            print(f"💾 Saving PSD file to: {output_path}")
+            success = write_psd_update(prepared, canvas_width, canvas_height, output_path)
+            if success:
+                print(f"🎉 Successfully saved PSD file with {len(pil_images)} layers!")
+                if sidecar_layers or sidecar_flat not in (None, "none"):
+                    # The composite was only partly re-rendered; read it back from the file
+                    merged = read_psd_merged(output_path)
+                    with ThreadPoolExecutor() as executor:
+                        collect_sidecar_results(submit_sidecar_exports(
+                            executor, output_path, prepared, max(1, canvas_width), max(1, canvas_height),
+                            merged, sidecar_layers, sidecar_flat))
+            else:
+                print("❌ Failed to save PSD file")
+            return output_path, success
+        
+        merged = render_psd_composite(prepared, canvas_width, canvas_height)
+        write_document = backend.write_document if backend is not None else write_prepared_document
+        
+        # Claim a unique filename (this also creates the output directory)
+        if output_path is None:
+            output_path = generate_unique_filename(f"{filename_prefix}.psd", output_dir)
+        if choose_psd_version(canvas_width, canvas_height, _prepared_layer_sizes(prepared)) == 2:
+            output_path = psb_output_path(output_path)
+        
+        # Save PSD file, encoding the sidecar files concurrently from the same pixels
         print(f"💾 Saving PSD file to: {output_path}")
-        success = save_psd_file(psd, output_path)
+        with ThreadPoolExecutor() as executor:
+            sidecars = submit_sidecar_exports(executor, output_path, prepared, max(1, canvas_width),
+                                              max(1, canvas_height), merged, sidecar_layers, sidecar_flat)
+            success = write_document(prepared, canvas_width, canvas_height, output_path, merged=merged)
+            collect_sidecar_results(sidecars)
         
         if success:
-            print(f"🎉 Successfully created PSD file with {len(layers)} layers!")
+            print(f"🎉 Successfully created PSD file with {len(pil_images)} layers!")
         else:
+            release_filename(output_path)
             print("❌ Failed to save PSD file")
         
         return output_path, success
         
     except Exception as e:
         print(f"❌ Error in process_layers_to_psd: {e}")
+        if output_path:
+            release_filename(output_path)
         import traceback
         traceback.print_exc()
         return "", False
+
+
+def process_batch_to_psds(image_tensors: List[torch.Tensor],
+                          layer_names: List[str],
+                          mask_tensors: Optional[List[torch.Tensor]] = None,
+                          output_dir: str = ".",
+                          filename_prefix: str = "output",
+                          max_workers: Optional[int] = None,
+                          trim_layers: bool = False,
+                          layer_offsets: Optional[List[Optional[Tuple[int, int]]]] = None,
+                          blend_modes: Optional[List[str]] = None,
+                          overwrite: bool = False,
+                          sidecar_layers: bool = False,
+                          sidecar_flat: Optional[str] = None,
+                          mask_resize_filter: str = DEFAULT_MASK_RESIZE_FILTER,
+                          backend=None,
+                          update_existing: bool = False) -> List[Tuple[str, bool]]:
+    """
+    Writes one PSD file per batch element, encoding the files in parallel.
+    
+    Element i of every layer input goes into file i. Inputs with a batch size
+    of 1 are shared by all files. Each input batch is converted to uint8 once.
+    
+    Args:
+        image_tensors: List of PyTorch tensors with images, each [B, H, W, C]
+        layer_names: List of names for each layer
+        mask_tensors: Optional list of PyTorch tensors with masks
+        output_dir: Directory to save the PSD files
+        filename_prefix: Prefix for the filenames
+        max_workers: Maximum number of encoder threads (default: CPU count)
+        trim_layers: Crop layers to the bounding box of their visible pixels
+        layer_offsets: Optional list of (left, top) offsets, one per layer
+        blend_modes: Optional list of blend mode names, one per layer
+        overwrite: Overwrite existing files instead of claiming unique names
+        sidecar_layers: Also write one PNG per layer next to every PSD
+        sidecar_flat: Also write every composite as "jpeg", "webp" or "png"
+        mask_resize_filter: Filter for masks whose size differs from their
+            image (one of MASK_RESIZE_FILTERS)
+        backend: Optional PSD backend (see apz_psd_backends) writing the
+            documents; psd-tools by default
+        update_existing: Write to the fixed names "{filename_prefix}_001.psd",
+            ... and update existing files in place, re-encoding only the
+            layers that changed (see write_psd_update); the backend is not used
+        
+    Returns:
+        list of (output_path, success_boolean) tuples, one per batch element
+    """
+    try:
+        check_psd_tools_available()
+        
+        # Convert every input batch once
+        image_batches = [tensor_to_pil_images(tensor, keep_alpha=True) for tensor in image_tensors]
+        mask_batches = []
+        for i in range(len(image_tensors)):
+            mask_tensor = mask_tensors[i] if mask_tensors and i < len(mask_tensors) else None
+            if mask_tensor is None:
+                mask_batches.append([None])
+                continue
+            height, width = image_batches[i][0].height, image_batches[i][0].width
+            mask_batches.append(tensor_to_pil_masks(fit_mask_batch(mask_tensor, height, width,
+                                                                   mask_resize_filter)))
+        
+        batch_size = max(len(images) for images in image_batches)
+        for i, images in enumerate(image_batches):
+            if len(images) not in (1, batch_size):
+                raise ValueError(f"Layer {i+1} has batch size {len(images)}, expected 1 or {batch_size}")
+        
+        print(f"🔄 Writing {batch_size} PSD files with {len(image_batches)} layers each...")
+        
+        sidecar_futures = []
+        write_document = backend.write_document if backend is not None else write_prepared_document
+        
+        def _write(job):
+            output_path, pil_images, pil_masks = job
+            try:
+                canvas_width, canvas_height, prepared = prepare_psd_layers(
+                    pil_images, layer_names, pil_masks, layer_offsets, blend_modes, trim_layers,
+                    mask_resize_filter)
+                if choose_psd_version(canvas_width, canvas_height, _prepared_layer_sizes(prepared)) == 2:
+                    output_path = psb_output_path(output_path)
+                if update_existing:
+                    success = write_psd_update(prepared, canvas_width, canvas_height, output_path)
+                    if success:
+                        # The composite was only partly re-rendered; read it back from the file
+                        sidecar_futures.extend(submit_sidecar_exports(
+                            sidecar_executor, output_path, prepared, max(1, canvas_width), max(1, canvas_height),
+                            read_psd_merged(output_path), sidecar_layers, sidecar_flat))
+                else:
+                    merged = render_psd_composite(prepared, canvas_width, canvas_height)
+                    sidecar_futures.extend(submit_sidecar_exports(
+                        sidecar_executor, output_path, prepared, max(1, canvas_width), max(1, canvas_height),
+                        merged, sidecar_layers, sidecar_flat))
+                    success = write_document(prepared, canvas_width, canvas_height, output_path, merged=merged)
+            except Exception as e:
+                print(f"❌ Failed to write {output_path}: {e}")
+                success = False
+            if not success:
+                release_filename(output_path)
+            return output_path, success
+        
+        # Claim the filenames up front so parallel writers don't collide
+        jobs = []
+        try:
+            # Updates always go to the same names, like overwriting
+            fixed_names = overwrite or update_existing
+            if batch_size > 1:
+                # One run of numbered names, continuing after earlier saves ("_003", "_004", ...)
+                output_paths = allocate_filenames(f"{filename_prefix}.psd", batch_size, output_dir, fixed_names)
+            else:
+                output_paths = [generate_unique_filename(f"{filename_prefix}.psd", output_dir, fixed_names)]
+            for b, output_path in enumerate(output_paths):
+                pil_images = [images[b % len(images)] for images in image_batches]
+                pil_masks = [masks[b % len(masks)] for masks in mask_batches]
+                jobs.append((output_path, pil_images, pil_masks))
+        
+            with ThreadPoolExecutor(max_workers=max_workers) as executor, \
+                    ThreadPoolExecutor(max_workers=max_workers) as sidecar_executor:
+                results = list(executor.map(_write, jobs))
+                collect_sidecar_results(sidecar_futures)
+        finally:
+            # Placeholders that were never written are removed, even when
+            # the writers did not start; written files are left alone
+            for output_path, _, _ in jobs:
+                release_filename(output_path)
+        
+        print(f"🎉 Wrote {sum(1 for _, ok in results if ok)}/{batch_size} PSD files")
+        return results
+        
+    except Exception as e:
+        print(f"❌ Error in process_batch_to_psds: {e}")
+        import traceback
+        traceback.print_exc()
+        return []
@@ -0,0 +1,129 @@
+"""
+Sidecar Export Utilities for the PSD Savers
+
+This module writes companion files next to a saved PSD: one canvas-sized PNG
+per layer (mask applied to its alpha) and a flattened JPEG, WebP or PNG of the
+composite. The files are encoded from the uint8 layers and composite the PSD
+writer already produced, and every file is encoded on its own worker thread
+(PIL's encoders release the GIL), alongside the PSD save itself.
+"""
+
+import os
+import re
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image
+
+# Flattened formats: extension, PIL format and save options
+SIDECAR_FLAT_FORMATS = {
+    "jpeg": (".jpg", "JPEG", {"quality": 95}),
+    "webp": (".webp", "WEBP", {"quality": 95, "method": 4}),
+    "png": (".png", "PNG", {"compress_level": 6}),
+}
+
+# Layer PNGs favour speed; they are intermediate files for other tools
+SIDECAR_PNG_COMPRESS_LEVEL = 3
+
+
+def sidecar_layer_name(index: int, layer_name: str) -> str:
+    """Returns a filesystem-safe name for a layer sidecar, e.g. "01_Product_Shot"."""
+    safe_name = re.sub(r"[^\w\-]+", "_", layer_name).strip("_") or "layer"
+    return f"{index + 1:02d}_{safe_name}"
+
+
+def layer_sidecar_image(layer, canvas_width: int, canvas_height: int) -> Image.Image:
+    """
+    Places a prepared layer on a transparent canvas, with its mask applied to the alpha.
+
+    Args:
+        layer: PreparedLayer (RGBA image, optional compact mask, left and top offsets)
+        canvas_width: Width of the canvas
+        canvas_height: Height of the canvas
+
+    Returns:
+        PIL Image in RGBA mode with the canvas size
+    """
+    image = layer.image
+    if layer.mask is not None:
+        rgba = np.array(image)
+        alpha = rgba[:, :, 3].astype(np.uint16)
+        alpha *= np.asarray(layer.mask)
+        alpha += 127
+        alpha //= 255
+        rgba[:, :, 3] = alpha
+        image = Image.fromarray(rgba, 'RGBA')
+
+    if (layer.left, layer.top) == (0, 0) and image.size == (canvas_width, canvas_height):
+        return image
+    canvas = Image.new('RGBA', (canvas_width, canvas_height), (0, 0, 0, 0))
+    canvas.paste(image, (layer.left, layer.top))
+    return canvas
+
+
+def _save_sidecar(path: str, render, pil_format: str, options: dict) -> Tuple[str, bool]:
+    try:
+        render().save(path, format=pil_format, **options)
+        return path, True
+    except Exception as e:
+        print(f"❌ Failed to write sidecar {path}: {e}")
+        return path, False
+
+
+def submit_sidecar_exports(executor: ThreadPoolExecutor,
+                           output_path: str,
+                           prepared: Sequence,
+                           canvas_width: int,
+                           canvas_height: int,
+                           merged: Optional[np.ndarray] = None,
+                           layer_pngs: bool = False,
+                           flat_format: Optional[str] = None) -> List[Future]:
+    """
+    Starts encoding the sidecar files of a PSD on an executor.
+
+    Files are named after the PSD: "<name>_01_<layer>.png" for every layer
+    (top to bottom) and "<name>.jpg" / ".webp" / ".png" for the composite.
+
+    Args:
+        executor: Thread pool running one encoder per file
+        output_path: Path of the PSD file
+        prepared: Prepared layers, top to bottom
+        canvas_width: Width of the canvas
+        canvas_height: Height of the canvas
+        merged: Composite as a numpy array with shape [H, W, 3] in uint8 format
+        layer_pngs: Write one PNG per layer
+        flat_format: "jpeg", "webp" or "png" to write the composite, or None
+
+    Returns:
+        list of futures resolving to (sidecar_path, success_boolean)
+    """
+    base = os.path.splitext(output_path)[0]
+    futures = []
+
+    if layer_pngs:
+        for index, layer in enumerate(prepared):
+            path = f"{base}_{sidecar_layer_name(index, layer.name)}.png"
+            render = (lambda layer=layer: layer_sidecar_image(layer, canvas_width, canvas_height))
+            futures.append(executor.submit(_save_sidecar, path, render, "PNG",
+                                           {"compress_level": SIDECAR_PNG_COMPRESS_LEVEL}))
+
+    if flat_format and flat_format != "none":
+        if flat_format not in SIDECAR_FLAT_FORMATS:
+            raise ValueError(f"Unknown sidecar format '{flat_format}', expected one of {list(SIDECAR_FLAT_FORMATS)}")
+        if merged is None:
+            print("⚠️ No composite available - skipping the flattened sidecar")
+        else:
+            ext, pil_format, options = SIDECAR_FLAT_FORMATS[flat_format]
+            futures.append(executor.submit(_save_sidecar, base + ext,
+                                           lambda: Image.fromarray(merged, 'RGB'), pil_format, options))
+
+    return futures
+
+
+def collect_sidecar_results(futures: Sequence[Future]) -> List[Tuple[str, bool]]:
+    """Waits for submitted sidecar exports and reports them."""
+    results = [future.result() for future in futures]
+    if results:
+        print(f"🗂️ Wrote {sum(1 for _, ok in results if ok)}/{len(results)} sidecar files")
+    return results
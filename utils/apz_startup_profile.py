@@ -0,0 +1,190 @@
+"""
+Startup Profiling for ComfyUI
+
+Set APZ_PSD_PROFILE_STARTUP to profile how long loading the extension takes
+and which part of it dominates. The package __init__ then records every
+startup phase (the dependency check and each node module import) and, after
+the nodes are registered, imports every utility module the nodes bind
+lazily, which is the cost paid the first time the nodes run. Each phase
+records its wall time, the Python memory it allocated (tracemalloc), the
+change in resident set size and the modules it imported.
+
+The report is written as JSON to the path in APZ_PSD_PROFILE_STARTUP (or to
+the temporary directory when it is "1"), and one summary line is printed.
+Startup is compared to APZ_PSD_STARTUP_BUDGET seconds (default 0.5).
+tracemalloc slows imports down, so profiled times are upper bounds.
+
+This module must only import the standard library.
+"""
+
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Dict, Iterator, List, NamedTuple, Optional
+
+PROFILE_ENV = "APZ_PSD_PROFILE_STARTUP"
+BUDGET_ENV = "APZ_PSD_STARTUP_BUDGET"
+DEFAULT_STARTUP_BUDGET_SECONDS = 0.5
+DEFAULT_REPORT_NAME = "apz_psd_startup_profile.json"
+
+
+class ProfilePhase(NamedTuple):
+    """One profiled startup phase"""
+    name: str
+    kind: str  # "dependency_check", "node_import" or "utility_import"
+    seconds: float
+    allocated_bytes: int  # net Python allocations kept after the phase
+    peak_allocated_bytes: int  # highest Python allocation during the phase, above its start
+    rss_delta_bytes: Optional[int]  # None where the resident set size is unavailable
+    imported_modules: List[str]
+    error: Optional[str]
+
+
+def startup_budget_seconds() -> float:
+    """Returns the configured startup budget in seconds"""
+    try:
+        return float(os.environ.get(BUDGET_ENV, DEFAULT_STARTUP_BUDGET_SECONDS))
+    except ValueError:
+        return DEFAULT_STARTUP_BUDGET_SECONDS
+
+
+def _resident_set_bytes() -> Optional[int]:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def _lazy_import_module():
+    # Node modules import apz_lazy_import as utils.apz_lazy_import, or by file
+    # path under its own name when another "utils" package shadows ours
+    return sys.modules.get("utils.apz_lazy_import") or sys.modules.get("apz_lazy_import")
+
+
+class StartupProfiler:
+    """Records the wall time and memory of each startup phase"""
+
+    def __init__(self, report_path: str, budget_seconds: float = DEFAULT_STARTUP_BUDGET_SECONDS):
+        self.report_path = report_path
+        self.budget_seconds = budget_seconds
+        self.phases: List[ProfilePhase] = []
+        self.startup_seconds: Optional[float] = None
+        self._owns_tracemalloc = not tracemalloc.is_tracing()
+        if self._owns_tracemalloc:
+            tracemalloc.start()
+        self._started = time.perf_counter()
+
+    @classmethod
+    def from_environment(cls) -> Optional["StartupProfiler"]:
+        """Returns a profiler if APZ_PSD_PROFILE_STARTUP is set, otherwise None"""
+        setting = os.environ.get(PROFILE_ENV, "").strip()
+        if setting.lower() in ("", "0", "false", "no", "off"):
+            return None
+        if setting.lower() in ("1", "true", "yes", "on"):
+            setting = os.path.join(tempfile.gettempdir(), DEFAULT_REPORT_NAME)
+        return cls(os.path.abspath(setting), startup_budget_seconds())
+
+    @contextlib.contextmanager
+    def phase(self, name: str, kind: str) -> Iterator[None]:
+        """Profiles the enclosed block; an exception is recorded and re-raised"""
+        modules_before = set(sys.modules)
+        allocated_before = tracemalloc.get_traced_memory()[0]
+        if hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+        rss_before = _resident_set_bytes()
+        start = time.perf_counter()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            allocated_after, peak = tracemalloc.get_traced_memory()
+            rss_after = _resident_set_bytes()
+            self.phases.append(ProfilePhase(
+                name=name,
+                kind=kind,
+                seconds=seconds,
+                allocated_bytes=allocated_after - allocated_before,
+                peak_allocated_bytes=max(0, peak - allocated_before),
+                rss_delta_bytes=None if rss_before is None or rss_after is None else rss_after - rss_before,
+                imported_modules=sorted(set(sys.modules) - modules_before),
+                error=error,
+            ))
+
+    def end_startup(self):
+        """Marks the end of startup; phases after this are not counted against the budget"""
+        self.startup_seconds = time.perf_counter() - self._started
+
+    def profile_utilities(self):
+        """Imports every utility module bound by the nodes, profiling each one"""
+        lazy_import = _lazy_import_module()
+        if lazy_import is None:
+            return
+        for module_name in lazy_import.bound_utility_modules():
+            try:
+                with self.phase(module_name, "utility_import"):
+                    lazy_import.load_utility(module_name)
+            except Exception:
+                pass  # Recorded in the phase; the node reports it again when it runs
+
+    def report(self, registered_nodes: int) -> Dict:
+        """Returns the report as a JSON-serializable dict"""
+        if self.startup_seconds is None:
+            self.end_startup()
+        return {
+            "extension": "APZmedia PSD Tools",
+            "timestamp": time.time(),
+            "python": sys.version,
+            "executable": sys.executable,
+            "registered_nodes": registered_nodes,
+            "startup_seconds": self.startup_seconds,
+            "budget_seconds": self.budget_seconds,
+            "within_budget": self.startup_seconds <= self.budget_seconds,
+            "first_use_seconds": sum(phase.seconds for phase in self.phases if phase.kind == "utility_import"),
+            "phases": [phase._asdict() for phase in self.phases],
+        }
+
+    def summary(self, report: Dict) -> str:
+        """Returns the report as one line"""
+        def milliseconds(seconds):
+            return f"{seconds * 1000:.1f} ms"
+
+        parts = []
+        for kind, label in (("dependency_check", "dependency check"), ("node_import", "node modules"),
+                            ("utility_import", "utilities on first use")):
+            phases = [phase for phase in self.phases if phase.kind == kind]
+            if phases:
+                slowest = max(phases, key=lambda phase: phase.seconds)
+                detail = f", slowest {slowest.name} {milliseconds(slowest.seconds)}" if len(phases) > 1 else ""
+                parts.append(f"{label} {milliseconds(sum(phase.seconds for phase in phases))}{detail}")
+        failed = sum(1 for phase in self.phases if phase.error)
+        if failed:
+            parts.append(f"{failed} failed")
+
+        if report["within_budget"]:
+            status = f"⏱️ APZmedia PSD Tools startup {milliseconds(report['startup_seconds'])}"
+        else:
+            status = (f"⚠️ APZmedia PSD Tools startup {milliseconds(report['startup_seconds'])} "
+                      f"over the {milliseconds(report['budget_seconds'])} budget")
+        return f"{status} ({'; '.join(parts)}), report: {self.report_path}"
+
+    def finish(self, registered_nodes: int) -> Dict:
+        """Writes the JSON report, prints the summary line and stops tracing"""
+        report = self.report(registered_nodes)
+        if self._owns_tracemalloc:
+            tracemalloc.stop()
+        try:
+            with open(self.report_path, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+        except OSError as e:
+            print(f"⚠️ Could not write the startup profile to {self.report_path}: {e}")
+        print(self.summary(report))
+        return report
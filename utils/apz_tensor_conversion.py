@@ -0,0 +1,321 @@
+"""
+Tensor, NumPy and PIL Conversion for ComfyUI
+
+This module is the one place where IMAGE and MASK tensors are converted to
+and from uint8 arrays and PIL images. Every other module goes through it.
+
+Contracts:
+    IMAGE tensors are float32 [B, H, W, C] in the 0-1 range (NCHW input is
+    accepted with layout="NCHW" or detected with layout="auto"); MASK
+    tensors are float32 [B, H, W]. uint8 arrays are NHWC [B, H, W, C] for
+    images and [B, H, W] for masks. Single images and masks are batches of 1.
+
+Tensor to uint8: clamping, scaling, rounding and casting are done chunk by
+chunk through a small reusable float scratch buffer, writing straight into
+the output array, so no full-frame temporaries are allocated whatever the
+input layout or dtype. A contiguous uint8 CPU tensor is returned as a view.
+
+uint8 to tensor: the array is wrapped with torch.from_numpy (no copy) and
+scaled into the float32 result in one pass.
+"""
+
+import threading
+import warnings
+from typing import List, Optional, Sequence, Union
+
+import numpy as np
+import torch
+from PIL import Image
+
+# Number of elements converted per chunk; the scratch buffer stays cache sized
+CHUNK_ELEMENTS = 1 << 20
+
+_FLOAT_DTYPES = (torch.float16, torch.bfloat16, torch.float32, torch.float64)
+
+_scratch = threading.local()
+
+
+def _get_scratch(numel: int) -> torch.Tensor:
+    """Returns a per-thread float32 scratch buffer with at least numel elements."""
+    buffer = getattr(_scratch, "buffer", None)
+    if buffer is None or buffer.numel() < numel:
+        buffer = torch.empty(numel, dtype=torch.float32)
+        _scratch.buffer = buffer
+    return buffer[:numel]
+
+
+def _convert_rows(src: torch.Tensor, dst: torch.Tensor) -> None:
+    """
+    Converts src into the uint8 tensor dst of the same shape.
+
+    src may be any strided view (permuted, sliced or expanded); the first
+    dimension is walked in chunks so each chunk fits the scratch buffer.
+    Leading dimensions whose slices are larger than a chunk are walked one
+    index at a time, so no full-frame temporary is ever made.
+    """
+    if src.dtype == torch.uint8:
+        dst.copy_(src)
+        return
+
+    if src.dim() > 2 and src.shape[0] and src[0].numel() > CHUNK_ELEMENTS:
+        for src_slice, dst_slice in zip(src.unbind(0), dst.unbind(0)):
+            _convert_rows(src_slice, dst_slice)
+        return
+
+    rows = src.shape[0]
+    row_elements = max(1, src[0].numel()) if rows else 1
+    rows_per_chunk = max(1, CHUNK_ELEMENTS // row_elements)
+
+    for start in range(0, rows, rows_per_chunk):
+        chunk = src[start:start + rows_per_chunk]
+        scratch = _get_scratch(chunk.numel()).view(chunk.shape)
+        if chunk.dtype == torch.float32:
+            torch.mul(chunk, 255.0, out=scratch)
+        elif chunk.dtype in _FLOAT_DTYPES:
+            scratch.copy_(chunk)
+            scratch.mul_(255.0)
+        else:
+            # Integer input is already in 0-255 units
+            scratch.copy_(chunk)
+        scratch.clamp_(0.0, 255.0).round_()
+        dst[start:start + rows_per_chunk].copy_(scratch)
+
+
+def _to_uint8(src: torch.Tensor, out: Optional[np.ndarray]) -> np.ndarray:
+    """Runs the conversion of an arbitrary view into a new or provided uint8 array."""
+    shape = tuple(src.shape)
+    if out is None and src.dtype == torch.uint8 and src.device.type == "cpu" and src.is_contiguous():
+        # Already 8-bit in the requested layout: share the memory
+        return src.numpy()
+    if out is None:
+        out = np.empty(shape, dtype=np.uint8)
+    elif out.shape != shape or out.dtype != np.uint8 or not out.flags.c_contiguous:
+        raise ValueError(f"Output buffer must be a C-contiguous uint8 array of shape {shape}, "
+                         f"got {out.dtype} {out.shape}")
+
+    if src.numel() == 0:
+        return out
+
+    dst = torch.from_numpy(out)
+
+    if src.device.type != "cpu":
+        # Convert on the device and transfer the 8-bit result only
+        converted = src if src.dtype == torch.uint8 else \
+            src.float().mul(255.0).clamp_(0.0, 255.0).round_().to(torch.uint8)
+        dst.copy_(converted)
+        return out
+
+    # Strided views are read as they are: reshaping a permuted or sliced view
+    # would copy the whole frame
+    _convert_rows(src, dst)
+    return out
+
+
+def image_layout(image_tensor: torch.Tensor) -> str:
+    """
+    Detects whether a 4D IMAGE tensor is NHWC (ComfyUI default) or NCHW.
+
+    Returns:
+        "NHWC" or "NCHW"
+    """
+    if image_tensor.shape[-1] in (1, 3, 4):
+        return "NHWC"
+    if image_tensor.shape[1] in (1, 3, 4):
+        return "NCHW"
+    return "NHWC"
+
+
+def image_tensor_to_uint8(image_tensor: torch.Tensor,
+                          channels: Optional[int] = 3,
+                          layout: str = "auto",
+                          out: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Converts an IMAGE tensor or batch to a uint8 NHWC array in one pass.
+
+    Args:
+        image_tensor: Tensor with shape [B, H, W, C], [B, C, H, W] or [H, W, C],
+            in float16, bfloat16, float32 (0-1 range) or uint8 (0-255 range)
+        channels: Number of output channels. 3 gives RGB (grayscale input is
+            broadcast, extra channels dropped); 4 keeps an alpha channel when
+            present; None keeps the input channel count
+        layout: "NHWC", "NCHW" or "auto" to detect it
+        out: Optional reusable output array with the result shape
+
+    Returns:
+        numpy array with shape [B, H, W, C] in uint8 format; shares memory
+        with a contiguous uint8 CPU input that needs no channel change
+    """
+    if image_tensor.dim() == 3:
+        image_tensor = image_tensor.unsqueeze(0)
+    if image_tensor.dim() != 4:
+        raise ValueError(f"Expected a 3D or 4D image tensor, got shape {tuple(image_tensor.shape)}")
+
+    if layout == "auto":
+        layout = image_layout(image_tensor)
+    if layout == "NCHW":
+        image_tensor = image_tensor.permute(0, 2, 3, 1)
+    elif layout != "NHWC":
+        raise ValueError(f"Unknown layout: {layout}")
+
+    # Channel selection is done on the view, the kernel reads it with strides
+    in_channels = image_tensor.shape[3]
+    if channels == 4 and in_channels != 4:
+        channels = 3
+    if channels is not None and in_channels != channels:
+        if in_channels == 1:
+            image_tensor = image_tensor.expand(-1, -1, -1, channels)
+        elif in_channels > channels:
+            image_tensor = image_tensor[..., :channels]
+        else:
+            # Pad missing channels with zeros
+            padding = image_tensor.new_zeros(image_tensor.shape[:3] + (channels - in_channels,))
+            image_tensor = torch.cat([image_tensor, padding], dim=3)
+
+    return _to_uint8(image_tensor, out)
+
+
+def mask_tensor_to_uint8(mask_tensor: torch.Tensor,
+                         out: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Converts a MASK tensor or batch to a uint8 array in one pass.
+
+    Args:
+        mask_tensor: Tensor with shape [B, H, W], [B, 1, H, W], [B, C, H, W]
+            (first channel is used) or [H, W]
+        out: Optional reusable output array with the result shape
+
+    Returns:
+        numpy array with shape [B, H, W] in uint8 format; shares memory with
+        a contiguous uint8 CPU input
+    """
+    if mask_tensor.dim() == 2:
+        mask_tensor = mask_tensor.unsqueeze(0)
+    elif mask_tensor.dim() == 4:
+        mask_tensor = mask_tensor[:, 0, :, :]
+    if mask_tensor.dim() != 3:
+        raise ValueError(f"Expected a 2D, 3D or 4D mask tensor, got shape {tuple(mask_tensor.shape)}")
+
+    return _to_uint8(mask_tensor, out)
+
+
+def image_tensor_to_pil(image_tensor: torch.Tensor, keep_alpha: bool = False,
+                        layout: str = "auto") -> List[Image.Image]:
+    """
+    Converts every image of an IMAGE batch to a PIL Image.
+
+    The batch is converted to uint8 once; each image is built from its
+    slice of that array.
+
+    Args:
+        image_tensor: Tensor with shape [B, H, W, C], [B, C, H, W] or [H, W, C]
+        keep_alpha: Return RGBA images for 4-channel input
+        layout: "NHWC", "NCHW" or "auto" to detect it
+
+    Returns:
+        list of PIL Images in RGB (or RGBA) mode, one per batch element
+    """
+    batch = image_tensor_to_uint8(image_tensor, channels=4 if keep_alpha else 3, layout=layout)
+    mode = 'RGBA' if batch.shape[3] == 4 else 'RGB'
+    return [Image.fromarray(image, mode) for image in batch]
+
+
+def mask_tensor_to_pil(mask_tensor: torch.Tensor) -> List[Image.Image]:
+    """
+    Converts every mask of a MASK batch to a PIL Image in L mode.
+
+    Args:
+        mask_tensor: Tensor with shape [B, H, W], [B, 1, H, W] or [H, W]
+
+    Returns:
+        list of PIL Images in L mode, one per batch element
+    """
+    return [Image.fromarray(mask, 'L') for mask in mask_tensor_to_uint8(mask_tensor)]
+
+
+def as_tensor(array: Union[np.ndarray, torch.Tensor]) -> torch.Tensor:
+    """
+    Returns a tensor sharing the memory of a numpy array (tensors are returned as they are).
+
+    Read-only arrays (e.g. views of PIL images) are wrapped too; they must
+    only be read from.
+    """
+    if isinstance(array, torch.Tensor):
+        return array
+    if array.flags.writeable:
+        return torch.from_numpy(array)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", UserWarning)
+        return torch.from_numpy(array)
+
+
+def uint8_to_float_tensor(array: Union[np.ndarray, torch.Tensor],
+                          out: Optional[torch.Tensor] = None) -> torch.Tensor:
+    """
+    Scales 8-bit data to float32 in the 0-1 range in one pass.
+
+    Args:
+        array: uint8 numpy array or tensor of any shape
+        out: Optional float32 tensor of the same shape to write into
+
+    Returns:
+        float32 tensor with the shape of array
+    """
+    # uint8 * python float promotes to float32 directly, no intermediate copy
+    if out is None:
+        return torch.mul(as_tensor(array), 1.0 / 255.0)
+    return torch.mul(as_tensor(array), 1.0 / 255.0, out=out)
+
+
+def pil_to_image_tensor(pil_images: Union[Image.Image, Sequence[Image.Image]],
+                        keep_alpha: bool = False) -> torch.Tensor:
+    """
+    Converts PIL images of the same size to an IMAGE batch.
+
+    Every image is scaled straight into its slot of the preallocated batch.
+
+    Args:
+        pil_images: PIL Image or list of PIL Images
+        keep_alpha: Keep the alpha channel of RGBA images (all images must then be RGBA)
+
+    Returns:
+        tensor with shape [B, H, W, 3] (or [B, H, W, 4]) in float32 format [0, 1]
+    """
+    if isinstance(pil_images, Image.Image):
+        pil_images = [pil_images]
+    if not pil_images:
+        raise ValueError("No images provided")
+    mode = 'RGBA' if keep_alpha and all(image.mode == 'RGBA' for image in pil_images) else 'RGB'
+    width, height = pil_images[0].size
+    if any(image.size != (width, height) for image in pil_images):
+        raise ValueError("Images of a batch must all have the same size")
+
+    batch = torch.empty((len(pil_images), height, width, len(mode)), dtype=torch.float32)
+    for index, image in enumerate(pil_images):
+        if image.mode != mode:
+            image = image.convert(mode)
+        uint8_to_float_tensor(np.asarray(image), out=batch[index])
+    return batch
+
+
+def pil_to_mask_tensor(pil_masks: Union[Image.Image, Sequence[Image.Image]]) -> torch.Tensor:
+    """
+    Converts PIL masks of the same size to a MASK batch.
+
+    Args:
+        pil_masks: PIL Image or list of PIL Images (converted to L mode)
+
+    Returns:
+        tensor with shape [B, H, W] in float32 format [0, 1]
+    """
+    if isinstance(pil_masks, Image.Image):
+        pil_masks = [pil_masks]
+    if not pil_masks:
+        raise ValueError("No masks provided")
+    width, height = pil_masks[0].size
+    if any(mask.size != (width, height) for mask in pil_masks):
+        raise ValueError("Masks of a batch must all have the same size")
+
+    batch = torch.empty((len(pil_masks), height, width), dtype=torch.float32)
+    for index, mask in enumerate(pil_masks):
+        uint8_to_float_tensor(np.asarray(mask if mask.mode == 'L' else mask.convert('L')), out=batch[index])
+    return batch